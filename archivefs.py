@@ -0,0 +1,290 @@
+import hashlib
+import io
+import os
+import shutil
+import struct
+import tarfile
+import threading
+import zipfile
+import zlib
+from collections import OrderedDict, namedtuple
+from pathlib import Path
+
+from catalog import parse_member_name
+
+
+# Путь к CSV внутри вложенного архива: начальный архив -> вложенный zip -> CSV.
+# Для уже разархивированных данных outer = None, а inner - путь к zip на диске.
+ArchiveMember = namedtuple('ArchiveMember', ['outer', 'inner', 'member'])
+ArchiveMember.__str__ = lambda self: '!'.join(part for part in self if part)
+
+# Ошибки чтения самих архивов (поврежденные или обрезанные данные), а не содержимого CSV
+ARCHIVE_READ_ERRORS = (zipfile.BadZipFile, tarfile.TarError, zlib.error, EOFError, OSError)
+# Буфер чтения вложенного zip, лежащего внутри начального архива без сжатия
+WINDOW_BUFFER_SIZE = 1024 * 1024
+COPY_BUFFER_SIZE = 16 * 1024 * 1024
+# Режимы tarfile по расширению: сжатые tar читаются только потоком вперед (без seek назад)
+TAR_STREAM_MODES = {'.gz': 'r|gz', '.bz2': 'r|bz2'}
+
+
+class _FileWindow(io.RawIOBase):
+    """Участок файла [offset, offset + size) как отдельный файл: вложенный zip без распаковки"""
+
+    def __init__(self, path, offset, size):
+        self._file = open(path, 'rb')
+        self._offset = offset
+        self._size = size
+        self._pos = 0
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def readinto(self, buffer):
+        n = min(len(buffer), self._size - self._pos)
+        if n <= 0:
+            return 0
+        self._file.seek(self._offset + self._pos)
+        read = self._file.readinto(memoryview(buffer)[:n])
+        self._pos += read
+        return read
+
+    def seek(self, pos, whence=io.SEEK_SET):
+        base = {io.SEEK_SET: 0, io.SEEK_CUR: self._pos, io.SEEK_END: self._size}[whence]
+        self._pos = max(0, base + pos)
+        return self._pos
+
+    def tell(self):
+        return self._pos
+
+    def close(self):
+        self._file.close()
+        super().close()
+
+
+def _zip_data_offset(path, info):
+    """Смещение данных файла в zip (после локального заголовка)"""
+    with open(path, 'rb') as f:
+        f.seek(info.header_offset)
+        header = f.read(30)
+    if header[:4] != b'PK\x03\x04':
+        raise zipfile.BadZipFile(f"Некорректный локальный заголовок {info.filename}")
+    name_length, extra_length = struct.unpack('<HH', header[26:30])
+    return info.header_offset + 30 + name_length + extra_length
+
+
+class ArchiveSource:
+    def __init__(self, input_dir, nested=True, cache_size=4, supported_formats=None, cache_dir=None):
+        """
+        Источник тиковых CSV прямо из архивов, без промежуточной распаковки CSV на диск.
+
+        Вложенный zip, лежащий в начальном архиве без сжатия (zip с ZIP_STORED, tar), читается
+        прямо из начального архива по смещению - без распаковки и без места на диске.
+        Сжатые вложенные архивы (zip со сжатием и все из .tar.gz/.tar.bz2) произвольно читать нельзя:
+        они распаковываются один раз при индексации в cache_dir, и для них нужно место на диске
+        размером с вложенные архивы. Без cache_dir такие начальные архивы не читаются (ошибка индексации).
+
+        :param input_dir: Директория с начальными архивами (ChinaData) или, при nested=False,
+                          с уже извлеченными вложенными zip-архивами (Unarchived)
+        :param nested: Если True, CSV ищутся во вложенных zip внутри начальных архивов
+        :param cache_size: Сколько вложенных архивов держать открытыми одновременно (в каждом потоке)
+        :param supported_formats: Форматы начальных архивов
+        :param cache_dir: Папка для распакованных сжатых вложенных архивов (переиспользуется между
+                          запусками); None - поддерживаются только несжатые вложенные архивы
+        """
+        self.input_dir = input_dir
+        self.nested = nested
+        self.cache_size = cache_size
+        self.supported_formats = supported_formats or ['.zip', '.tar', '.gz', '.bz2']
+        self.cache_dir = cache_dir
+
+        self._index = None
+        # (начальный архив, вложенный zip) -> (файл, смещение, размер); смещение None - файл целиком
+        self._locations = {}
+        self._index_lock = threading.Lock()
+        # Открытые архивы - свои у каждого потока: zipfile нельзя читать из нескольких потоков,
+        # и вытеснение из общего кэша закрывало бы архив, который читает соседний поток
+        self._local = threading.local()
+
+    def __getstate__(self):
+        # Открытые файлы не передаются в другие процессы, кэш собирается заново
+        state = self.__dict__.copy()
+        del state['_index_lock'], state['_local']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._index_lock = threading.Lock()
+        self._local = threading.local()
+
+    def close(self):
+        """Закрывает архивы текущего потока"""
+        for zip_ref in self._inner_cache.values():
+            zip_ref.close()
+        self._inner_cache.clear()
+
+    @property
+    def _inner_cache(self):
+        if not hasattr(self._local, 'inner'):
+            self._local.inner = OrderedDict()
+        return self._local.inner
+
+    def _outer_archives(self):
+        input_path = Path(self.input_dir)
+        archives = []
+        for fmt in self.supported_formats:
+            archives.extend(input_path.glob(f"*{fmt}"))
+        return sorted(set(archives))
+
+    def _cache_path(self, outer, inner):
+        if self.cache_dir is None:
+            raise ValueError(f"{os.path.basename(outer)}: вложенный архив {inner} сжат (или лежит в сжатом tar) "
+                             f"и читается только после распаковки на диск - укажите cache_dir")
+        os.makedirs(self.cache_dir, exist_ok=True)
+        stat = os.stat(outer)
+        # Изменившийся начальный архив дает другое имя - устаревшая копия не используется
+        key = f"{os.path.abspath(outer)}|{stat.st_size}|{stat.st_mtime}|{inner}"
+        return os.path.join(self.cache_dir, hashlib.sha1(key.encode('utf-8')).hexdigest() + '.zip')
+
+    def _extract_to_cache(self, outer, inner, stream):
+        """Распаковывает вложенный архив в кэш (один раз) и возвращает его расположение"""
+        path = self._cache_path(outer, inner)
+        if not os.path.exists(path):
+            temp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.part"
+            try:
+                with open(temp_path, 'wb') as dst:
+                    shutil.copyfileobj(stream, dst, COPY_BUFFER_SIZE)
+                os.replace(temp_path, path)
+            finally:
+                if os.path.exists(temp_path):
+                    os.remove(temp_path)
+        return path, None, None
+
+    def _scan_outer(self, archive_path):
+        """
+        Вложенные zip начального архива за один проход: пары (путь в архиве, расположение).
+        Несжатые вложенные архивы не читаются, сжатые распаковываются в кэш
+        """
+        outer = str(archive_path)
+        folder_prefix = f"{archive_path.stem}/"
+
+        def wanted(name):
+            normalized = name[2:] if name.startswith('./') else name
+            return normalized.startswith(folder_prefix) and normalized.endswith('.zip')
+
+        if outer.lower().endswith('.zip'):
+            with zipfile.ZipFile(outer, 'r') as handle:
+                for info in handle.infolist():
+                    if info.is_dir() or not wanted(info.filename):
+                        continue
+                    if info.compress_type == zipfile.ZIP_STORED and not info.flag_bits & 0x1:
+                        yield info.filename, (outer, _zip_data_offset(outer, info), info.file_size)
+                    else:
+                        with handle.open(info) as stream:
+                            yield info.filename, self._extract_to_cache(outer, info.filename, stream)
+            return
+
+        mode = TAR_STREAM_MODES.get(archive_path.suffix.lower())
+        if mode is None:
+            # Несжатый tar: вложенные архивы лежат в нем как есть
+            with tarfile.open(outer, 'r:') as handle:
+                for member in handle.getmembers():
+                    if member.isfile() and wanted(member.name):
+                        yield member.name, (outer, member.offset_data, member.size)
+            return
+
+        with tarfile.open(outer, mode) as handle:
+            for member in handle:
+                if member.isfile() and wanted(member.name):
+                    with handle.extractfile(member) as stream:
+                        yield member.name, self._extract_to_cache(outer, member.name, stream)
+
+    def _iter_inner_archives(self):
+        """Перечисляет все вложенные zip: (начальный архив или None, путь к zip, расположение)"""
+        if not self.nested:
+            for root, dirs, files in os.walk(self.input_dir):
+                for file in sorted(files):
+                    if file.endswith('.zip'):
+                        path = os.path.join(root, file)
+                        yield None, path, (path, None, None)
+            return
+
+        for archive_path in self._outer_archives():
+            try:
+                for inner, location in self._scan_outer(archive_path):
+                    yield str(archive_path), inner, location
+            except ARCHIVE_READ_ERRORS as e:
+                # Остальные ошибки (сжатый архив без cache_dir) прерывают индексацию: данные не пропадут молча
+                print(f"⚠️  Ошибка при чтении архива {archive_path.name}: {e}")
+
+    def _build_index(self):
+        """Строит индекс: тикер -> список (контракт, ArchiveMember) по центральным каталогам вложенных zip"""
+        print(f"🔍 Индексация архивов в {self.input_dir}...")
+        index = {}
+        inner_count = 0
+        for outer, inner, location in self._iter_inner_archives():
+            self._locations[outer, inner] = location
+            try:
+                with self._zip_at(location) as zip_ref:
+                    names = [info.filename for info in zip_ref.infolist() if not info.is_dir()]
+            except Exception as e:
+                print(f"⚠️  Ошибка при чтении архива {inner}: {e}")
+                continue
+            inner_count += 1
+            for name in names:
+                parsed = parse_member_name(name)
+                if parsed is None:
+                    continue
+                ticker, _, contract, _ = parsed
+                index.setdefault(ticker, []).append((contract, ArchiveMember(outer, inner, name)))
+
+        print(f"✅ Проиндексировано вложенных архивов: {inner_count}, тикеров: {len(index)}")
+        return index
+
+    @property
+    def index(self):
+        if self._index is None:
+            with self._index_lock:
+                if self._index is None:
+                    self._index = self._build_index()
+        return self._index
+
+    @staticmethod
+    def _zip_at(location):
+        path, offset, size = location
+        if offset is None:
+            return zipfile.ZipFile(path, 'r')
+        return zipfile.ZipFile(io.BufferedReader(_FileWindow(path, offset, size), WINDOW_BUFFER_SIZE), 'r')
+
+    def _open_inner(self, outer, inner):
+        """Открывает вложенный zip (LRU-кэш на cache_size архивов в каждом потоке)"""
+        key = (outer, inner)
+        cache = self._inner_cache
+        if key in cache:
+            cache.move_to_end(key)
+            return cache[key]
+
+        if key not in self._locations and self._index is None:
+            self.tickers()  # расположения вложенных архивов известны после индексации
+        zip_ref = self._zip_at(self._locations.get(key, (inner, None, None)))
+
+        cache[key] = zip_ref
+        while len(cache) > self.cache_size:
+            _, old = cache.popitem(last=False)
+            old.close()
+        return zip_ref
+
+    def tickers(self):
+        """Возвращает отсортированный список тикеров"""
+        return sorted(self.index)
+
+    def contract_files(self, ticker):
+        """Аналог FuturesConcatenator.find_contract_files: список (контракт, ArchiveMember)"""
+        return list(self.index.get(ticker, []))
+
+    def open(self, member):
+        """Открывает CSV внутри архива как бинарный поток"""
+        zip_ref = self._open_inner(member.outer, member.inner)
+        return zip_ref.open(member.member)
@@ -0,0 +1,258 @@
+from collections import namedtuple
+
+import numpy as np
+import pandas as pd
+
+from timeutils import NS_PER_DAY, NS_PER_SECOND
+
+
+# Бары одного таймфрейма: начало бара (нс от эпохи) и OHLCV массивами NumPy.
+# Бар без цен (только объем) хранится с NaN в OHLC, чтобы его объем учитывался при укрупнении
+Bars = namedtuple('Bars', ['start', 'open', 'high', 'low', 'close', 'volume'])
+# Смена торгового дня, как в SessionCalendar: тики после 18:00 относятся к следующему торговому дню
+TRADING_DAY_START_NS = 18 * 3600 * NS_PER_SECOND
+
+
+def _first_valid(values, starts, ends):
+    """Первое не-NaN значение в каждой группе [starts, ends) или NaN"""
+    valid_idx = np.flatnonzero(~np.isnan(values))
+    pos = np.searchsorted(valid_idx, starts)
+    found = pos < len(valid_idx)
+    found[found] = valid_idx[pos[found]] < ends[found]
+    result = np.full(len(starts), np.nan)
+    result[found] = values[valid_idx[pos[found]]]
+    return result
+
+
+def _last_valid(values, starts, ends):
+    """Последнее не-NaN значение в каждой группе [starts, ends) или NaN"""
+    valid_idx = np.flatnonzero(~np.isnan(values))
+    pos = np.searchsorted(valid_idx, ends) - 1
+    found = pos >= 0
+    found[found] = valid_idx[pos[found]] >= starts[found]
+    result = np.full(len(starts), np.nan)
+    result[found] = values[valid_idx[pos[found]]]
+    return result
+
+
+def bucket_starts(times, step):
+    """
+    Начало бара для каждого времени.
+
+    :param step: длина бара в наносекундах (бары от полуночи) или объект с методом bucket
+                 (бары по торговым сессиям, см. sessions.SessionStep)
+    """
+    if hasattr(step, 'bucket'):
+        return step.bucket(times)
+    return np.floor_divide(times, step) * step
+
+
+def _step_length(step):
+    return getattr(step, 'step', step)
+
+
+def _can_roll(step, base):
+    """Можно ли получить бары step укрупнением баров base"""
+    if hasattr(base, 'bucket'):
+        return False
+    if hasattr(step, 'bucket'):
+        return step.rolls_from(base)
+    return step % base == 0
+
+
+def _ordered_steps(steps):
+    """Таймфреймы от мелких к крупным (календарные раньше сессионных той же длины)"""
+    return sorted(set(steps), key=lambda s: (_step_length(s), hasattr(s, 'bucket')))
+
+
+def _roll_base(step, done):
+    """Наибольший из уже посчитанных таймфреймов, из которого укрупняется step, или None"""
+    return max((s for s in done if _can_roll(step, s)), key=_step_length, default=None)
+
+
+def aggregate(times, open_, high, low, close, volume, step):
+    """
+    Группирует отсортированные по времени записи в бары длиной step наносекунд.
+    Совпадает с resample(...).agg(first/max/min/last/sum): NaN-цены пропускаются,
+    бары выравниваются по полуночи (step делит сутки) или по сессиям (см. bucket_starts).
+
+    :param times: int64 наносекунд от эпохи, по возрастанию
+    :return: Bars
+    """
+    times = np.asarray(times, dtype=np.int64)
+    if not len(times):
+        empty = np.array([], dtype=np.float64)
+        return Bars(np.array([], dtype=np.int64), empty, empty, empty, empty, np.asarray(volume)[:0])
+
+    keys = bucket_starts(times, step)
+    starts = np.concatenate([[0], np.flatnonzero(np.diff(keys)) + 1])
+    ends = np.append(starts[1:], len(keys))
+
+    return Bars(
+        start=keys[starts],
+        open=_first_valid(open_, starts, ends),
+        high=np.fmax.reduceat(high, starts),
+        low=np.fmin.reduceat(low, starts),
+        close=_last_valid(close, starts, ends),
+        volume=np.add.reduceat(volume, starts),
+    )
+
+
+def ticks_to_bars(times, price, volume, step):
+    """Бары из тиков: цена float64 (NaN - нет цены), объем числовой"""
+    price = np.asarray(price, dtype=np.float64)
+    return aggregate(times, price, price, price, price, np.asarray(volume), step)
+
+
+def roll_up(bars, step):
+    """Укрупняет бары: step должен делиться на длину исходных баров"""
+    return aggregate(bars.start, bars.open, bars.high, bars.low, bars.close, bars.volume, step)
+
+
+def cascade(times, price, volume, steps):
+    """
+    Строит бары всех таймфреймов за один проход по тикам: самый мелкий таймфрейм считается
+    по тикам, каждый следующий - из наибольшего уже посчитанного, на который он делится.
+
+    :param steps: длины баров в наносекундах (или сессионные, см. bucket_starts)
+    :return: словарь длина -> Bars
+    """
+    result = {}
+    for step in _ordered_steps(steps):
+        base = _roll_base(step, result)
+        if base is None:
+            result[step] = ticks_to_bars(times, price, volume, step)
+        else:
+            result[step] = roll_up(result[base], step)
+    return result
+
+
+EMPTY_BARS = Bars(np.array([], dtype=np.int64), *[np.array([], dtype=np.float64)] * 4, np.array([], dtype=np.int64))
+
+
+def concat_bars(first, second):
+    """Склеивает два набора баров одного таймфрейма (второй идет позже по времени)"""
+    return Bars(*(np.concatenate([a, b]) for a, b in zip(first, second)))
+
+
+def _split_last(bars):
+    """(все бары кроме последнего, последний бар)"""
+    return Bars(*(a[:-1] for a in bars)), Bars(*(a[-1:] for a in bars))
+
+
+class BarStream:
+    def __init__(self, steps):
+        """
+        Потоковое построение баров нескольких таймфреймов по порциям тиков.
+        Незакрытый (последний) бар каждого таймфрейма переносится в следующую порцию,
+        поэтому результат совпадает с cascade по всем тикам сразу.
+
+        :param steps: длины баров в наносекундах (или сессионные, см. bucket_starts)
+        """
+        self.steps = _ordered_steps(steps)
+        self.bases = {}
+        for i, step in enumerate(self.steps):
+            self.bases[step] = _roll_base(step, self.steps[:i])
+        self._carry = {}
+        self.last_time = None
+
+    def _advance(self, step, bars, final):
+        """Добавляет бары к незакрытому бару таймфрейма и возвращает закрытые"""
+        carry = self._carry.get(step)
+        if carry is not None:
+            bars = concat_bars(carry, bars)
+        bars = roll_up(bars, step)
+        if final or not len(bars.start):
+            self._carry.pop(step, None)
+            return bars
+        done, self._carry[step] = _split_last(bars)
+        return done
+
+    def _run(self, ticks, final):
+        closed = {}
+        for step in self.steps:
+            base = self.bases[step]
+            if base is not None:
+                bars = closed[base]
+            elif ticks is not None:
+                bars = ticks_to_bars(*ticks, step)
+            else:
+                bars = EMPTY_BARS
+            closed[step] = self._advance(step, bars, final)
+        return closed
+
+    def push(self, times, price, volume):
+        """
+        Добавляет порцию тиков, отсортированную по времени и не раньше предыдущей
+
+        :return: словарь длина -> закрытые бары
+        """
+        times = np.asarray(times, dtype=np.int64)
+        if len(times):
+            if np.any(np.diff(times) < 0) or (self.last_time is not None and times[0] < self.last_time):
+                raise ValueError("Тики не отсортированы по времени")
+            self.last_time = times[-1]
+        return self._run((times, price, volume), final=False)
+
+    def finish(self):
+        """Закрывает все незакрытые бары: словарь длина -> бары"""
+        return self._run(None, final=True)
+
+
+def trading_days(times, day_start=TRADING_DAY_START_NS):
+    """
+    Торговый день каждого тика (дни от эпохи) без календаря праздников: тики после day_start
+    относятся к следующему дню, субботы и воскресенья - к понедельнику (ночь пятницы - торговый день понедельника)
+
+    :param times: массив int64 наносекунд
+    """
+    days = (np.asarray(times, dtype=np.int64) - day_start) // NS_PER_DAY + 1
+    weekday = (days + 3) % 7  # 1970-01-01 - четверг, понедельник = 0
+    return days + np.where(weekday >= 5, 7 - weekday, 0)
+
+
+def cumulative_to_deltas(total, trade=None, contract=None, state=None, times=None, trading_day=None):
+    """
+    Объем каждого тика из накопленного счетчика (TotalVolume): разность соседних значений.
+
+    Счетчик считается сброшенным, если он уменьшился, сменился контракт или начался новый торговый день
+    (по времени тиков): биржа обнуляет счетчик каждый торговый день, и после
+    пропуска данных новый день может начаться со значения больше прежнего.
+    Для первого тика после сброса берется объем сделки (TradeVolume), а без него - само значение счетчика.
+    Пропуски в счетчике заполняются предыдущим значением.
+
+    :param total: массив накопленного объема (float, NaN - пропуск)
+    :param trade: массив объема сделок или None
+    :param contract: массив контрактов по тикам или None
+    :param state: словарь с последним счетчиком, контрактом и торговым днем предыдущей порции (обновляется)
+    :param times: массив времени тиков (int64 нс) или None - без сброса по торговым дням
+    :param trading_day: функция время -> торговый день (например, SessionCalendar.trading_day с праздниками);
+                        None - trading_days (18:00, выходные без праздников)
+    :return: массив объемов по тикам
+    """
+    total = np.asarray(total, dtype=np.float64)
+    state = state if state is not None else {}
+    prev_total = state.get('total', np.nan)
+
+    filled = pd.Series(np.concatenate([[prev_total], total])).ffill().to_numpy()
+    diff = np.diff(filled)
+    reset = ~(diff >= 0)  # уменьшение счетчика или отсутствие предыдущего значения
+    if contract is not None:
+        contract = np.asarray(contract, dtype=object)
+        previous = np.concatenate([[state.get('contract')], contract[:-1]])
+        reset |= contract != previous
+    if times is not None:
+        days = (trading_day or trading_days)(times)
+        reset |= days != np.concatenate([[state.get('day', days[0] if len(days) else 0)], days[:-1]])
+
+    restart = filled[1:] if trade is None else np.asarray(trade, dtype=np.float64)
+    deltas = np.where(reset, restart, diff)
+    deltas = np.where(np.isnan(deltas), 0, deltas)
+
+    if len(total):
+        state['total'] = filled[-1]
+        if contract is not None:
+            state['contract'] = contract[-1]
+        if times is not None:
+            state['day'] = days[-1]
+    return deltas
@@ -0,0 +1,236 @@
+import argparse
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+try:
+    import resource
+except ImportError:  # Windows: пиковая память берется из psutil, если он установлен
+    resource = None
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+from synthetic_data import DATASET_INFO, generate_dataset
+
+
+# Этапы в порядке конвейера: (название, вход, выход) - папки внутри набора данных
+STAGES = [
+    ('unarchive', 'ChinaData', 'Unarchived'),
+    ('find_tickers', 'Unarchived', None),
+    ('organize', 'Unarchived', 'TickersData'),
+    ('glue', 'TickersData', 'GluedData'),
+    ('candles', 'GluedData', 'CandleData'),
+]
+RESULT_MARKER = 'BENCHMARK_RESULT '
+
+
+def _dir_size(path):
+    total = 0
+    for root, dirs, files in os.walk(path):
+        for file in files:
+            total += os.path.getsize(os.path.join(root, file))
+    return total
+
+
+def _peak_rss_mb():
+    """Пиковая память текущего процесса в МБ (None, если измерить нечем)"""
+    if psutil is not None:
+        info = psutil.Process().memory_info()
+        peak = getattr(info, 'peak_wset', None)
+        if peak is not None:
+            return peak / 2 ** 20
+    if resource is not None:
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # Linux - килобайты, macOS - байты
+        return peak / 2 ** 20 if sys.platform == 'darwin' else peak / 2 ** 10
+    return None
+
+
+def _glued_rows(glued_dir):
+    import pandas as pd
+    stats_path = os.path.join(glued_dir, 'summary_stats.csv')
+    if not os.path.exists(stats_path):
+        return None
+    return int(pd.read_csv(stats_path, sep=';', encoding='utf-8-sig')['Rows'].sum())
+
+
+def run_stage(stage, root):
+    """
+    Выполняет один этап на наборе данных (в отдельном процессе, см. main)
+
+    :return: словарь метрик этапа
+    """
+    from globalUnarchiver import NestedArchiveExtractor
+    from unarchiver import find_all_tickers, extract_and_organize_sequential
+    from gluer import FuturesConcatenator
+    from converter import FinamTxtCandleGenerator
+
+    with open(os.path.join(root, DATASET_INFO), 'r', encoding='utf-8') as f:
+        dataset = json.load(f)
+    path = {name: os.path.join(root, name) for name in ('ChinaData', 'Unarchived', 'TickersData', 'GluedData',
+                                                        'CandleData')}
+    rows = dataset['rows']
+
+    start = time.perf_counter()
+    cpu_start = time.process_time()
+    if stage == 'unarchive':
+        NestedArchiveExtractor().process_directory(path['ChinaData'], path['Unarchived'])
+    elif stage == 'find_tickers':
+        find_all_tickers(path['Unarchived'])
+    elif stage == 'organize':
+        tickers = find_all_tickers(path['Unarchived'])
+        extract_and_organize_sequential(path['Unarchived'], path['TickersData'], tickers)
+    elif stage == 'glue':
+        FuturesConcatenator(path['TickersData']).process_all(path['GluedData'])
+        rows = _glued_rows(path['GluedData'])
+    elif stage == 'candles':
+        FinamTxtCandleGenerator(path['GluedData'], path['CandleData']).process_all()
+        rows = _glued_rows(path['GluedData'])
+    else:
+        raise ValueError(f"Неизвестный этап: {stage}")
+    seconds = time.perf_counter() - start
+
+    input_dir, output_dir = next((i, o) for name, i, o in STAGES if name == stage)
+    bytes_in = _dir_size(path[input_dir])
+    return {
+        'stage': stage,
+        'seconds': round(seconds, 4),
+        'cpu_seconds': round(time.process_time() - cpu_start, 4),
+        'rows': rows,
+        'rows_per_s': round(rows / seconds, 1) if rows and seconds else None,
+        'mb_in': round(bytes_in / 1e6, 3),
+        'mb_per_s': round(bytes_in / 1e6 / seconds, 3) if seconds else None,
+        'mb_out': round(_dir_size(path[output_dir]) / 1e6, 3) if output_dir else None,
+        'peak_rss_mb': _peak_rss_mb(),
+    }
+
+
+def _run_stage_subprocess(stage, root, verbose):
+    """Этап в отдельном процессе: пиковая память не смешивается с другими этапами"""
+    command = [sys.executable, os.path.abspath(__file__), '--stage', stage, '--root', root]
+    completed = subprocess.run(command, capture_output=True, text=True, encoding='utf-8', errors='replace',
+                               cwd=os.path.dirname(os.path.abspath(__file__)))
+    if verbose:
+        print(completed.stdout)
+    if completed.returncode != 0:
+        raise RuntimeError(f"Этап {stage} завершился с ошибкой:\n{completed.stderr}")
+    for line in reversed(completed.stdout.splitlines()):
+        if line.startswith(RESULT_MARKER):
+            return json.loads(line[len(RESULT_MARKER):])
+    raise RuntimeError(f"Этап {stage} не вернул результат")
+
+
+def _git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        return None
+
+
+def run_benchmark(root, stages=None, verbose=False):
+    """
+    Прогоняет этапы по порядку на наборе данных в root (выходы этапов пересоздаются).
+    Недостающие входы пропущенных этапов готовятся без измерения.
+
+    :return: словарь результата (для сохранения как baseline)
+    """
+    stages = stages or [name for name, _, _ in STAGES]
+    for name, _, output_dir in STAGES:
+        if name in stages and output_dir:
+            shutil.rmtree(os.path.join(root, output_dir), ignore_errors=True)
+
+    with open(os.path.join(root, DATASET_INFO), 'r', encoding='utf-8') as f:
+        dataset = json.load(f)
+
+    results = []
+    last = max(i for i, (name, _, _) in enumerate(STAGES) if name in stages)
+    for name, _, output_dir in STAGES[:last + 1]:
+        if name not in stages:
+            # Этап нужен только для подготовки входа следующих этапов и не измеряется
+            if output_dir and not os.path.exists(os.path.join(root, output_dir)):
+                print(f"🔧 Подготовка: {name}")
+                _run_stage_subprocess(name, root, verbose)
+            continue
+        result = _run_stage_subprocess(name, root, verbose)
+        results.append(result)
+        print(f"⏱️  {name:<13} {result['seconds']:>9.3f} с | {result['rows_per_s'] or 0:>12,.0f} строк/с | "
+              f"{result['mb_per_s'] or 0:>8.2f} МБ/с | пик {result['peak_rss_mb'] or 0:>8.1f} МБ")
+
+    return {
+        'created': time.strftime('%Y-%m-%d %H:%M:%S'),
+        'commit': _git_commit(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'dataset': dataset,
+        'stages': results,
+    }
+
+
+def compare(result, baseline):
+    """Печатает изменение времени и памяти этапов относительно baseline"""
+    base_stages = {s['stage']: s for s in baseline['stages']}
+    if baseline.get('dataset', {}).get('rows') != result['dataset']['rows']:
+        print("⚠️  Наборы данных отличаются, сравнение приблизительное")
+    print(f"\nСравнение с {baseline.get('commit')} ({baseline.get('created')}):")
+    for stage in result['stages']:
+        base = base_stages.get(stage['stage'])
+        if base is None:
+            continue
+        speedup = base['seconds'] / stage['seconds'] if stage['seconds'] else float('inf')
+        memory = ''
+        if base.get('peak_rss_mb') and stage.get('peak_rss_mb'):
+            memory = f" | память {stage['peak_rss_mb'] / base['peak_rss_mb']:.2f}x"
+        print(f"  {stage['stage']:<13} {base['seconds']:.3f} с -> {stage['seconds']:.3f} с "
+              f"(ускорение {speedup:.2f}x){memory}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Бенчмарк этапов конвейера на синтетических данных")
+    parser.add_argument('--root', help="папка набора данных (по умолчанию - временная, набор генерируется)")
+    parser.add_argument('--tickers', type=int, default=3)
+    parser.add_argument('--days', type=int, default=5)
+    parser.add_argument('--ticks-per-day', type=int, default=2000)
+    parser.add_argument('--stages', nargs='+', choices=[name for name, _, _ in STAGES])
+    parser.add_argument('--save', help="сохранить результат в JSON (baseline)")
+    parser.add_argument('--compare', help="сравнить с сохраненным JSON")
+    parser.add_argument('--verbose', action='store_true', help="показывать вывод этапов")
+    parser.add_argument('--stage', help=argparse.SUPPRESS)  # внутренний запуск одного этапа
+    args = parser.parse_args()
+
+    if args.stage:
+        result = run_stage(args.stage, args.root)
+        print(RESULT_MARKER + json.dumps(result))
+        return
+
+    temp_root = None
+    root = args.root
+    if root is None:
+        temp_root = root = tempfile.mkdtemp(prefix='bench_')
+    try:
+        if not os.path.exists(os.path.join(root, DATASET_INFO)):
+            print(f"🧪 Генерация данных: тикеров {args.tickers}, дней {args.days}, тиков в день {args.ticks_per_day}")
+            generate_dataset(root, args.tickers, args.days, args.ticks_per_day)
+        result = run_benchmark(root, args.stages, args.verbose)
+    finally:
+        if temp_root is not None:
+            shutil.rmtree(temp_root, ignore_errors=True)
+
+    if args.compare:
+        with open(args.compare, 'r', encoding='utf-8') as f:
+            compare(result, json.load(f))
+    if args.save:
+        with open(args.save, 'w', encoding='utf-8') as f:
+            json.dump(result, f, ensure_ascii=False, indent=1)
+        print(f"💾 Результат сохранен в {args.save}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,168 @@
+import os
+import re
+import posixpath
+import sqlite3
+import time
+import zipfile
+
+from unarchiver import TICKER_PATTERN
+
+
+DATE_PATTERN = re.compile(r'(\d{8})')
+
+
+def parse_member_name(member_name):
+    """
+    Разбирает путь CSV-файла внутри архива
+
+    :return: (тикер, сессия, контракт, дата YYYYMMDD или None) или None, если это не CSV с тикером
+    """
+    if not member_name.endswith('.csv'):
+        return None
+    member_dir, filename = posixpath.split(member_name.replace('\\', '/'))
+    match = TICKER_PATTERN.match(filename)
+    if not match or not match.group(1).strip():
+        return None
+    ticker = match.group(1).strip()
+    session = 'NIGHT' if 'NIGHT' in member_dir.upper() else 'DAY'
+    contract, _, rest = filename[:-4].partition('_')
+    date_match = DATE_PATTERN.search(rest)
+    return ticker, session, contract.lower(), date_match.group(1) if date_match else None
+
+
+class ArchiveCatalog:
+    def __init__(self, db_path):
+        """
+        Постоянный каталог содержимого zip-архивов (SQLite)
+
+        Архив перечитывается, только если изменились его размер или время модификации.
+
+        :param db_path: Путь к файлу базы каталога
+        """
+        self.db_path = db_path
+        db_dir = os.path.dirname(os.path.abspath(db_path))
+        os.makedirs(db_dir, exist_ok=True)
+
+        self.conn = sqlite3.connect(db_path)
+        self.conn.executescript("""
+            CREATE TABLE IF NOT EXISTS archives (
+                path TEXT PRIMARY KEY,
+                size INTEGER NOT NULL,
+                mtime REAL NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS members (
+                archive_path TEXT NOT NULL,
+                member TEXT NOT NULL,
+                ticker TEXT NOT NULL,
+                session TEXT NOT NULL,
+                contract TEXT NOT NULL,
+                date TEXT,
+                compressed_size INTEGER NOT NULL,
+                file_size INTEGER NOT NULL,
+                PRIMARY KEY (archive_path, member)
+            );
+            CREATE INDEX IF NOT EXISTS idx_members_ticker ON members (ticker);
+        """)
+        self.conn.commit()
+
+    def close(self):
+        self.conn.close()
+
+    def _scan_archive(self, archive_path):
+        """Читает центральный каталог архива и возвращает строки для таблицы members"""
+        rows = []
+        with zipfile.ZipFile(archive_path, 'r') as zip_ref:
+            for info in zip_ref.infolist():
+                if info.is_dir():
+                    continue
+                parsed = parse_member_name(info.filename)
+                if parsed is None:
+                    continue
+                ticker, session, contract, date = parsed
+                rows.append((archive_path, info.filename, ticker, session, contract, date,
+                             info.compress_size, info.file_size))
+        return rows
+
+    def update(self, root_directory):
+        """
+        Инкрементально обновляет каталог по всем zip-архивам в директории
+
+        :return: количество перечитанных архивов
+        """
+        start_time = time.time()
+        known = {path: (size, mtime) for path, size, mtime in
+                 self.conn.execute("SELECT path, size, mtime FROM archives")}
+
+        root_abs = os.path.abspath(root_directory)
+        seen = set()
+        scanned = 0
+        for root, dirs, files in os.walk(root_abs):
+            for file in files:
+                if not file.endswith('.zip'):
+                    continue
+                archive_path = os.path.join(root, file)
+                seen.add(archive_path)
+                stat = os.stat(archive_path)
+                if known.get(archive_path) == (stat.st_size, stat.st_mtime):
+                    continue
+
+                try:
+                    rows = self._scan_archive(archive_path)
+                except Exception as e:
+                    print(f"⚠️  Ошибка при чтении архива {file}: {e}")
+                    # Старое содержимое измененного архива больше не верно: архив убирается из каталога
+                    with self.conn:
+                        self.conn.execute("DELETE FROM members WHERE archive_path = ?", (archive_path,))
+                        self.conn.execute("DELETE FROM archives WHERE path = ?", (archive_path,))
+                    continue
+
+                with self.conn:
+                    self.conn.execute("DELETE FROM members WHERE archive_path = ?", (archive_path,))
+                    self.conn.executemany("INSERT INTO members VALUES (?, ?, ?, ?, ?, ?, ?, ?)", rows)
+                    self.conn.execute("INSERT OR REPLACE INTO archives VALUES (?, ?, ?)",
+                                      (archive_path, stat.st_size, stat.st_mtime))
+                scanned += 1
+
+        # Удаляем из каталога архивы, которых больше нет на диске
+        removed = [path for path in known
+                   if path not in seen and os.path.commonpath([root_abs, path]) == root_abs]
+        with self.conn:
+            for path in removed:
+                self.conn.execute("DELETE FROM members WHERE archive_path = ?", (path,))
+                self.conn.execute("DELETE FROM archives WHERE path = ?", (path,))
+
+        print(f"🗂️  Каталог: перечитано архивов {scanned} из {len(seen)}, удалено {len(removed)} "
+              f"({time.time() - start_time:.2f} сек)")
+        return scanned
+
+    def tickers(self):
+        """Возвращает отсортированный список всех тикеров каталога"""
+        return [row[0] for row in self.conn.execute("SELECT DISTINCT ticker FROM members ORDER BY ticker")]
+
+    def archives(self):
+        """Возвращает множество архивов, успешно прочитанных в каталог"""
+        return {row[0] for row in self.conn.execute("SELECT path FROM archives")}
+
+    def archives_for_tickers(self, tickers_list):
+        """Возвращает множество архивов, в которых есть файлы указанных тикеров"""
+        tickers_list = list(tickers_list)
+        if not tickers_list:
+            return set()
+        placeholders = ', '.join('?' * len(tickers_list))
+        query = f"SELECT DISTINCT archive_path FROM members WHERE ticker IN ({placeholders})"
+        return {row[0] for row in self.conn.execute(query, tickers_list)}
+
+    def archive_tickers(self, archive_path):
+        """Возвращает множество тикеров, файлы которых есть в архиве"""
+        query = "SELECT DISTINCT ticker FROM members WHERE archive_path = ?"
+        return {row[0] for row in self.conn.execute(query, (os.path.abspath(archive_path),))}
+
+    def members(self, ticker):
+        """
+        Возвращает CSV-файлы тикера
+
+        :return: список (архив, путь в архиве, сессия, контракт, дата, размер сжатый, размер)
+        """
+        query = ("SELECT archive_path, member, session, contract, date, compressed_size, file_size "
+                 "FROM members WHERE ticker = ? ORDER BY contract, date, member")
+        return self.conn.execute(query, (ticker,)).fetchall()
@@ -1,13 +1,51 @@
 import os
+import numpy as np
 import pandas as pd
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import metrics
+from bars import BarStream, cascade, cumulative_to_deltas
+from gluedstore import csv_range_source, find_glued, glued_columns, path_format, read_glued, read_glued_range, to_ns
+from sessions import SessionStep, calendar_for
+from timeutils import parse_date_time_ns, ns_to_date_time_digits
+
+
+# Буфер файла и размер порции строк при записи TXT
+WRITE_BUFFER_SIZE = 4 * 1024 * 1024
+WRITE_CHUNK_ROWS = 100_000
+# Таймфреймы, которые при trading_sessions строятся по торговым сессиям, а не от полуночи
+SESSION_TIMEFRAMES = ('Hour4', 'Day')
 
 
 class FinamTxtCandleGenerator:
     def __init__(self, input_dir, output_dir,
-                 timeframes=('Min1', 'Min5', 'Min15', 'Hour1', 'Hour4', 'Day')):
+                 timeframes=('Min1', 'Min5', 'Min15', 'Hour1', 'Hour4', 'Day'), price_precision=2, chunk_rows=None,
+                 volume_mode='delta', trading_sessions=False, holidays=(), start=None, end=None):
+        """
+        price_precision – знаков после запятой в ценах свечей (для тиков меньше 0.01 нужно больше 2)
+        chunk_rows – если задано, склеенный файл читается порциями по chunk_rows строк и свечи
+                     пишутся по мере готовности (память ограничена размером порции)
+        volume_mode – объем свечей: 'delta' - из приращений накопленного TotalVolume (сброс на новой
+                      сессии и смене контракта), 'trade' - сумма TradeVolume, 'total' - сумма TotalVolume как есть
+        trading_sessions – Day и Hour4 строятся по календарю сессий продукта (sessions.calendar_for):
+                           дневные свечи - по торговым дням (ночная сессия входит в следующий день),
+                           Hour4 - от открытия каждой сессии. False - календарные бары от полуночи
+        holidays – праздничные дни YYYYMMDD для календаря сессий
+        start, end – окно [start, end) для пересборки свечей за период (например, '2024-03-01'): по индексу
+                     склеенных данных читается только нужный участок файла. None - без ограничения
+        """
+        if volume_mode not in ('delta', 'trade', 'total'):
+            raise ValueError(f"Неизвестный volume_mode: {volume_mode}")
         self.input_dir = input_dir
         self.output_dir = output_dir
         self.timeframes = list(timeframes)
+        self.price_precision = price_precision
+        self.chunk_rows = chunk_rows
+        self.volume_mode = volume_mode
+        self.trading_sessions = trading_sessions
+        self.holidays = list(holidays)
+        self.start = start
+        self.end = end
         self.timeframe_mapping = {
             'Min1': '1min',
             'Min5': '5min',
@@ -18,51 +56,201 @@ class FinamTxtCandleGenerator:
         }
 
     def _find_csv_in_folder(self, folder):
-        for fname in os.listdir(folder):
-            if fname.lower().endswith('.csv'):
-                return os.path.join(folder, fname)
-        return None
+        """Склеенные данные тикера: бинарный формат (parquet/feather/memmap), если есть, иначе CSV"""
+        return find_glued(folder)
+
+    def _window(self):
+        """Окно генерации в наносекундах (start_ns, end_ns)"""
+        return to_ns(self.start), to_ns(self.end)
+
+    def _in_window(self, df, start_ns, end_ns):
+        """Строки df с DateTime в [start_ns, end_ns)"""
+        if start_ns is None and end_ns is None:
+            return df
+        times = df['DateTime'].to_numpy(dtype='datetime64[ns]').view('int64')
+        mask = np.ones(len(df), dtype=bool)
+        if start_ns is not None:
+            mask &= times >= start_ns
+        if end_ns is not None:
+            mask &= times < end_ns
+        return df[mask]
+
+    def _load_columnar(self, file_path, start_ns=None, end_ns=None):
+        """Читает из бинарных склеенных данных только DateTime и колонки цены/объема"""
+        columns = glued_columns(file_path)
+        price_col, vol_col = self._detect_price_volume_cols(columns)
+        wanted = [c for c in ('DateTime', price_col, vol_col) if c is not None]
+        wanted += [c for c in self._volume_source_cols(columns, vol_col) if c and c not in wanted]
+        if start_ns is not None or end_ns is not None:
+            if 'DateTime' not in columns:
+                print(f"В файле {file_path} нет колонки DateTime")
+                return None
+            return read_glued_range(file_path, start_ns, end_ns, columns=wanted)
+        df = read_glued(file_path, columns=wanted)
+        if 'DateTime' not in df.columns:
+            print(f"В файле {file_path} нет колонки DateTime")
+            return None
+        return df
+
+    def load_continuous_data(self, file_path, start_ns=None, end_ns=None):
+        """
+        Склеенные данные для генерации свечей: DateTime и колонки цены/объема
 
-    def load_continuous_data(self, file_path):
+        :param start_ns: начало окна (нс от эпохи, включительно); с окном по индексу читается только его участок
+        :param end_ns: конец окна (не включительно)
+        """
         if not os.path.exists(file_path):
             print(f"Файл {file_path} не найден!")
             return None
 
+        if path_format(file_path) not in (None, 'csv'):
+            try:
+                df = self._load_columnar(file_path, start_ns, end_ns)
+            except Exception as e:
+                print(f"Ошибка чтения {file_path}: {e}")
+                return None
+            if df is not None and not len(df) and (start_ns is not None or end_ns is not None):
+                print(f"В файле {file_path} нет данных в заданном окне")
+                return None
+            return df
+
         try:
-            df = pd.read_csv(file_path, sep=';', header=0, low_memory=False)
+            header = self._read_header(file_path)
+            usecols, dtypes = self._projected_columns(header)
+            if usecols is None:
+                print(f"В файле {file_path} нет колонок Date/Time")
+                return None
+            try:
+                df = pd.read_csv(csv_range_source(file_path, start_ns, end_ns), sep=';', header=0, usecols=usecols,
+                                 dtype=dtypes)
+            except ValueError:
+                # Нечисловые значения в ценах/объемах - читаем без типов, они приводятся при генерации
+                df = pd.read_csv(csv_range_source(file_path, start_ns, end_ns), sep=';', header=0, usecols=usecols,
+                                 low_memory=False)
         except Exception as e:
             print(f"Ошибка чтения {file_path}: {e}")
             return None
 
-        # Найти колонки даты и времени
-        cols_lower = [c.lower() for c in df.columns]
-        date_col = next((df.columns[i] for i, c in enumerate(cols_lower) if 'date' in c), None)
-        time_col = next((df.columns[i] for i, c in enumerate(cols_lower) if 'time' in c), None)
+        if 'DateTimeNs' in df.columns:
+            # Склеенные данные уже содержат время в наносекундах от эпохи
+            ns = pd.to_numeric(df['DateTimeNs'], errors='coerce')
+            df['DateTime'] = pd.to_datetime(ns, unit='ns')
+        else:
+            date_time = self._parse_date_time(df)
+            if date_time is None:
+                print(f"В файле {file_path} нет колонок Date/Time")
+                return None
+            df['DateTime'] = date_time
+
+        if start_ns is not None or end_ns is not None:
+            df = self._in_window(df, start_ns, end_ns)
+            if not len(df):
+                print(f"В файле {file_path} нет данных в заданном окне")
+                return None
 
-        if date_col is None or time_col is None:
-            print(f"В файле {file_path} нет колонок Date/Time")
+        if df['DateTime'].isna().all():
+            print(f"Не удалось распознать даты в файле {file_path}")
             return None
 
-        date_s = df[date_col].astype(str).str.strip()
-        time_s = df[time_col].astype(str).str.strip()
-
-        # Оставляем только цифры и убираем лишние .0
-        time_s = time_s.str.replace(r'\D', '', regex=True)
-        time_s = time_s.str.replace(r'\.0+$', '', regex=True)
-        # Берём последние 6 цифр (HHMMSS) и заполняем нулями спереди, если короткое
-        time_s = time_s.apply(lambda x: x[-6:].zfill(6) if len(x) >= 6 else x.zfill(6))
+        return df
 
-        combined = date_s + ' ' + time_s
-        df['DateTime'] = pd.to_datetime(combined, errors='coerce')
+    def read_range(self, ticker_folder_name, start=None, end=None, columns=None):
+        """
+        Склеенные данные тикера со временем в [start, end) - например, один торговый день для отладки.
+        По индексу склеенных данных (FuturesConcatenator index_period) читается только нужный участок
+        файла; без индекса файл читается целиком и фильтруется.
+
+        :param start: начало (строка '2024-03-01 09:00', datetime или нс от эпохи), None - с начала
+        :param end: конец (не включительно), None - до конца
+        :param columns: колонки (None - все)
+        :return: DataFrame или None, если склеенных данных нет
+        """
+        path = self._find_csv_in_folder(os.path.join(self.input_dir, ticker_folder_name))
+        if path is None:
+            print(f"В папке {ticker_folder_name} нет склеенных данных.")
+            return None
+        return read_glued_range(path, start, end, columns)
+
+    def _read_header(self, file_path):
+        """Имена колонок склеенного CSV (первая строка)"""
+        with open(file_path, 'r', encoding='utf-8-sig') as f:
+            return [c.strip() for c in f.readline().rstrip('\r\n').split(';')]
+
+    def _detect_date_time_cols(self, columns):
+        """Колонки даты и времени: первые, в имени которых есть 'date' и 'time'"""
+        columns = list(columns)
+        cols_lower = [c.lower() for c in columns]
+        date_col = next((columns[i] for i, c in enumerate(cols_lower) if 'date' in c), None)
+        time_col = next((columns[i] for i, c in enumerate(cols_lower) if 'time' in c), None)
+        return date_col, time_col
+
+    def _projected_columns(self, header):
+        """
+        Какие колонки читать для генерации свечей и с какими типами
+
+        :return: (список колонок, словарь типов) или (None, None), если нет колонок времени
+        """
+        price_col, vol_col = self._detect_price_volume_cols(header)
+        dtypes = {}
+        if 'DateTimeNs' in header:
+            usecols = ['DateTimeNs']
+            dtypes['DateTimeNs'] = 'int64'
+        else:
+            date_col, time_col = self._detect_date_time_cols(header)
+            if date_col is None or time_col is None:
+                return None, None
+            usecols = [date_col, time_col]
+        if price_col is not None:
+            usecols.append(price_col)
+            dtypes[price_col] = 'float64'
+        if vol_col is not None and vol_col not in usecols:
+            usecols.append(vol_col)
+            dtypes[vol_col] = 'float64'
+        _, trade_col, contract_col = self._volume_source_cols(header, vol_col)
+        if trade_col is not None and trade_col not in usecols:
+            usecols.append(trade_col)
+            dtypes[trade_col] = 'float64'
+        if contract_col is not None:
+            usecols.append(contract_col)
+            dtypes[contract_col] = 'category'
+        return usecols, dtypes
+
+    def _guess_time_has_ms(self, df):
+        """True, если большинство значений времени длиннее 6 цифр (HHMMSSmmm)"""
+        _, time_col = self._detect_date_time_cols(df.columns)
+        time_num = pd.to_numeric(df[time_col], errors='coerce').dropna()
+        return bool((time_num >= 1_000_000).mean() > 0.5) if len(time_num) else False
+
+    def _parse_date_time(self, df, time_has_ms=None):
+        """
+        DateTime из колонок Date (YYYYMMDD) и Time (HHMMSS или HHMMSSmmm) целочисленной арифметикой.
+        Даты в другом виде разбираются через pd.to_datetime. None, если колонок нет.
+
+        :param time_has_ms: формат времени; None - определить по данным
+        """
+        date_col, time_col = self._detect_date_time_cols(df.columns)
 
-        if df['DateTime'].isna().all():
-            print(f"Не удалось распознать даты в файле {file_path}")
+        if date_col is None or time_col is None:
             return None
 
-        return df
+        date_num = pd.to_numeric(df[date_col], errors='coerce')
+        time_num = pd.to_numeric(df[time_col], errors='coerce')
+        if date_num.notna().any() and (date_num.dropna() >= 10_000_000).all():
+            date_digits = date_num.fillna(-1).to_numpy(dtype='int64')
+            time_digits = time_num.fillna(-1).to_numpy(dtype='int64')
+            if time_has_ms is None:
+                time_has_ms = self._guess_time_has_ms(df)
+            ns, valid = parse_date_time_ns(date_digits, time_digits, time_has_ms)
+            return pd.Series(np.where(valid, ns, np.iinfo(np.int64).min).view('datetime64[ns]'), index=df.index)
+
+        time_s = time_num.fillna(0).astype('int64').astype(str).str.zfill(6)
+        combined = df[date_col].astype(str).str.strip() + ' ' + time_s.str[:6]
+        return pd.to_datetime(combined, format='mixed', errors='coerce')
 
     def _detect_price_volume_cols(self, df):
-        cols_map = {c.lower(): c for c in df.columns}
+        """Колонки цены и объема по DataFrame или списку имен колонок"""
+        columns = df.columns if isinstance(df, pd.DataFrame) else df
+        cols_map = {c.lower(): c for c in columns}
         price_candidates = ['lastprice', 'last_price', 'last', 'price', 'tradeprice', 'trade_price', 'close']
         volume_candidates = ['totalvolume', 'total_volume', 'volume', 'qty', 'quantity', 'vol']
 
@@ -72,89 +260,368 @@ class FinamTxtCandleGenerator:
         return price_col, vol_col
 
     def generate_candles(self, df, timeframe):
+        """Свечи одного таймфрейма (см. generate_all_candles)"""
         if timeframe not in self.timeframe_mapping:
             print(f"Неизвестный таймфрейм: {timeframe}")
             return None
-
-        df = df.dropna(subset=['DateTime']).copy()
+        return self.generate_all_candles(df, [timeframe]).get(timeframe)
+
+    def _timeframe_steps(self, timeframes, ticker=None):
+        """
+        Длины баров таймфреймов в наносекундах; при trading_sessions таймфреймы SESSION_TIMEFRAMES
+        заменяются сессионными (sessions.SessionStep) по календарю продукта тикера
+        """
+        steps = {tf: pd.Timedelta(self.timeframe_mapping[tf]).value for tf in timeframes}
+        if self.trading_sessions and ticker is not None:
+            calendar = calendar_for(ticker, self.holidays)
+            for tf in SESSION_TIMEFRAMES:
+                if tf in steps:
+                    steps[tf] = SessionStep(calendar, steps[tf])
+        return steps
+
+    def _volume_source_cols(self, columns, vol_col):
+        """
+        Колонки для объема тиков в зависимости от volume_mode
+
+        :return: (накопленный счетчик, объем сделки, контракт) - None для отсутствующих/ненужных
+        """
+        if self.volume_mode == 'total':
+            return None, None, None
+        cols_map = {c.lower(): c for c in columns}
+        trade_col = next((cols_map[c] for c in ('tradevolume', 'trade_volume') if c in cols_map), None)
+        if self.volume_mode == 'trade':
+            return None, trade_col, None
+        total_col = vol_col if vol_col is not None and vol_col.lower() in ('totalvolume', 'total_volume') else None
+        if total_col is None:
+            return None, trade_col, None
+        return total_col, trade_col, cols_map.get('contract')
+
+    def _volume_trading_day(self, ticker):
+        """
+        Торговый день для сброса накопленного объема: при trading_sessions или праздниках - по календарю
+        продукта (как сессионные Day-бары), иначе None - общее правило bars.trading_days
+        """
+        if ticker is None or not (self.trading_sessions or self.holidays):
+            return None
+        return calendar_for(ticker, self.holidays).trading_day
+
+    def _tick_volume(self, df, vol_col, state=None, times=None, ticker=None):
+        """
+        Объем каждого тика:
+        'delta' - разности накопленного TotalVolume со сбросом на новом торговом дне и смене контракта,
+        'trade' - TradeVolume, 'total' - колонка объема как есть (прежнее поведение).
+        Если нужных колонок нет, используется колонка объема как есть.
+        """
+        def numeric(col):
+            return pd.to_numeric(df[col], errors='coerce').to_numpy(dtype='float64', na_value=np.nan)
+
+        total_col, trade_col, contract_col = self._volume_source_cols(df.columns, vol_col)
+        if total_col is not None:
+            return cumulative_to_deltas(
+                numeric(total_col),
+                trade=numeric(trade_col) if trade_col is not None else None,
+                contract=df[contract_col].to_numpy() if contract_col is not None else None,
+                state=state, times=times, trading_day=self._volume_trading_day(ticker))
+        if trade_col is not None:
+            return np.nan_to_num(numeric(trade_col))
+        if vol_col is None:
+            return np.zeros(len(df), dtype=np.int64)
+        return pd.to_numeric(df[vol_col], errors='coerce').fillna(0).to_numpy()
+
+    def _ticks_from_frame(self, df, price_col, vol_col, volume_state=None, ticker=None):
+        """
+        Массивы тиков (время int64 нс, цена float64, объем) из таблицы с DateTime
+
+        :param volume_state: состояние счетчика объема между порциями (потоковый режим)
+        :param ticker: тикер для календаря торговых дней (сброс накопленного объема)
+        """
+        times = df['DateTime'].to_numpy(dtype='datetime64[ns]').view('int64')
+        price = pd.to_numeric(df[price_col], errors='coerce').to_numpy(dtype='float64', na_value=np.nan)
+        volume = self._tick_volume(df, vol_col, volume_state, times, ticker)
+        return times, price, volume
+
+    def _prepare_ticks(self, df, ticker=None):
+        """
+        Очистка и сортировка тиков один раз для всех таймфреймов
+
+        :return: (время int64 нс, цена float64, объем) или None
+        """
+        df = df.dropna(subset=['DateTime'])
         if df.empty:
             print("Нет валидных дат для ресемплинга.")
             return None
 
-        # сортировка по дате
-        df = df.sort_values('DateTime')
+        # сортировка по дате (устойчивая: тики с одинаковым временем остаются в порядке файла)
+        df = df.sort_values('DateTime', kind='stable')
 
         price_col, vol_col = self._detect_price_volume_cols(df)
         if price_col is None:
             print("Не найдена колонка цены.")
             return None
-        if vol_col is None:
-            df['TotalVolume_detected'] = 0
-            vol_col = 'TotalVolume_detected'
-
-        # Приведение к числовому типу
-        df.loc[:, price_col] = pd.to_numeric(df[price_col], errors='coerce')
-        df.loc[:, vol_col] = pd.to_numeric(df[vol_col], errors='coerce').fillna(0)
-
-        # Ресемплинг
-        df = df.set_index('DateTime')
-        agg = df.resample(self.timeframe_mapping[timeframe]).agg({
-            price_col: ['first', 'max', 'min', 'last'],
-            vol_col: 'sum'
-        })
 
-        agg.columns = ['Open', 'High', 'Low', 'Close', 'Volume']
-        candles = agg.reset_index()
+        return self._ticks_from_frame(df, price_col, vol_col, ticker=ticker)
+
+    def _bars_to_candles(self, bars):
+        """Готовые бары -> таблица свечей в формате Finam (бары без цен отбрасываются)"""
+        candles = pd.DataFrame({
+            'DateTime': bars.start.view('datetime64[ns]'),
+            'Open': bars.open,
+            'High': bars.high,
+            'Low': bars.low,
+            'Close': bars.close,
+            'Volume': bars.volume,
+        })
         candles = candles.dropna(subset=['Open', 'High', 'Low', 'Close'])
         if candles.empty:
-            print(f"Нет свечей для таймфрейма {timeframe}")
             return None
 
         candles['OpenInterest'] = 0
-
-        if timeframe == '1D':
-            candles['DateTime'] = candles['DateTime'].dt.strftime('%Y%m%d,000000')
-        else:
-            candles['DateTime'] = candles['DateTime'].dt.strftime('%Y%m%d,%H%M%S')
-
-        return candles[['DateTime', 'Open', 'High', 'Low', 'Close', 'Volume', 'OpenInterest']]
+        # YYYYMMDD,HHMMSS целочисленной арифметикой (strftime в разы медленнее)
+        date, time = ns_to_date_time_digits(candles['DateTime'].to_numpy().view('int64'))
+        candles['DateTime'] = (pd.Series(date, index=candles.index).astype(str) + ',' +
+                               pd.Series(time // 1000, index=candles.index).astype(str).str.zfill(6))
+        return candles.reset_index(drop=True)
+
+    def generate_all_candles(self, df, timeframes, ticker=None):
+        """
+        Свечи нескольких таймфреймов за один проход: тики очищаются и сортируются один раз,
+        строится самый мелкий таймфрейм, остальные укрупняются из него (см. bars.cascade)
+
+        :param ticker: тикер для календаря сессий (trading_sessions)
+
+        :return: словарь таймфрейм -> DataFrame свечей (таймфреймы без свечей отсутствуют)
+        """
+        timeframes = [tf for tf in timeframes if tf in self.timeframe_mapping]
+        ticks = self._prepare_ticks(df, ticker)
+        if ticks is None or not timeframes:
+            return {}
+
+        steps = self._timeframe_steps(timeframes, ticker)
+        all_bars = cascade(*ticks, steps.values())
+
+        result = {}
+        for tf in timeframes:
+            candles = self._bars_to_candles(all_bars[steps[tf]])
+            if candles is None:
+                print(f"Нет свечей для таймфрейма {tf}")
+                continue
+            result[tf] = candles[['DateTime', 'Open', 'High', 'Low', 'Close', 'Volume', 'OpenInterest']]
+        return result
 
     def save_to_txt(self, df, file_path):
+        """
+        Записывает свечи в TXT Finam: DATE,TIME,OPEN,HIGH,LOW,CLOSE,VOL,OI.
+        Колонки форматируются целиком через to_csv, файл пишется большими блоками.
+        """
         os.makedirs(os.path.dirname(file_path), exist_ok=True)
-        with open(file_path, 'w', encoding='utf-8') as f:
-            for _, row in df.iterrows():
-                open_p = 0.0 if pd.isna(row['Open']) else float(row['Open'])
-                high_p = 0.0 if pd.isna(row['High']) else float(row['High'])
-                low_p = 0.0 if pd.isna(row['Low']) else float(row['Low'])
-                close_p = 0.0 if pd.isna(row['Close']) else float(row['Close'])
-                vol = 0 if pd.isna(row['Volume']) else int(row['Volume'])
-                oi = int(row.get('OpenInterest', 0))
-                line = f"{row['DateTime']},{open_p:.2f},{high_p:.2f},{low_p:.2f},{close_p:.2f},{vol},{oi}\n"
-                f.write(line)
+        out = self._txt_frame(df)
+        with open(file_path, 'w', encoding='utf-8', buffering=WRITE_BUFFER_SIZE) as f:
+            self._write_txt(out, f)
+
+    def _txt_frame(self, df):
+        """Таблица свечей -> колонки файла Finam (NaN-цены -> 0.0, объем и OI целые)"""
+        date_time = df['DateTime'].astype(str).str.split(',', n=1)
+        open_interest = df['OpenInterest'] if 'OpenInterest' in df.columns else 0
+        out = pd.DataFrame({
+            'Date': date_time.str[0],
+            'Time': date_time.str[1],
+            'Open': df['Open'].astype('float64').fillna(0.0),
+            'High': df['High'].astype('float64').fillna(0.0),
+            'Low': df['Low'].astype('float64').fillna(0.0),
+            'Close': df['Close'].astype('float64').fillna(0.0),
+            'Volume': df['Volume'].fillna(0).astype('int64'),
+            'OpenInterest': pd.Series(open_interest, index=df.index).astype('int64'),
+        })
+        return out
+
+    def _write_txt(self, out, f):
+        out.to_csv(f, header=False, index=False, sep=',', lineterminator='\n',
+                   float_format=f'%.{self.price_precision}f', chunksize=WRITE_CHUNK_ROWS)
+
+    def _candle_path(self, ticker_folder_name, tf):
+        return os.path.join(self.output_dir, ticker_folder_name, tf, f"{ticker_folder_name}_{tf}.txt")
+
+    def _iter_chunks(self, file_path):
+        """Склеенные данные порциями по chunk_rows строк: DataFrame с DateTime и колонками цены/объема"""
+        start_ns, end_ns = self._window()
+        if path_format(file_path) not in (None, 'csv'):
+            df = self._load_columnar(file_path, start_ns, end_ns)
+            if df is None:
+                return
+            for start in range(0, len(df), self.chunk_rows):
+                yield df.iloc[start:start + self.chunk_rows]
+            return
+
+        header = self._read_header(file_path)
+        usecols, dtypes = self._projected_columns(header)
+        if usecols is None:
+            raise ValueError("нет колонок Date/Time")
+
+        time_has_ms = None
+        reader = pd.read_csv(csv_range_source(file_path, start_ns, end_ns), sep=';', header=0, usecols=usecols,
+                             dtype=dtypes, chunksize=self.chunk_rows)
+        for chunk in reader:
+            if 'DateTimeNs' in chunk.columns:
+                chunk['DateTime'] = pd.to_datetime(chunk['DateTimeNs'], unit='ns')
+            else:
+                if time_has_ms is None:
+                    # Формат времени определяется по первой порции и дальше не меняется
+                    time_has_ms = self._guess_time_has_ms(chunk)
+                chunk['DateTime'] = self._parse_date_time(chunk, time_has_ms)
+            yield chunk
+
+    def _process_symbol_streaming(self, ticker_folder_name, file_path):
+        """
+        Потоковая генерация свечей: файл читается порциями, незакрытые бары переносятся
+        между порциями (bars.BarStream), закрытые свечи сразу дописываются в TXT.
+        Результат совпадает с обработкой файла целиком. Требует сортировки данных по времени.
+        """
+        print(f"\nГенерация свечей для {ticker_folder_name.upper()} из файла {os.path.basename(file_path)} "
+              f"(порциями по {self.chunk_rows:,} строк)")
+        return self.process_frames(ticker_folder_name, self._iter_chunks(file_path))
+
+    def process_frames(self, ticker_folder_name, chunks):
+        """
+        Свечи из последовательности таблиц тиков (порции склеенных данных по возрастанию времени,
+        с колонкой DateTime): закрытые свечи дописываются в TXT по мере готовности
+
+        :return: список записанных файлов или None
+        """
+        timeframes = [tf for tf in self.timeframes if tf in self.timeframe_mapping]
+        steps = self._timeframe_steps(timeframes, ticker_folder_name)
+        stream = BarStream(steps.values())
+        files = {}
+        counts = dict.fromkeys(timeframes, 0)
+
+        def write_closed(closed):
+            for tf in timeframes:
+                candles = self._bars_to_candles(closed[steps[tf]])
+                if candles is None:
+                    continue
+                if tf not in files:
+                    out_file = self._candle_path(ticker_folder_name, tf)
+                    os.makedirs(os.path.dirname(out_file), exist_ok=True)
+                    files[tf] = open(out_file, 'w', encoding='utf-8', buffering=WRITE_BUFFER_SIZE)
+                self._write_txt(self._txt_frame(candles), files[tf])
+                counts[tf] += len(candles)
+
+        price_col = vol_col = None
+        volume_state = {}
+        ticks_seen = 0
+        start_ns, end_ns = self._window()
+        try:
+            for chunk in chunks:
+                chunk = self._in_window(chunk, start_ns, end_ns)
+                if price_col is None:
+                    price_col, vol_col = self._detect_price_volume_cols(chunk)
+                    if price_col is None:
+                        print("Не найдена колонка цены.")
+                        return None
+                chunk = chunk.dropna(subset=['DateTime'])
+                ticks_seen += len(chunk)
+                write_closed(stream.push(*self._ticks_from_frame(chunk, price_col, vol_col, volume_state,
+                                                                 ticker_folder_name)))
+            write_closed(stream.finish())
+        except Exception:
+            for f in files.values():
+                f.close()
+                os.remove(f.name)
+            raise
+        for f in files.values():
+            f.close()
+
+        if not ticks_seen:
+            print("Нет валидных дат для ресемплинга.")
+            return None
+
+        out_files = []
+        for tf in timeframes:
+            if tf not in files:
+                print(f"Нет свечей для таймфрейма {tf}")
+                continue
+            out_files.append(files[tf].name)
+            print(f"  {tf}: {counts[tf]:,} строк -> {files[tf].name}")
+        metrics.add(rows=ticks_seen, candles=sum(counts.values()))
+        return out_files
 
     def process_symbol(self, ticker_folder_name):
+        """Генерирует свечи по тикеру. Возвращает список записанных файлов или None"""
         folder = os.path.join(self.input_dir, ticker_folder_name)
         csv_path = self._find_csv_in_folder(folder)
         if csv_path is None:
-            print(f"В папке {folder} нет CSV-файла. Пропускаю.")
-            return
+            print(f"В папке {folder} нет склеенных данных. Пропускаю.")
+            return None
+
+        with metrics.measure('candles', ticker_folder_name, bytes_read=lambda: metrics.file_size(csv_path)) as event:
+            out_files = self._process_symbol(ticker_folder_name, csv_path)
+            event['bytes_written'] = lambda: sum(metrics.file_size(path) for path in out_files or ())
+            return out_files
+
+    def _process_symbol(self, ticker_folder_name, csv_path):
+        for tf in self.timeframes:
+            if tf not in self.timeframe_mapping:
+                print(f"Неизвестный таймфрейм: {tf}")
+
+        if self.chunk_rows:
+            try:
+                return self._process_symbol_streaming(ticker_folder_name, csv_path)
+            except ValueError as e:
+                print(f"⚠️  Потоковая обработка {ticker_folder_name.upper()} невозможна ({e}), читаем файл целиком")
 
-        df = self.load_continuous_data(csv_path)
+        df = self.load_continuous_data(csv_path, *self._window())
         if df is None:
-            return
+            return None
 
         print(f"\nГенерация свечей для {ticker_folder_name.upper()} из файла {os.path.basename(csv_path)}")
+        return self.process_frame(ticker_folder_name, df)
 
-        for tf in self.timeframes:
-            candles = self.generate_candles(df, tf)
-            if candles is None:
-                continue
-            out_file = os.path.join(self.output_dir, ticker_folder_name, tf,
-                                    f"{ticker_folder_name}_{tf}.txt")
+    def process_frame(self, ticker_folder_name, df):
+        """
+        Свечи из склеенных данных в памяти (DataFrame с DateTime, например результат
+        FuturesConcatenator.process_ticker) - без записи и чтения склеенного файла
+
+        :return: список записанных файлов
+        """
+        df = self._in_window(df, *self._window())
+        all_candles = self.generate_all_candles(df, self.timeframes, ticker_folder_name)
+
+        out_files = []
+        for tf, candles in all_candles.items():
+            out_file = self._candle_path(ticker_folder_name, tf)
             self.save_to_txt(candles, out_file)
+            out_files.append(out_file)
             print(f"  {tf}: {len(candles):,} строк -> {out_file}")
-
-    def process_all(self):
+        metrics.add(rows=len(df), candles=sum(len(c) for c in all_candles.values()))
+        return out_files
+
+    def _ticker_size(self, ticker_folder_name):
+        """Размер склеенных данных тикера (для порядка параллельной обработки)"""
+        total = 0
+        for root, dirs, files in os.walk(os.path.join(self.input_dir, ticker_folder_name)):
+            for file in files:
+                total += os.path.getsize(os.path.join(root, file))
+        return total
+
+    def settings(self):
+        """Настройки, от которых зависят свечи (для манифеста)"""
+        settings = {'timeframes': self.timeframes, 'price_precision': self.price_precision,
+                    'volume_mode': self.volume_mode, 'trading_sessions': self.trading_sessions,
+                    'holidays': self.holidays}
+        if self.start is not None or self.end is not None:
+            # Свечи за окно - другой результат, чем за всю историю
+            settings.update(start=str(self.start), end=str(self.end))
+        return settings
+
+    def _symbol_fingerprint(self, ticker_folder_name, manifest):
+        """Отпечаток склеенных данных тикера и настроек генерации"""
+        return manifest.fingerprint(os.path.join(self.input_dir, ticker_folder_name), **self.settings())
+
+    def process_all(self, manifest=None, jobs=1):
+        """
+        manifest – RunManifest: если указан, тикеры с неизменившимися склеенными данными пропускаются
+        jobs – количество процессов: тикеры обрабатываются параллельно, самые большие - первыми
+               (None - по числу ядер, 1 - последовательно в текущем процессе)
+        """
         if not os.path.isdir(self.input_dir):
             print(f"Каталог {self.input_dir} не найден.")
             return
@@ -167,11 +634,41 @@ class FinamTxtCandleGenerator:
             return
 
         print("=== Генерация TXT-файлов в формате Finam ===")
+        fingerprints = {}
+        pending = []
         for t in tickers:
-            try:
-                self.process_symbol(t)
-            except Exception as e:
-                print(f"Ошибка при обработке {t}: {e}")
+            fp = None
+            if manifest is not None:
+                fp = self._symbol_fingerprint(t, manifest)
+                if manifest.is_current('candles', t, fp):
+                    print(f"\n{t.upper()}: склеенные данные не изменились, пропускаю.")
+                    continue
+            fingerprints[t] = fp
+            pending.append(t)
+
+        def ticker_done(t, out_files):
+            if manifest is not None and out_files:
+                manifest.mark_done('candles', t, fingerprints[t], outputs=out_files)
+
+        jobs = jobs or os.cpu_count() or 1
+        if jobs == 1 or len(pending) <= 1:
+            for t in pending:
+                try:
+                    ticker_done(t, self.process_symbol(t))
+                except Exception as e:
+                    print(f"Ошибка при обработке {t}: {e}")
+            return
+
+        pending.sort(key=self._ticker_size, reverse=True)
+        print(f"⚙️  Процессов: {jobs}")
+        with ProcessPoolExecutor(max_workers=jobs) as executor:
+            futures = {executor.submit(self.process_symbol, t): t for t in pending}
+            for future in as_completed(futures):
+                t = futures[future]
+                try:
+                    ticker_done(t, future.result())
+                except Exception as e:
+                    print(f"Ошибка при обработке {t}: {e}")
 
 
 '''if __name__ == '__main__':
@@ -4,16 +4,26 @@ import os
 import shutil
 from pathlib import Path
 import tempfile
+import time
+
+import metrics
+
+
+# Размер буфера при потоковом копировании вложенных архивов
+COPY_BUFFER_SIZE = 16 * 1024 * 1024
 
 
 class NestedArchiveExtractor:
-    def __init__(self, supported_formats=None):
+    def __init__(self, supported_formats=None, selective=True):
         """
         Инициализация экстрактора архивов
 
         :param supported_formats: Список поддерживаемых форматов архивов
+        :param selective: Если True, из начального архива извлекаются только вложенные архивы
+                          сразу в целевую папку (без полной распаковки во временную директорию)
         """
         self.supported_formats = supported_formats or ['.zip', '.tar', '.gz', '.bz2']
+        self.selective = selective
 
     def is_archive(self, filename):
         """Проверяет, является ли файл архивом поддерживаемого формата"""
@@ -42,12 +52,87 @@ class NestedArchiveExtractor:
             print(f"Ошибка при извлечении {archive_path}: {e}")
             return False
 
+    def _tar_stream_mode(self, archive_path):
+        """Режим потокового чтения tar: архив читается один раз последовательно"""
+        suffix = Path(archive_path).suffix.lower()
+        if suffix == '.gz':
+            return 'r|gz'
+        if suffix == '.bz2':
+            return 'r|bz2'
+        return 'r|'
+
+    def _is_wanted_member(self, member_name, folder_prefix):
+        """Проверяет, что файл лежит в папке начального архива и сам является архивом"""
+        name = member_name.replace('\\', '/')
+        if name.startswith('./'):
+            name = name[2:]
+        return name.startswith(folder_prefix) and self.is_archive(name.rsplit('/', 1)[-1])
+
+    def _copy_member(self, src, destination, mtime):
+        """Копирует файл из архива и проставляет ему время модификации из архива"""
+        with open(destination, 'wb') as dst:
+            shutil.copyfileobj(src, dst, COPY_BUFFER_SIZE)
+        os.utime(destination, (mtime, mtime))
+
+    def extract_inner_archives(self, archive_path, archive_name, target_dir):
+        """
+        Извлекает из начального архива только вложенные архивы из папки <archive_name>/
+        и пишет их сразу в target_dir
+
+        :return: количество извлеченных архивов или None, если папка не найдена или архив не прочитан
+        """
+        archive_path = Path(archive_path)
+        folder_prefix = f"{archive_name}/"
+        folder_found = False
+        archives_found = 0
+
+        try:
+            if archive_path.suffix.lower() == '.zip':
+                with zipfile.ZipFile(archive_path, 'r') as zip_ref:
+                    for info in zip_ref.infolist():
+                        name = info.filename.replace('\\', '/')
+                        if name.startswith(folder_prefix):
+                            folder_found = True
+                        if info.is_dir() or not self._is_wanted_member(name, folder_prefix):
+                            continue
+                        name = name.rsplit('/', 1)[-1]
+                        with zip_ref.open(info) as src:
+                            self._copy_member(src, target_dir / name, time.mktime(info.date_time + (0, 0, -1)))
+                        archives_found += 1
+                        print(f"Найден и перемещен: {name}")
+            elif archive_path.suffix.lower() in ['.tar', '.gz', '.bz2']:
+                with tarfile.open(archive_path, self._tar_stream_mode(archive_path)) as tar_ref:
+                    for member in tar_ref:
+                        name = member.name[2:] if member.name.startswith('./') else member.name
+                        if name.startswith(folder_prefix) or name == archive_name:
+                            folder_found = True
+                        if not member.isfile() or not self._is_wanted_member(member.name, folder_prefix):
+                            continue
+                        name = name.rsplit('/', 1)[-1]
+                        src = tar_ref.extractfile(member)
+                        with src:
+                            self._copy_member(src, target_dir / name, member.mtime)
+                        archives_found += 1
+                        print(f"Найден и перемещен: {name}")
+            else:
+                print(f"Не поддерживаемый формат архива: {archive_path}")
+                return None
+        except Exception as e:
+            print(f"Ошибка при извлечении {archive_path}: {e}")
+            return None
+
+        if not folder_found:
+            print(f"Папка '{archive_name}' не найдена в архиве {archive_path.name}")
+            return None
+        return archives_found
+
     def process_initial_archive(self, archive_path, output_base_dir):
         """
         Обрабатывает один начальный архив
 
         :param archive_path: Путь к начальному архиву
         :param output_base_dir: Базовая директория для результатов
+        :return: целевая папка или None, если архив не удалось обработать
         """
         archive_path = Path(archive_path)
         archive_name = archive_path.stem  # Имя архива без расширения
@@ -56,13 +141,20 @@ class NestedArchiveExtractor:
         target_dir = Path(output_base_dir) / archive_name
         target_dir.mkdir(parents=True, exist_ok=True)
 
+        if self.selective:
+            archives_found = self.extract_inner_archives(archive_path, archive_name, target_dir)
+            if archives_found is None:
+                return None
+            print(f"Обработан архив {archive_path.name}. Найдено архивов: {archives_found}")
+            return target_dir
+
         # Создаем временную директорию для извлечения
         with tempfile.TemporaryDirectory() as temp_dir:
             temp_path = Path(temp_dir)
 
             # Извлекаем начальный архив
             if not self.extract_archive(archive_path, temp_path):
-                return
+                return None
 
             # Ищем папку с именем исходного архива
             expected_folder_name = archive_name
@@ -77,7 +169,7 @@ class NestedArchiveExtractor:
             if not source_folder:
                 print(f"Папка '{expected_folder_name}' не найдена в архиве {archive_path.name}")
                 # Можно добавить логику для обработки других случаев
-                return
+                return None
 
             # Ищем все архивы в найденной папке
             archives_found = 0
@@ -90,13 +182,15 @@ class NestedArchiveExtractor:
                     print(f"Найден и перемещен: {item.name}")
 
             print(f"Обработан архив {archive_path.name}. Найдено архивов: {archives_found}")
+            return target_dir
 
-    def process_directory(self, input_dir, output_base_dir=None):
+    def process_directory(self, input_dir, output_base_dir=None, manifest=None):
         """
         Обрабатывает все архивы в указанной директории
 
         :param input_dir: Директория с начальными архивами
         :param output_base_dir: Базовая директория для результатов (по умолчанию ./output)
+        :param manifest: RunManifest - если указан, неизменившиеся архивы пропускаются
         """
         input_path = Path(input_dir)
 
@@ -119,8 +213,17 @@ class NestedArchiveExtractor:
 
         # Обрабатываем каждый архив
         for archive_path in archives_to_process:
+            fp = manifest.fingerprint(archive_path) if manifest is not None else None
+            if manifest is not None and manifest.is_current('unarchive', archive_path, fp):
+                print(f"\nПропускаем (без изменений): {archive_path.name}")
+                continue
+
             print(f"\nОбрабатываем: {archive_path.name}")
-            self.process_initial_archive(archive_path, output_path)
+            with metrics.measure('unarchive', archive_path.name, bytes_read=archive_path.stat().st_size) as event:
+                target_dir = self.process_initial_archive(archive_path, output_path)
+                event['bytes_written'] = lambda: metrics.file_size(target_dir)
+            if manifest is not None and target_dir is not None:
+                manifest.mark_done('unarchive', archive_path, fp, outputs=[target_dir])
 
         print("\n" + "=" * 50)
         print("Обработка завершена!")
@@ -0,0 +1,425 @@
+import io
+import json
+import os
+import shutil
+
+import numpy as np
+import pandas as pd
+
+try:
+    import pyarrow
+    import pyarrow.ipc
+    import pyarrow.parquet
+except ImportError:  # Parquet/Feather недоступны, CSV и memmap работают только на NumPy/pandas
+    pyarrow = None
+
+
+# Форматы склеенных данных и расширения файлов (memmap - папка с колонками)
+GLUED_FORMATS = {
+    'csv': '.csv',
+    'parquet': '.parquet',
+    'feather': '.feather',
+    'memmap': '.memmap',
+}
+# Порядок поиска, если в папке тикера лежит несколько форматов: бинарные читаются быстрее
+READ_PRIORITY = ['memmap', 'parquet', 'feather', 'csv']
+MEMMAP_META = 'meta.json'
+# Длина строковых колонок (код контракта) в формате memmap
+MEMMAP_STRING_BYTES = 16
+# CSV пишется порциями по столько строк: так известны байтовые смещения строк для индекса
+CSV_WRITE_ROWS = 100_000
+# Индекс времени склеенных данных: период -> смещение и строки (файл рядом с данными)
+INDEX_SUFFIX = '.index.json'
+INDEX_PERIODS = {
+    'day': 24 * 3600 * 10 ** 9,
+    'hour': 3600 * 10 ** 9,
+}
+
+
+def check_format(fmt):
+    """Проверяет, что формат известен и его зависимости установлены"""
+    if fmt not in GLUED_FORMATS:
+        raise ValueError(f"Неизвестный формат склеенных данных: {fmt}")
+    if fmt in ('parquet', 'feather') and pyarrow is None:
+        raise ImportError(f"Для формата {fmt} нужен пакет pyarrow (pip install pyarrow)")
+
+
+def glued_path(ticker_dir, ticker, fmt):
+    """Путь к склеенным данным тикера в заданном формате"""
+    return os.path.join(ticker_dir, f"{ticker}{GLUED_FORMATS[fmt]}")
+
+
+def path_format(path):
+    """Формат склеенных данных по пути (или None)"""
+    for fmt, ext in GLUED_FORMATS.items():
+        if path.lower().endswith(ext):
+            return fmt
+    return None
+
+
+def find_glued(folder):
+    """Находит склеенные данные в папке тикера: предпочитаются бинарные форматы"""
+    found = {}
+    for name in sorted(os.listdir(folder)):
+        fmt = path_format(name)
+        if fmt is not None and fmt not in found:
+            found[fmt] = os.path.join(folder, name)
+    for fmt in READ_PRIORITY:
+        if fmt in found:
+            return found[fmt]
+    return None
+
+
+def index_path(path):
+    """Путь к индексу времени склеенных данных"""
+    return path + INDEX_SUFFIX
+
+
+def to_ns(value):
+    """Граница диапазона (строка, datetime, Timestamp или нс) -> наносекунды от эпохи; None - без границы"""
+    if value is None:
+        return None
+    if isinstance(value, (int, np.integer)):
+        return int(value)
+    return pd.Timestamp(value).value
+
+
+def load_index(path):
+    """
+    Индекс времени склеенных данных или None, если его нет или данные с тех пор переписаны
+
+    :param path: путь склеенных данных (см. glued_path)
+    """
+    try:
+        with open(index_path(path), 'r', encoding='utf-8') as f:
+            index = json.load(f)
+        if os.path.isdir(path):
+            with open(os.path.join(path, MEMMAP_META), 'r', encoding='utf-8') as f:
+                current = json.load(f)['rows'] == index['rows']
+        else:
+            current = os.path.getsize(path) == index['size']
+    except (OSError, ValueError, KeyError):
+        return None
+    return index if current else None
+
+
+def index_span(index, start_ns=None, end_ns=None):
+    """
+    Непрерывный участок данных, покрывающий периоды индекса, пересекающиеся с [start_ns, end_ns)
+
+    :return: (первая строка, строк, байтовое смещение, байт) - смещение и длина только у CSV;
+             None, если в диапазоне нет данных
+    """
+    period = index['period_ns']
+    entries = [e for e in index['entries']
+               if (start_ns is None or e[0] + period > start_ns) and (end_ns is None or e[0] < end_ns)]
+    if not entries:
+        return None
+    first, last = entries[0], entries[-1]
+    if first[3] is None:
+        return first[1], last[1] + last[2] - first[1], None, None
+    return first[1], last[1] + last[2] - first[1], first[3], last[3] + last[4] - first[3]
+
+
+def csv_range_source(path, start_ns=None, end_ns=None):
+    """
+    Источник для pd.read_csv только со строками нужного диапазона (с запасом до границ периодов индекса):
+    заголовок и участок файла читаются по смещениям из индекса. Без актуального индекса - весь файл.
+
+    :return: путь к файлу или BytesIO
+    """
+    index = load_index(path)
+    if index is None or (start_ns is None and end_ns is None):
+        return path
+    span = index_span(index, start_ns, end_ns)
+    with open(path, 'rb') as f:
+        header = f.read(index['header_bytes'])
+        if span is None:
+            return io.BytesIO(header)
+        f.seek(span[2])
+        return io.BytesIO(header + f.read(span[3]))
+
+
+def read_glued_range(path, start=None, end=None, columns=None):
+    """
+    Строки склеенных данных со временем в [start, end): по индексу читается только нужный участок
+    (CSV - с seek по байтовому смещению, memmap - срез строк), без индекса - весь файл с фильтром.
+
+    :param path: путь склеенных данных любого формата
+    :param start: начало диапазона (включительно), None - с начала
+    :param end: конец диапазона (не включительно), None - до конца
+    :param columns: список колонок (None - все); колонка времени добавляется для фильтра
+    :return: DataFrame
+    """
+    start_ns, end_ns = to_ns(start), to_ns(end)
+    fmt = path_format(path)
+    if fmt == 'csv':
+        if columns is not None and 'DateTimeNs' not in columns:
+            columns = list(columns) + ['DateTimeNs']
+        df = pd.read_csv(csv_range_source(path, start_ns, end_ns), sep=';', usecols=columns)
+        times = df['DateTimeNs'].to_numpy(dtype='int64')
+    else:
+        if columns is not None and 'DateTime' not in columns:
+            columns = list(columns) + ['DateTime']
+        df = read_glued(path, columns)
+        index = load_index(path)
+        if index is not None:
+            span = index_span(index, start_ns, end_ns)
+            df = df.iloc[span[0]:span[0] + span[1]] if span is not None else df.iloc[:0]
+        times = df['DateTime'].to_numpy(dtype='datetime64[ns]').view('int64')
+    mask = np.ones(len(df), dtype=bool)
+    if start_ns is not None:
+        mask &= times >= start_ns
+    if end_ns is not None:
+        mask &= times < end_ns
+    return df[mask].reset_index(drop=True)
+
+
+def glued_columns(path):
+    """Список колонок бинарных склеенных данных без чтения самих данных"""
+    fmt = path_format(path)
+    if fmt == 'memmap':
+        with open(os.path.join(path, MEMMAP_META), 'r', encoding='utf-8') as f:
+            return [col['name'] for col in json.load(f)['columns']]
+    if fmt == 'parquet':
+        return list(pyarrow.parquet.read_schema(path).names)
+    if fmt == 'feather':
+        with pyarrow.memory_map(path) as source:
+            return list(pyarrow.ipc.open_file(source).schema.names)
+    raise ValueError(f"{path}: не бинарный формат")
+
+
+def read_glued(path, columns=None):
+    """
+    Читает бинарные склеенные данные с выборкой колонок
+
+    :param path: файл .parquet/.feather или папка .memmap
+    :param columns: список нужных колонок (None - все)
+    """
+    fmt = path_format(path)
+    if fmt == 'memmap':
+        with open(os.path.join(path, MEMMAP_META), 'r', encoding='utf-8') as f:
+            meta = json.load(f)
+        data = {}
+        for col in meta['columns']:
+            if columns is not None and col['name'] not in columns:
+                continue
+            data[col['name']] = np.memmap(os.path.join(path, col['file']), dtype=col['dtype'],
+                                          mode='r', shape=(meta['rows'],))
+        return pd.DataFrame(data, copy=False)
+    if fmt == 'parquet':
+        check_format(fmt)
+        return pd.read_parquet(path, columns=columns)
+    if fmt == 'feather':
+        check_format(fmt)
+        return pd.read_feather(path, columns=columns)
+    raise ValueError(f"{path}: не бинарный формат")
+
+
+def _column_values(series):
+    """
+    NumPy-массив колонки: nullable-типы pandas (Int64 с пропусками) переводятся в float64 с NaN,
+    строки и категории (код контракта) - в байтовые строки фиксированной длины
+    """
+    if isinstance(series.dtype, pd.CategoricalDtype) or series.dtype == object:
+        return series.astype(str).to_numpy().astype(f'S{MEMMAP_STRING_BYTES}')
+    if isinstance(series.dtype, np.dtype):
+        return series.to_numpy()
+    return series.to_numpy(dtype='float64', na_value=np.nan)
+
+
+def _csv_text(df):
+    """
+    Дробные колонки для CSV: целые значения пишутся без '.0' (3001, а не 3001.0), как в исходных файлах,
+    пропуски - пустыми. Колонки, где все значения целые, пишутся как целые, остальные - строками
+    """
+    columns = {}
+    for name in df.columns:
+        values = df[name].to_numpy()
+        if values.dtype.kind != 'f':
+            continue
+        whole = np.isfinite(values) & (np.abs(values) < 2 ** 53) & (values == np.floor(values))
+        missing = np.isnan(values)
+        ints = np.where(whole, values, 0).astype('int64')
+        if (whole | missing).all():
+            columns[name] = pd.arrays.IntegerArray(ints, missing)
+        elif whole.any():
+            text = df[name].astype(str).to_numpy()
+            text[whole] = ints[whole].astype(str)
+            text[missing] = ''
+            columns[name] = text
+    return df.assign(**columns) if columns else df
+
+
+def _replace(temp_path, path):
+    """Заменяет старый результат новым (для memmap - целиком папку)"""
+    if os.path.isdir(path):
+        shutil.rmtree(path)
+    os.replace(temp_path, path)
+
+
+def _remove(path):
+    if os.path.isdir(path):
+        shutil.rmtree(path, ignore_errors=True)
+    elif os.path.exists(path):
+        os.remove(path)
+
+
+class GluedWriter:
+    def __init__(self, path, columns, fmt='csv', index_period=None):
+        """
+        Запись склеенных данных частями: результат появляется на месте только целиком
+
+        :param path: путь результата (см. glued_path)
+        :param columns: колонки в порядке записи
+        :param fmt: 'csv' (';', utf-8-sig), 'parquet', 'feather' или 'memmap'
+        :param index_period: 'day' или 'hour' - рядом пишется индекс времени (index_path): для каждого
+                             периода первая строка, число строк и (у CSV) байтовое смещение.
+                             Данные должны идти по времени, иначе индекс не пишется. None - без индекса
+        """
+        check_format(fmt)
+        if index_period is not None and index_period not in INDEX_PERIODS:
+            raise ValueError(f"Неизвестный период индекса: {index_period}")
+        self.path = path
+        self.columns = columns
+        self.fmt = fmt
+        self.rows = 0
+        self.index_period = index_period
+        self.index_file = None  # путь записанного индекса
+        self._temp_path = f"{path}.part"
+        self._handle = None
+        self._meta = None
+        self._bytes = 0
+        self._header_bytes = 0
+        # Записи индекса: [начало периода нс, первая строка, строк, смещение, байт]
+        self._entries = [] if index_period is not None else None
+
+    def __enter__(self):
+        return self
+
+    def _open(self, df):
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        _remove(self._temp_path)
+        if self.fmt == 'csv':
+            # Байты пишутся сами (utf-8 с BOM), чтобы знать смещение каждой строки
+            self._handle = open(self._temp_path, 'wb')
+            self._bytes = self._handle.write(b'\xef\xbb\xbf')
+        elif self.fmt in ('parquet', 'feather'):
+            schema = pyarrow.Schema.from_pandas(df, preserve_index=False)
+            if self.fmt == 'parquet':
+                self._handle = pyarrow.parquet.ParquetWriter(self._temp_path, schema)
+            else:
+                self._handle = pyarrow.ipc.new_file(self._temp_path, schema)
+        else:
+            os.makedirs(self._temp_path)
+            self._meta = {'rows': 0, 'columns': []}
+            self._handle = {}
+            for i, name in enumerate(self.columns):
+                file_name = f"{i:03d}.bin"
+                dtype = _column_values(df[name].iloc[:0]).dtype.str
+                self._meta['columns'].append({'name': name, 'file': file_name, 'dtype': dtype})
+                self._handle[name] = open(os.path.join(self._temp_path, file_name), 'wb')
+
+    def _write_csv(self, df):
+        for start in range(0, len(df), CSV_WRITE_ROWS) if len(df) else [0]:
+            part = df.iloc[start:start + CSV_WRITE_ROWS]
+            header = self.rows == 0 and start == 0
+            data = _csv_text(part).to_csv(None, index=False, header=header, sep=';').encode('utf-8')
+            offsets = None
+            if self._entries is not None and len(part):
+                # Начала строк порции: после каждого перевода строки (первая строка файла - заголовок)
+                line_starts = np.concatenate(([0], np.flatnonzero(np.frombuffer(data, dtype=np.uint8) == 10)[:-1] + 1))
+                if header:
+                    self._header_bytes = self._bytes + int(line_starts[1])
+                    line_starts = line_starts[1:]
+                if len(line_starts) == len(part):
+                    offsets = self._bytes + line_starts
+                else:  # переводы строк внутри значений - смещения строк неизвестны
+                    self._entries = None
+            self._index_rows(part, self.rows + start, offsets)
+            self._bytes += self._handle.write(data)
+
+    def _index_rows(self, df, first_row, offsets=None):
+        """Добавляет строки порции в индекс: новая запись на каждый период, продолжение - к последней"""
+        if self._entries is None or not len(df):
+            return
+        time_col = 'DateTimeNs' if 'DateTimeNs' in df.columns else 'DateTime'
+        times = df[time_col].to_numpy()
+        times = times.astype('datetime64[ns]').view('int64') if times.dtype.kind == 'M' else times.astype('int64')
+        keys = times // INDEX_PERIODS[self.index_period] * INDEX_PERIODS[self.index_period]
+        if (np.diff(keys) < 0).any() or (self._entries and keys[0] < self._entries[-1][0]):
+            self._entries = None  # данные не по времени: индекс не пишется
+            return
+        starts = np.concatenate(([0], np.flatnonzero(np.diff(keys)) + 1))
+        counts = np.diff(np.append(starts, len(keys)))
+        for start, count in zip(starts.tolist(), counts.tolist()):
+            if self._entries and self._entries[-1][0] == keys[start]:
+                self._entries[-1][2] += count
+                continue
+            offset = int(offsets[start]) if offsets is not None else None
+            self._entries.append([int(keys[start]), first_row + start, count, offset, None])
+
+    def _write_index(self):
+        """Пишет индекс рядом с результатом (старый индекс удаляется, даже если новый не строится)"""
+        path = index_path(self.path)
+        if self._entries is None:
+            _remove(path)
+            return
+        if self.fmt == 'csv':
+            # Длина периода в байтах - до начала следующего (последнего - до конца файла)
+            ends = [entry[3] for entry in self._entries[1:]] + [self._bytes]
+            for entry, end in zip(self._entries, ends):
+                entry[4] = end - entry[3]
+        index = {
+            'period': self.index_period,
+            'period_ns': INDEX_PERIODS[self.index_period],
+            'format': self.fmt,
+            'rows': self.rows,
+            'size': None if os.path.isdir(self.path) else os.path.getsize(self.path),
+            'header_bytes': self._header_bytes,
+            'entries': self._entries,
+        }
+        temp_path = f"{path}.part"
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump(index, f, separators=(',', ':'))
+        os.replace(temp_path, path)
+        self.index_file = path
+
+    def write(self, df):
+        df = df[self.columns]
+        if self._handle is None:
+            self._open(df)
+        if self.fmt == 'csv':
+            self._write_csv(df)
+            self.rows += len(df)
+            return
+        self._index_rows(df, self.rows)
+        if self.fmt in ('parquet', 'feather'):
+            self._handle.write_table(pyarrow.Table.from_pandas(df, schema=self._handle.schema, preserve_index=False))
+        else:
+            for col in self._meta['columns']:
+                values = _column_values(df[col['name']])
+                if values.dtype.str != col['dtype']:
+                    values = values.astype(col['dtype'])
+                self._handle[col['name']].write(np.ascontiguousarray(values).tobytes())
+        self.rows += len(df)
+
+    def _close_handle(self):
+        if self.fmt == 'memmap':
+            for f in self._handle.values():
+                f.close()
+            self._meta['rows'] = self.rows
+            with open(os.path.join(self._temp_path, MEMMAP_META), 'w', encoding='utf-8') as f:
+                json.dump(self._meta, f, ensure_ascii=False, indent=1)
+        else:
+            self._handle.close()
+
+    def __exit__(self, exc_type, exc, tb):
+        if self._handle is None:
+            return
+        self._close_handle()
+        if exc_type is None:
+            _replace(self._temp_path, self.path)
+            self._write_index()
+        else:
+            _remove(self._temp_path)
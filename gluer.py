@@ -1,18 +1,99 @@
 import os
+import io
+import re
+import hashlib
+from contextlib import nullcontext
+import numpy as np
 import pandas as pd
-from datetime import datetime, timedelta
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import date, datetime, timedelta
+
+import metrics
+from archivefs import ARCHIVE_READ_ERRORS, ArchiveSource, ArchiveMember
+from catalog import parse_member_name
+from gluedstore import GluedWriter, check_format, glued_path
+from spill import SpillDirectory, merge_runs, SPILL_BLOCK_ROWS
+from timeutils import parse_date_time_ns, ns_to_date_time_digits, NS_PER_DAY
+
+
+# Типы колонок итоговых данных. Date/Time формируются из DateTime и хранятся отдельно
+COLUMN_SCHEMA = {
+    'TradeID': 'int64', 'TradeVolume': 'int64', 'LastPrice': 'float64', 'TotalVolume': 'int64',
+    'HighPrice': 'float64', 'LowPrice': 'float64', 'Nanoseconds': 'int64',
+    **{f'Bid{i}': 'float64' for i in range(1, 6)},
+    **{f'Ask{i}': 'float64' for i in range(1, 6)},
+    **{f'BidVol{i}': 'int64' for i in range(1, 6)},
+    **{f'AskVol{i}': 'int64' for i in range(1, 6)},
+}
+
+# Код контракта: буквы продукта + YYMM (или YMM для CZCE)
+CONTRACT_PATTERN = re.compile(r'^([a-z]+)(\d{3,4})$')
+# Дни от 1970-01-01 для графика ролловера
+EPOCH_DATE = date(1970, 1, 1)
+FIRST_DAY = np.iinfo(np.int64).min
+LAST_DAY = np.iinfo(np.int64).max
+
+SEPARATORS = [',', ';', '\t', '|']
+# Сколько байт и строк из начала файла используется для определения разделителя
+SNIFF_BYTES = 64 * 1024
+SNIFF_LINES = 50
+# Общая для файлов контракта часть структуры (кэшируется); форматы даты и времени - у каждого файла свои
+LAYOUT_STRUCTURE = ('sep', 'ncols', 'date_col', 'time_col')
 
 
 class FuturesConcatenator:
-    def __init__(self, root_dir, rollover_days=5, debug=False):
+    def __init__(self, root_dir, rollover_days=5, debug=False, schema_policy='lenient', price_dtype='float64',
+                 roll_rule='calendar', out_of_core=False, spill_dir=None, spill_block_rows=SPILL_BLOCK_ROWS,
+                 output_format='csv', candle_generator=None, write_glued=True, index_period='day'):
         """
-        root_dir – папка с тикерами
+        root_dir – папка с тикерами или ArchiveSource (чтение CSV прямо из архивов)
         rollover_days – за сколько дней до экспирации переходить на следующий контракт
+        roll_rule – 'calendar': переход за rollover_days дней до экспирации,
+                    'volume': переход на контракт с наибольшим дневным объемом (только вперед),
+                    None: без ролловера, склеиваются все данные всех контрактов
         debug – если True, печатаем дополнительные логи для отладки
+        schema_policy – 'strict': файл с некорректными значениями пропускается с ошибкой,
+                        'lenient': некорректные значения заменяются пустыми
+        price_dtype – тип колонок цен: 'float64' или 'float32' (в 2 раза меньше памяти)
+        out_of_core – если True, process_all склеивает тикеры с ограниченной памятью
+                      (прогоны на диске + потоковое слияние), см. glue_ticker_out_of_core
+        spill_dir – папка для временных прогонов (None - системная временная директория)
+        spill_block_rows – размер блока прогона в строках (память слияния ~ блок на прогон)
+        output_format – формат склеенных данных: 'csv' (';', utf-8-sig, для экспорта; в конце колонки
+                        DateTimeNs - время в наносекундах от эпохи и Contract - контракт тика),
+                        'parquet'/'feather' (нужен pyarrow) или 'memmap' (колонки NumPy + meta.json).
+                        Бинарные форматы хранят DateTime вместо Date/Time
+        candle_generator – FinamTxtCandleGenerator: свечи строятся сразу из склеенных данных в памяти
+                           (generator.process_frame / process_frames), без повторного чтения файла
+        write_glued – False - склеенные данные не сохраняются (только свечи, нужен candle_generator)
+        index_period – 'day' или 'hour': рядом со склеенными данными пишется индекс времени
+                       (<файл>.index.json) - чтение диапазона дат ищет смещение, а не разбирает весь файл
+                       (gluedstore.read_glued_range, FinamTxtCandleGenerator.read_range). None - без индекса
         """
+        if schema_policy not in ('strict', 'lenient'):
+            raise ValueError(f"Неизвестный schema_policy: {schema_policy}")
+        if roll_rule not in ('calendar', 'volume', None):
+            raise ValueError(f"Неизвестный roll_rule: {roll_rule}")
+        check_format(output_format)
+        if not write_glued and candle_generator is None:
+            raise ValueError("write_glued=False имеет смысл только с candle_generator")
         self.root_dir = root_dir
         self.rollover_days = rollover_days
         self.debug = debug
+        self.schema_policy = schema_policy
+        self.price_dtype = price_dtype
+        self.roll_rule = roll_rule
+        self.out_of_core = out_of_core
+        self.spill_dir = spill_dir
+        self.spill_block_rows = spill_block_rows
+        self.output_format = output_format
+        self.candle_generator = candle_generator
+        self.write_glued = write_glued
+        self.index_period = index_period
+
+        # Кэш структуры файлов по (контракт, сессия) и файлы, прочитанные медленным python-движком
+        self._layout_cache = {}
+        self.python_engine_files = []
 
         # Ожидаемая структура итогового CSV (имена и порядок колонок)
         self.column_names = [
@@ -24,20 +105,150 @@ class FuturesConcatenator:
             'AskVol1', 'AskVol2', 'AskVol3', 'AskVol4', 'AskVol5'
         ]
 
-    def parse_contract_expiry(self, contract_code):
-        """Определяет календарную дату экспирации по названию контракта agYYMM"""
+    def parse_contract_expiry(self, contract_code, data_date=None):
+        """
+        Определяет календарную дату экспирации по названию контракта: agYYMM, aYYMM или SRYMM (CZCE).
+        Для трехзначного кода десятилетие определяется по дате данных контракта: берется первый год,
+        при котором экспирация не раньше этой даты (контракт торгуется до своей экспирации).
+        Без даты данных - в пределах ближайшего к текущему году десятилетия.
+
+        :param contract_code: код контракта
+        :param data_date: самая ранняя дата данных контракта (date) или None
+        """
         try:
-            code = contract_code.lower()
-            yy = int("20" + code[2:4])
-            mm = int(code[4:6])
-            if mm == 12:
-                return datetime(yy, mm, 31).date()
-            else:
-                next_month = datetime(yy, mm + 1, 1).date()
-                return next_month - timedelta(days=1)
+            match = CONTRACT_PATTERN.match(contract_code.lower())
+            digits = match.group(2)
+            mm = int(digits[-2:])
+            if len(digits) == 4:
+                return self._month_end(int("20" + digits[:2]), mm)
+            if data_date is not None:
+                yy = data_date.year // 10 * 10 + int(digits[0])
+                if self._month_end(yy, mm) < data_date:
+                    yy += 10
+                if self._month_end(yy - 10, mm) >= data_date:
+                    yy -= 10
+                return self._month_end(yy, mm)
+            this_year = datetime.now().year
+            yy = this_year // 10 * 10 + int(digits[0])
+            if yy > this_year + 5:
+                yy -= 10
+            return self._month_end(yy, mm)
         except Exception:
             return None
 
+    @staticmethod
+    def _month_end(year, month):
+        """Последний день месяца"""
+        if month == 12:
+            return date(year, 12, 31)
+        return date(year, month + 1, 1) - timedelta(days=1)
+
+    def _contract_data_dates(self, contract_files):
+        """Самая ранняя дата данных каждого контракта по датам в именах файлов (<контракт>_<YYYYMMDD>.csv)"""
+        data_dates = {}
+        for code, path in contract_files:
+            parsed = parse_member_name(os.path.basename(str(path)))
+            if parsed is None or parsed[3] is None:
+                continue
+            try:
+                file_date = datetime.strptime(parsed[3], '%Y%m%d').date()
+            except ValueError:
+                continue
+            if code not in data_dates or file_date < data_dates[code]:
+                data_dates[code] = file_date
+        return data_dates
+
+    def build_roll_schedule(self, sorted_contracts, expiry_dates):
+        """
+        Календарный график ролловера: контракт активен с даты перехода с предыдущего контракта
+        до своей даты перехода (экспирация - rollover_days). Последний контракт активен до конца данных.
+
+        Возвращает (starts, contracts): contracts[k] активен в дни [starts[k], starts[k + 1]),
+        дни считаются от 1970-01-01. None, если ни для одного контракта не известна экспирация.
+        """
+        schedulable = [c for c in sorted_contracts if expiry_dates.get(c)]
+        if not schedulable:
+            return None
+
+        starts, contracts = [], []
+        prev_roll = FIRST_DAY
+        for i, contract in enumerate(schedulable):
+            roll_day = (expiry_dates[contract] - EPOCH_DATE).days - self.rollover_days
+            is_last = i == len(schedulable) - 1
+            if not is_last and roll_day <= prev_roll:
+                continue  # контракт вытеснен раньше, чем стал активным
+            starts.append(prev_roll)
+            contracts.append(contract)
+            prev_roll = roll_day
+        return np.array(starts, dtype=np.int64), contracts
+
+    def _add_daily_volume(self, daily, contract, out):
+        """Добавляет дневные объемы файла контракта в словарь daily: контракт -> Series по дням"""
+        days = out['DateTime'].to_numpy().view('int64') // NS_PER_DAY
+        total = pd.to_numeric(out['TotalVolume'], errors='coerce').to_numpy(dtype='float64', na_value=np.nan)
+        if np.isnan(total).all():
+            # Нет накопленного объема - берем сумму объемов сделок
+            trade = pd.to_numeric(out['TradeVolume'], errors='coerce').to_numpy(dtype='float64', na_value=0)
+            day_volume = pd.Series(trade).groupby(days).sum()
+        else:
+            # TotalVolume - накопленный за день счетчик, объем дня - его максимум
+            day_volume = pd.Series(total).groupby(days).max()
+        previous = daily.get(contract)
+        daily[contract] = day_volume if previous is None else pd.concat([previous, day_volume]).groupby(level=0).max()
+
+    def _volume_roll_schedule(self, daily, sorted_contracts):
+        """
+        График ролловера по объему: каждый день активен контракт с наибольшим дневным объемом,
+        переход только вперед (на более дальний контракт). Формат как у build_roll_schedule.
+
+        :param daily: словарь контракт -> дневные объемы (см. _add_daily_volume)
+        """
+        contracts = [c for c in sorted_contracts if c in daily]
+        if not contracts:
+            return None
+        table = pd.DataFrame({c: daily[c] for c in contracts}).sort_index().fillna(0)
+        leader = np.maximum.accumulate(table.to_numpy().argmax(axis=1))
+
+        changes = np.flatnonzero(np.diff(leader)) + 1
+        run_starts = np.concatenate([[0], changes])
+        starts = table.index.to_numpy()[run_starts].astype(np.int64)
+        starts[0] = FIRST_DAY
+        return starts, [contracts[k] for k in leader[run_starts]]
+
+    def active_contract_table(self, schedule, first_date, last_date):
+        """Таблица активного контракта по дням: DataFrame с колонками Date и Contract"""
+        starts, contracts = schedule
+        dates = pd.date_range(first_date, last_date, freq='D')
+        days = dates.to_numpy().astype('datetime64[D]').astype(np.int64)
+        idx = np.searchsorted(starts, days, side='right') - 1
+        return pd.DataFrame({'Date': dates, 'Contract': np.array(contracts, dtype=object)[idx]})
+
+    def _active_mask(self, out, contract, schedule):
+        """Маска строк, попадающих в окно активности контракта (contract - код или массив кодов по строкам)"""
+        starts, contracts = schedule
+        days = out['DateTime'].to_numpy().view('int64') // NS_PER_DAY
+        idx = np.searchsorted(starts, days, side='right') - 1
+        return np.array(contracts, dtype=object)[idx] == contract
+
+    def _file_in_window(self, file_path, contract, schedule):
+        """
+        Проверка по дате в имени файла, может ли файл попасть в окно активности контракта
+        (файлы вне окна не читаются). Ночная сессия может переходить через полночь, поэтому запас - 1 день.
+        """
+        parsed = parse_member_name(os.path.basename(str(file_path)))
+        if parsed is None or parsed[3] is None:
+            return True
+        starts, contracts = schedule
+        file_day = (datetime.strptime(parsed[3], '%Y%m%d').date() - EPOCH_DATE).days
+        for k, active in enumerate(contracts):
+            if active != contract:
+                continue
+            start = int(starts[k]) - 1 if starts[k] != FIRST_DAY else FIRST_DAY
+            end = int(starts[k + 1]) if k + 1 < len(starts) else LAST_DAY
+            if start <= file_day <= end:
+                return True
+        return False
+
     def find_contract_files(self, ticker_dir):
         """Ищет все csv-файлы внутри папок DAY/NIGHT"""
         contract_files = []
@@ -48,7 +259,8 @@ class FuturesConcatenator:
             if not os.path.exists(session_path):
                 continue
             files = os.listdir(session_path)
-            print(f"Проверяем {session_path}, файлы: {files}")
+            if self.debug:
+                print(f"Проверяем {session_path}, файлы: {files}")
             for fname in files:
                 if fname.lower().endswith(".csv"):
                     contract_code = fname.split('_')[0].lower()
@@ -56,18 +268,271 @@ class FuturesConcatenator:
                     contract_files.append((contract_code, full_path))
         return contract_files
 
-    def _try_read_file(self, file_path):
+    def _list_tickers(self):
+        """Список тикеров: папки в root_dir или тикеры из архивов"""
+        if isinstance(self.root_dir, ArchiveSource):
+            return self.root_dir.tickers()
+        return [d for d in os.listdir(self.root_dir) if os.path.isdir(os.path.join(self.root_dir, d))]
+
+    def _read_csv(self, file_path, **kwargs):
+        """pd.read_csv для файла на диске или CSV внутри архива"""
+        if isinstance(file_path, ArchiveMember):
+            with self.root_dir.open(file_path) as f:
+                return pd.read_csv(f, **kwargs)
+        return pd.read_csv(file_path, **kwargs)
+
+    def _read_head_lines(self, file_path):
+        """Читает первые строки файла (не больше SNIFF_BYTES байт и SNIFF_LINES строк)"""
+        if isinstance(file_path, ArchiveMember):
+            with self.root_dir.open(file_path) as f:
+                head = f.read(SNIFF_BYTES)
+        else:
+            with open(file_path, 'rb') as f:
+                head = f.read(SNIFF_BYTES)
+
+        lines = head.decode('utf-8', errors='replace').splitlines()
+        if len(head) == SNIFF_BYTES and len(lines) > 1:
+            lines = lines[:-1]  # последняя строка может быть обрезана
+        return [line for line in lines[:SNIFF_LINES] if line.strip()]
+
+    def _sniff_separator(self, lines):
+        """Определяет разделитель по первым строкам файла. Возвращает разделитель или None"""
+        if not lines:
+            return None
+
+        best_sep, best_count = None, 0
+        for sep in SEPARATORS:
+            counts = [line.count(sep) for line in lines]
+            if min(counts) >= 1 and min(counts) == max(counts):
+                return sep
+            median = sorted(counts)[len(counts) // 2]
+            if median > best_count:
+                best_sep, best_count = sep, median
+        return best_sep
+
+    def _detect_datetime_cols(self, sample):
+        """Находит колонки Date/Time по строковой выборке строк файла. Возвращает (date_col, time_col)"""
+        ncols = sample.shape[1]
+
+        # Находим пару колонок Date/Time (соседние колонки, где одна похожа на дату)
+        date_col = None
+        time_col = None
+        max_check = min(6, ncols - 1)
+        for i in range(max_check):
+            col_date = sample.iloc[:, i].astype(str).str.strip()
+            col_time = sample.iloc[:, i + 1].astype(str).str.strip()
+            date_like = col_date.str.match(r'^\d{6,8}$')
+            time_like = col_time.str.match(r'^\d{1,9}$')
+            if date_like.sum() >= max(1, int(0.3 * len(col_date))) and time_like.sum() >= max(1, int(0.3 * len(col_time))):
+                date_col = i
+                time_col = i + 1
+                break
+
+        # Доп. эвристики
+        if date_col is None:
+            for i in range(min(6, ncols)):
+                if sample.iloc[:, i].astype(str).str.match(r'^\d{8}$').sum() >= max(1, int(0.3 * len(sample))):
+                    date_col = i
+                    break
+        if time_col is None:
+            for j in range(min(6, ncols)):
+                if sample.iloc[:, j].astype(str).str.match(r'^\d{1,9}$').sum() >= max(1, int(0.3 * len(sample))):
+                    if j != date_col:
+                        time_col = j
+                        break
+
+        return date_col, time_col
+
+    def _detect_layout(self, file_path):
+        """
+        Определяет структуру файла по его началу: разделитель, число колонок, колонки Date/Time.
+        Возвращает dict или None, если разделитель определить не удалось.
         """
-        Пытаемся прочитать файл различными разделителями.
+        lines = self._read_head_lines(file_path)
+        sep = self._sniff_separator(lines)
+        if sep is None:
+            return None
+        sample = pd.read_csv(io.StringIO('\n'.join(lines)), header=None, sep=sep, dtype=str, engine='c')
+        if sample.shape[1] < 2:
+            return None
+        return self._layout_from_sample(sample, sep)
+
+    def _layout_from_sample(self, sample, sep):
+        """
+        Структура файла по выборке строк: колонки Date/Time, формат даты (YYYYMMDD или другой)
+        и формат времени (HHMMSS или HHMMSSmmm)
+        """
+        date_col, time_col = self._detect_datetime_cols(sample)
+        layout = {'sep': sep, 'ncols': sample.shape[1], 'date_col': date_col, 'time_col': time_col,
+                  'date_yyyymmdd': False, 'time_has_ms': False}
+        if date_col is None or time_col is None:
+            return layout
+
+        date_s = sample.iloc[:, date_col].astype(str).str.strip()
+        layout['date_yyyymmdd'] = bool(date_s.str.match(r'^\d{8}$').sum() >= max(1, int(0.3 * len(date_s))))
+        layout['time_has_ms'] = self._time_has_ms(sample.iloc[:, time_col])
+        return layout
+
+    def _time_has_ms(self, time_s):
+        """
+        Формат времени файла по его началу: True - HHMMSSmmm (все значения от 7 цифр), False - HHMMSS.
+        Файл, где встречаются оба формата, не читается: время в нем нельзя разобрать однозначно
+        """
+        time_len = time_s.astype(str).str.extract(r'(\d+)')[0].dropna().str.len()
+        has_ms = time_len > 6
+        if has_ms.any() and not has_ms.all():
+            raise ValueError("в начале файла смешаны форматы времени HHMMSS и HHMMSSmmm")
+        return bool(has_ms.any())
+
+    def _head_sample(self, file_path, sep):
+        """Первые строки файла строками по известному разделителю"""
+        lines = self._read_head_lines(file_path)
+        return pd.read_csv(io.StringIO('\n'.join(lines)), header=None, sep=sep, dtype=str, engine='c')
+
+    def _column_dtype(self, colname):
+        """Тип колонки по схеме (цены - в self.price_dtype)"""
+        dtype = COLUMN_SCHEMA.get(colname)
+        if dtype == 'float64':
+            return self.price_dtype
+        return dtype
+
+    def _read_dtypes(self, layout):
+        """
+        Типы колонок файла по позициям: колонки схемы - по схеме,
+        Date (YYYYMMDD) и Time - целые числа, дата в другом формате - строка
+        """
+        datetime_cols = (layout['date_col'], layout['time_col'])
+        dtypes = {}
+        for i in range(min(layout['ncols'], len(self.column_names))):
+            dtype = self._column_dtype(self.column_names[i])
+            dtypes[i] = str if dtype is None or i in datetime_cols else dtype
+        dtypes[layout['date_col']] = 'int64' if layout['date_yyyymmdd'] else str
+        dtypes[layout['time_col']] = 'int64'
+        return dtypes
+
+    def _coerce_schema(self, df, layout, file_path):
+        """
+        Приводит строковые колонки к типам схемы (режим schema_policy='lenient').
+        Некорректные значения (и дробные в целочисленных колонках) становятся пустыми (NA),
+        целочисленные колонки с NA - типа Int64.
+        """
+        bad_values = 0
+        for i, dtype in self._read_dtypes(layout).items():
+            if dtype is str:
+                continue
+            raw = df[i].astype(str).str.strip()
+            values = pd.to_numeric(raw, errors='coerce')
+            if dtype == 'int64':
+                # Дробное значение в целочисленной колонке тоже некорректно: не обрезается до целого
+                values = values.where(values.isna() | (values == values.round()))
+            bad_values += int((values.isna() & df[i].notna() & (raw != '')).sum())
+            if dtype == 'int64':
+                df[i] = values.astype('Int64') if values.isna().any() else values.astype('int64')
+            else:
+                df[i] = values.astype(dtype)
+        if bad_values:
+            print(f"⚠️  {file_path}: некорректных значений {bad_values:,}, заменены на пустые")
+        return df
+
+    def _read_typed(self, file_path, layout):
+        """
+        Читает файл один раз C-движком сразу в типы схемы.
+        Если значения не приводятся к схеме: при schema_policy='strict' - ошибка,
+        при 'lenient' - файл читается строками и приводится с заменой некорректных значений на NA.
+        Python-движок используется только если C-движок не смог разобрать файл,
+        такие файлы запоминаются в self.python_engine_files.
+        """
+        sep = layout['sep']
+        dtypes = self._read_dtypes(layout)
+        usecols = sorted(dtypes)
+        try:
+            return self._read_csv(file_path, header=None, sep=sep, usecols=usecols, dtype=dtypes,
+                                  skipinitialspace=True, engine='c', low_memory=False)
+        except pd.errors.ParserError as e_c:
+            print(f"⚠️  C-движок не смог прочитать {file_path} (sep='{sep}'): {e_c}. Читаем python-движком (медленно).")
+            self.python_engine_files.append(str(file_path))
+            df = self._read_csv(file_path, header=None, sep=sep, usecols=usecols, dtype=str, engine='python')
+        except (ValueError, TypeError) as e:
+            if self.schema_policy == 'strict':
+                raise
+            if self.debug:
+                print(f"Файл {file_path} не соответствует схеме ({e}), приводим типы с заменой ошибок")
+            df = self._read_csv(file_path, header=None, sep=sep, usecols=usecols, dtype=str,
+                                engine='c', low_memory=False)
+        return self._coerce_schema(df, layout, file_path)
+
+    def _layout_key(self, contract, file_path):
+        """Ключ формата файла: файлы одного контракта и одной сессии имеют одинаковую структуру"""
+        session = 'NIGHT' if 'NIGHT' in os.path.dirname(str(file_path)).upper() else 'DAY'
+        return contract, session
+
+    def _read_raw(self, file_path, contract):
+        """
+        Читает файл контракта в типизированный DataFrame (колонки - позиции в файле).
+        Разделитель и колонки кэшируются по (контракт, сессия), а форматы даты и времени
+        определяются по началу каждого файла: если начало файла не совпадает со структурой
+        из кэша, структура определяется заново. Возвращает (df, layout) или None.
+        """
+        layout_key = self._layout_key(contract, file_path)
+        cached = self._layout_cache.get(layout_key)
+        if cached is not None:
+            try:
+                layout = self._layout_from_sample(self._head_sample(file_path, cached['sep']), cached['sep'])
+            except pd.errors.ParserError:
+                layout = None
+            if layout is not None and all(layout[key] == cached[key] for key in LAYOUT_STRUCTURE):
+                try:
+                    return self._read_typed(file_path, layout), layout
+                except Exception:
+                    # Формат файла мог отличаться от остальных файлов контракта - определяем заново
+                    if self._detect_layout(file_path) == layout:
+                        raise
+
+        layout = self._detect_layout(file_path)
+        if layout is None:
+            df_raw, used_sep, used_engine = self._try_read_file_all_seps(file_path)
+            if df_raw.shape[1] < 2:
+                print(f"Файл {file_path} имеет <2 столбцов, пропускаем.")
+                return None
+            layout = self._layout_from_sample(df_raw.head(SNIFF_LINES), used_sep)
+            if layout['date_col'] is None or layout['time_col'] is None:
+                print(f"Не удалось найти Date/Time в {file_path} (sep='{used_sep}', engine='{used_engine}'), пропускаем.")
+                return None
+            usecols = sorted(self._read_dtypes(layout))
+            return self._coerce_schema(df_raw[usecols].copy(), layout, file_path), layout
+
+        if layout['date_col'] is None or layout['time_col'] is None:
+            print(f"Не удалось найти Date/Time в {file_path} (sep='{layout['sep']}'), пропускаем.")
+            return None
+
+        if self.debug:
+            print(f"Файл {file_path}: sep='{layout['sep']}', cols={layout['ncols']}, "
+                  f"date_col={layout['date_col']}, time_col={layout['time_col']}")
+        df = self._read_typed(file_path, layout)
+        self._layout_cache[layout_key] = {key: layout[key] for key in LAYOUT_STRUCTURE}
+        return df, layout
+
+    def _missing_column(self, colname, index):
+        """Пустая колонка нужного типа для файлов, в которых меньше колонок, чем в схеме"""
+        dtype = self._column_dtype(colname)
+        if dtype == 'int64':
+            return pd.Series(pd.NA, index=index, dtype='Int64')
+        if dtype is None:
+            return pd.Series('', index=index, dtype=object)
+        return pd.Series(float('nan'), index=index, dtype=dtype)
+
+    def _try_read_file_all_seps(self, file_path):
+        """
+        Пытаемся прочитать файл различными разделителями (если разделитель не удалось определить по началу файла).
         Сначала пробуем engine='c' (с low_memory=False), при ошибке пробуем engine='python' (без low_memory).
         Возвращает (df, sep, engine)
         """
-        seps = [',', ';', '\t', '|']
+        seps = SEPARATORS
         last_exc = None
         for sep in seps:
             # сначала пробуем C-движок с low_memory=False
             try:
-                df_try = pd.read_csv(file_path, header=None, sep=sep, dtype=str, engine='c', low_memory=False)
+                df_try = self._read_csv(file_path, header=None, sep=sep, dtype=str, engine='c', low_memory=False)
                 if df_try.shape[1] > 1:
                     if self.debug:
                         print(f"Файл {file_path} прочитан с sep='{sep}' engine='c' cols={df_try.shape[1]}")
@@ -75,7 +540,7 @@ class FuturesConcatenator:
             except Exception as e_c:
                 # если C не прокатил — пробуем python engine (без low_memory)
                 try:
-                    df_try = pd.read_csv(file_path, header=None, sep=sep, dtype=str, engine='python')
+                    df_try = self._read_csv(file_path, header=None, sep=sep, dtype=str, engine='python')
                     if df_try.shape[1] > 1:
                         if self.debug:
                             print(f"Файл {file_path} прочитан с sep='{sep}' engine='python' cols={df_try.shape[1]}")
@@ -85,7 +550,7 @@ class FuturesConcatenator:
                     continue
         # если ничего не подошло — пробуем один последний раз с запятой и engine='c' (сгенерируем исключение, если не получилось)
         try:
-            df_try = pd.read_csv(file_path, header=None, sep=',', dtype=str, engine='c', low_memory=False)
+            df_try = self._read_csv(file_path, header=None, sep=',', dtype=str, engine='c', low_memory=False)
             return df_try, ',', 'c'
         except Exception as e:
             raise last_exc or e
@@ -107,187 +572,438 @@ class FuturesConcatenator:
         res = res.mask(parsed.isna(), pd.NA)
         return res
 
-    def process_ticker(self, ticker):
-        """Обрабатывает один тикер"""
-        ticker_dir = os.path.join(self.root_dir, ticker)
-        if not os.path.isdir(ticker_dir):
+    def _as_int_array(self, series):
+        """Колонка целых чисел -> np.int64, пропуски и некорректные значения -> -1"""
+        if series.dtype == 'int64':
+            return series.to_numpy()
+        values = pd.to_numeric(series, errors='coerce')
+        return values.fillna(-1).astype('int64').to_numpy()
+
+    def _read_contract_file(self, file_path, contract):
+        """Читает один файл контракта и приводит его к структуре итогового CSV. Возвращает DataFrame или None"""
+        raw = self._read_raw(file_path, contract)
+        if raw is None:
             return None
+        df_raw, layout = raw
+        date_col, time_col = layout['date_col'], layout['time_col']
+
+        # Дата и время -> наносекунды от эпохи целочисленной арифметикой
+        if layout['date_yyyymmdd']:
+            date_digits = self._as_int_array(df_raw[date_col])
+        else:
+            date_digits = self._as_int_array(self._normalize_date_series(df_raw[date_col]))
+        time_digits = self._as_int_array(df_raw[time_col])
+        ns, valid_idx = parse_date_time_ns(date_digits, time_digits, layout['time_has_ms'])
+
+        if not valid_idx.any():
+            print(f"В файле {file_path} не получилось распарсить DateTime ни для одной строки, пропускаем.")
+            return None
+
+        # Собираем итоговую таблицу (типизированные колонки, без копирования строк)
+        out = pd.DataFrame(index=df_raw.index[valid_idx])
+
+        for i, colname in enumerate(self.column_names):
+            if i in df_raw.columns:
+                values = df_raw[i][valid_idx]
+                if i in (date_col, time_col) and COLUMN_SCHEMA.get(colname):
+                    values = pd.to_numeric(values, errors='coerce')
+                out[colname] = values
+            else:
+                out[colname] = self._missing_column(colname, out.index)
+
+        # Время храним как int64 наносекунд; Date/Time - целые YYYYMMDD и HHMMSSmmm без строковых преобразований
+        out['DateTimeNs'] = ns[valid_idx]
+        out['DateTime'] = out['DateTimeNs'].to_numpy().view('datetime64[ns]')
+        out['Date'], out['Time'] = ns_to_date_time_digits(out['DateTimeNs'].to_numpy())
 
-        print(f"\n=== Обработка {ticker.upper()} ===")
-        contract_files = self.find_contract_files(ticker_dir)
+        return out.reset_index(drop=True)
+
+    def _plan_ticker(self, ticker):
+        """
+        Находит файлы тикера и строит график ролловера
+
+        :return: (контракты по экспирации, файлы по контрактам, график или None) или None, если файлов нет
+        """
+        if isinstance(self.root_dir, ArchiveSource):
+            print(f"\n=== Обработка {ticker.upper()} ===")
+            contract_files = self.root_dir.contract_files(ticker)
+        else:
+            ticker_dir = os.path.join(self.root_dir, ticker)
+            if not os.path.isdir(ticker_dir):
+                return None
+
+            print(f"\n=== Обработка {ticker.upper()} ===")
+            contract_files = self.find_contract_files(ticker_dir)
         if not contract_files:
             print("Файлы не найдены!")
             return None
 
         contract_data = {}
         expiry_dates = {}
+        data_dates = self._contract_data_dates(contract_files)
         for code, path in contract_files:
             contract_data.setdefault(code, []).append(path)
             if code not in expiry_dates:
-                expiry_dates[code] = self.parse_contract_expiry(code)
+                expiry_dates[code] = self.parse_contract_expiry(code, data_dates.get(code))
 
         sorted_contracts = sorted(
             expiry_dates.keys(),
             key=lambda x: expiry_dates.get(x) or datetime.max.date()
         )
 
-        continuous_data = []
-        used_contracts = set()
+        schedule = None
+        if self.roll_rule == 'calendar':
+            schedule = self.build_roll_schedule(sorted_contracts, expiry_dates)
+            if schedule is None:
+                print("⚠️  Не удалось определить экспирацию контрактов, склеиваем без ролловера")
+            else:
+                unknown = [c for c in sorted_contracts if not expiry_dates.get(c)]
+                if unknown:
+                    print(f"⚠️  Неизвестная экспирация, контракты пропущены: {unknown}")
+
+        return sorted_contracts, contract_data, schedule
+
+    def _iter_contract_frames(self, sorted_contracts, contract_data, schedule, skipped_files):
+        """
+        Читает файлы контрактов по одному (в порядке экспирации) и оставляет строки окна активности
 
+        :param skipped_files: список, в который добавляются файлы вне окон активности
+        :return: генератор (контракт, DataFrame) с колонкой Contract
+        """
         for contract in sorted_contracts:
             files = contract_data[contract]
             files.sort()
+            if schedule is not None and contract not in schedule[1]:
+                skipped_files.extend(files)
+                continue
             for file_path in files:
+                if schedule is not None and not self._file_in_window(file_path, contract, schedule):
+                    skipped_files.append(file_path)
+                    continue
                 try:
-                    df_raw, used_sep, used_engine = self._try_read_file(file_path)
-                    df_raw = df_raw.fillna('').apply(lambda col: col.str.strip() if col.dtype == 'object' else col)
-
-                    ncols = df_raw.shape[1]
-                    if ncols < 2:
-                        print(f"Файл {file_path} имеет <2 столбцов, пропускаем.")
+                    out = self._read_contract_file(file_path, contract)
+                    if out is None:
                         continue
+                    if schedule is not None:
+                        out = out[self._active_mask(out, contract, schedule)]
+                        if out.empty:
+                            continue
+                    out = out.assign(Contract=pd.Categorical.from_codes(
+                        np.full(len(out), sorted_contracts.index(contract)), categories=sorted_contracts))
+                    yield contract, out
+
+                except ARCHIVE_READ_ERRORS as e:
+                    if isinstance(file_path, ArchiveMember):
+                        # Архив не прочитался: пропуск файла молча потерял бы строки тикера
+                        raise RuntimeError(f"Ошибка чтения {file_path} из архива: {e}") from e
+                    print(f"Ошибка при чтении {file_path}: {e}")
+                except Exception as e:
+                    print(f"Ошибка при чтении {file_path}: {e}")
 
-                    # Находим пару колонок Date/Time (соседние колонки, где одна похожа на дату)
-                    date_col = None
-                    time_col = None
-                    max_check = min(6, ncols - 1)
-                    for i in range(max_check):
-                        col_date = df_raw.iloc[:, i].astype(str).str.strip()
-                        col_time = df_raw.iloc[:, i + 1].astype(str).str.strip()
-                        date_like = col_date.str.match(r'^\d{6,8}$')
-                        time_like = col_time.str.match(r'^\d{1,9}$')
-                        if date_like.sum() >= max(1, int(0.3 * len(col_date))) and time_like.sum() >= max(1, int(0.3 * len(col_time))):
-                            date_col = i
-                            time_col = i + 1
-                            break
-
-                    # Доп. эвристики
-                    if date_col is None:
-                        for i in range(min(6, ncols)):
-                            if df_raw.iloc[:, i].astype(str).str.match(r'^\d{8}$').sum() >= max(1, int(0.3 * len(df_raw))):
-                                date_col = i
-                                break
-                    if time_col is None:
-                        for j in range(min(6, ncols)):
-                            if df_raw.iloc[:, j].astype(str).str.match(r'^\d{1,9}$').sum() >= max(1, int(0.3 * len(df_raw))):
-                                if j != date_col:
-                                    time_col = j
-                                    break
-
-                    if date_col is None or time_col is None:
-                        print(f"Не удалось найти Date/Time в {file_path} (sep='{used_sep}', engine='{used_engine}'), пропускаем.")
-                        continue
+    def _schedule_filter(self, schedule):
+        """Фильтр строк по графику ролловера для таблиц с колонкой Contract"""
+        def keep_active(df):
+            return df[self._active_mask(df, df['Contract'].to_numpy().astype(object), schedule)]
+        return keep_active
+
+    def _print_ticker_summary(self, schedule, skipped_files, start, end, used_contracts, rows):
+        if schedule is not None:
+            table = self.active_contract_table(schedule, start.date(), end.date())
+            rolls = table[table['Contract'] != table['Contract'].shift()]
+            print(f"- Ролловер ({self.roll_rule}): " +
+                  ", ".join(f"{row.Date:%Y-%m-%d} -> {row.Contract}" for row in rolls.itertuples()))
+        if skipped_files:
+            print(f"- Файлов вне окон активности (не читались): {len(skipped_files)}")
+        print(f"- Период данных: {start} - {end}")
+        print(f"- Использовано контрактов: {sorted(used_contracts)}")
+        print(f"- Всего строк: {rows:,}")
 
-                    if self.debug:
-                        print(f"Файл {file_path}: найден date_col={date_col}, time_col={time_col}, sep='{used_sep}', engine='{used_engine}'")
-
-                    # Нормализуем дату и время
-                    date_s = df_raw.iloc[:, date_col].astype(str).str.strip()
-                    time_digits = df_raw.iloc[:, time_col].astype(str).str.extract(r'(\d+)')[0].fillna('')
-
-                    normalized_date = self._normalize_date_series(date_s)
-
-                    mask_ms = time_digits.str.len() > 6
-                    mask_hms = ~mask_ms
-
-                    dt_series = pd.Series(pd.NaT, index=df_raw.index)
-
-                    # HHMMSS
-                    if mask_hms.any():
-                        time_hms = time_digits[mask_hms].str.zfill(6)
-                        dt_hms = pd.to_datetime(
-                            normalized_date[mask_hms].fillna('') + ' ' + time_hms,
-                            format='%Y%m%d %H%M%S',
-                            errors='coerce'
-                        )
-                        dt_series.loc[mask_hms] = dt_hms
-
-                    # HHMMSSmmm -> mmm -> микросекунды mmm000
-                    if mask_ms.any():
-                        time_ms = time_digits[mask_ms].str.zfill(9).str[:9]
-                        hhmmss = time_ms.str[:-3]
-                        mmm = time_ms.str[-3:]
-                        micro = mmm + '000'
-                        dt_ms = pd.to_datetime(
-                            normalized_date[mask_ms].fillna('') + ' ' + hhmmss + micro,
-                            format='%Y%m%d %H%M%S%f',
-                            errors='coerce'
-                        )
-                        dt_series.loc[mask_ms] = dt_ms
-
-                    valid_idx = dt_series.notna()
-                    if valid_idx.sum() == 0:
-                        print(f"В файле {file_path} не получилось распарсить DateTime ни для одной строки, пропускаем.")
-                        continue
+    def process_ticker(self, ticker):
+        """Обрабатывает один тикер"""
+        plan = self._plan_ticker(ticker)
+        if plan is None:
+            return None
+        sorted_contracts, contract_data, schedule = plan
 
-                    # Собираем итоговую таблицу
-                    out = pd.DataFrame(index=df_raw.index[valid_idx])
+        skipped_files = []
+        frames = list(self._iter_contract_frames(sorted_contracts, contract_data, schedule, skipped_files))
 
-                    for i, colname in enumerate(self.column_names):
-                        if i < ncols:
-                            out[colname] = df_raw.iloc[:, i].astype(str).str.strip()[valid_idx].astype(str)
-                        else:
-                            out[colname] = ''
+        if self.roll_rule == 'volume' and frames:
+            daily = {}
+            for contract, out in frames:
+                self._add_daily_volume(daily, contract, out)
+            schedule = self._volume_roll_schedule(daily, sorted_contracts)
+            keep_active = self._schedule_filter(schedule)
+            frames = [(contract, keep_active(out)) for contract, out in frames]
+            frames = [(contract, out) for contract, out in frames if not out.empty]
 
-                    out['DateTime'] = pd.to_datetime(dt_series[valid_idx])
-                    out['Date'] = out['DateTime'].dt.strftime('%Y%m%d')
-                    out['Time'] = out['DateTime'].dt.strftime('%H%M%S%f').str[:9]  # HHMMSSmmm
+        if not frames:
+            print("Нет данных для обработки!")
+            return None
 
-                    continuous_data.append(out.reset_index(drop=True))
-                    used_contracts.add(contract)
+        used_contracts = {contract for contract, _ in frames}
+        result_df = pd.concat([out for _, out in frames], ignore_index=True, sort=False)
+        result_df = result_df.sort_values('DateTime', kind='stable', ignore_index=True)
 
-                except Exception as e:
-                    print(f"Ошибка при чтении {file_path}: {e}")
+        self._print_ticker_summary(schedule, skipped_files, result_df['DateTime'].min(),
+                                   result_df['DateTime'].max(), used_contracts, len(result_df))
+
+        return result_df, used_contracts
+
+    def output_columns(self):
+        """Колонки склеенных данных в выбранном формате"""
+        if self.output_format == 'csv':
+            return self.column_names + ['DateTimeNs', 'Contract']
+        return ['DateTime'] + self.column_names[2:] + ['Contract']
 
-        if not continuous_data:
+    def _export_frame(self, df):
+        """Подготовка к записи: в CSV время пишется как HHMMSSmmm с ведущими нулями"""
+        if self.output_format != 'csv':
+            return df
+        return df.assign(Time=df['Time'].astype(str).str.zfill(9))
+
+    def glue_ticker_out_of_core(self, ticker, out_file):
+        """
+        Склейка тикера с ограниченной памятью: каждый файл контракта сортируется и сбрасывается
+        на диск отдельным прогоном, затем прогоны сливаются потоково и результат пишется частями
+        (и/или сразу идет в candle_generator порциями).
+        Результат совпадает с process_ticker + сохранение в output_format.
+
+        :return: (словарь статистики как в summary_stats, список записанных файлов) или None, если данных нет
+        """
+        plan = self._plan_ticker(ticker)
+        if plan is None:
+            return None
+        sorted_contracts, contract_data, schedule = plan
+
+        skipped_files = []
+        daily = {}
+        with SpillDirectory(self.spill_dir, self.spill_block_rows) as spill:
+            runs = []
+            for contract, out in self._iter_contract_frames(sorted_contracts, contract_data, schedule, skipped_files):
+                if self.roll_rule == 'volume':
+                    self._add_daily_volume(daily, contract, out)
+                runs.append(spill.spill(out, 'DateTime'))
+
+            block_filter = None
+            if self.roll_rule == 'volume' and runs:
+                schedule = self._volume_roll_schedule(daily, sorted_contracts)
+                block_filter = self._schedule_filter(schedule)
+
+            summary = {'start': None, 'end': None, 'rows': 0, 'contracts': set()}
+            writer_context = GluedWriter(out_file, self.output_columns(), self.output_format, self.index_period) \
+                if self.write_glued else nullcontext()
+            with writer_context as writer:
+                def batches():
+                    for batch in merge_runs(runs, 'DateTime', block_filter):
+                        if writer is not None:
+                            writer.write(self._export_frame(batch))
+                        summary['contracts'].update(batch['Contract'].unique())
+                        if summary['start'] is None:
+                            summary['start'] = batch['DateTime'].iloc[0]
+                        summary['end'] = batch['DateTime'].iloc[-1]
+                        summary['rows'] += len(batch)
+                        yield batch
+
+                merged = batches()
+                candle_files = []
+                if self.candle_generator is not None:
+                    candle_files = self.candle_generator.process_frames(ticker, merged) or []
+                # Дочитываем слияние до конца (генератор свечей мог остановиться раньше)
+                for _ in merged:
+                    pass
+
+        if not summary['rows']:
             print("Нет данных для обработки!")
             return None
 
-        result_df = pd.concat(continuous_data, ignore_index=True, sort=False).sort_values('DateTime')
-        print(f"- Период данных: {result_df['DateTime'].min()} - {result_df['DateTime'].max()}")
-        print(f"- Использовано контрактов: {sorted(used_contracts)}")
-        print(f"- Всего строк: {len(result_df):,}")
+        self._print_ticker_summary(schedule, skipped_files, summary['start'], summary['end'],
+                                   summary['contracts'], summary['rows'])
+        outputs = candle_files
+        if self.write_glued:
+            print(f"Файл сохранен: {out_file}")
+            outputs = [out_file] + ([writer.index_file] if writer.index_file else []) + candle_files
+        stats = {
+            "Ticker": ticker,
+            "StartDate": summary['start'],
+            "EndDate": summary['end'],
+            "Rows": summary['rows'],
+            "Contracts": len(summary['contracts'])
+        }
+        return stats, outputs
+
+    def _ticker_fingerprint(self, ticker, manifest):
+        """Отпечаток входных данных тикера (папка тикера или архивы с его файлами) и настроек склейки"""
+        if isinstance(self.root_dir, ArchiveSource):
+            archives = sorted({member.outer or member.inner for _, member in self.root_dir.contract_files(ticker)})
+            parts = [(archive, manifest.fingerprint(archive)) for archive in archives]
+            digest = hashlib.sha1(repr(parts).encode('utf-8')).hexdigest()
+            return {'archives': len(archives), 'digest': digest, **self._glue_settings()}
+        return manifest.fingerprint(os.path.join(self.root_dir, ticker), **self._glue_settings())
+
+    def _glue_settings(self):
+        """Настройки, от которых зависит результат склейки (для манифеста)"""
+        settings = {'rollover_days': self.rollover_days, 'roll_rule': self.roll_rule,
+                    'index_period': self.index_period, 'output_format': self.output_format,
+                    'price_dtype': str(self.price_dtype), 'schema_policy': self.schema_policy}
+        if self.candle_generator is not None:
+            # Совмещенный режим: результат - еще и свечи
+            settings.update(candles=self.candle_generator.settings(), write_glued=self.write_glued)
+        return settings
+
+    def glue_ticker(self, ticker, output_dir):
+        """
+        Склеивает тикер и сохраняет результат в output_dir/<тикер>/.
+        С candle_generator свечи строятся из склеенных данных в памяти, без чтения файла.
 
-        return result_df, used_contracts
+        :return: (статистика для summary_stats, список записанных файлов) или None, если данных нет
+        """
+        out_file = glued_path(os.path.join(output_dir, ticker), ticker, self.output_format)
+        with metrics.measure('glue', ticker, bytes_read=lambda: self._input_bytes(ticker)) as event:
+            result = self._glue_ticker(ticker, out_file)
+            if result is not None:
+                stats, outputs = result
+                event['rows'] = stats['Rows']
+                event['contracts'] = stats['Contracts']
+                event['bytes_written'] = lambda: sum(metrics.file_size(path) for path in outputs)
+            return result
+
+    def _glue_ticker(self, ticker, out_file):
+        if self.out_of_core:
+            return self.glue_ticker_out_of_core(ticker, out_file)
+
+        result = self.process_ticker(ticker)
+        if result is None:
+            return None
+        df, used = result
+
+        outputs = []
+        if self.write_glued:
+            # Сохраняем колонки в нужном порядке
+            with GluedWriter(out_file, self.output_columns(), self.output_format, self.index_period) as writer:
+                writer.write(self._export_frame(df))
+            print(f"Файл сохранен: {out_file}")
+            outputs.append(out_file)
+            if writer.index_file:
+                outputs.append(writer.index_file)
+        if self.candle_generator is not None:
+            outputs += self.candle_generator.process_frame(ticker, df) or []
+
+        stats = {
+            "Ticker": ticker,
+            "StartDate": df["DateTime"].min(),
+            "EndDate": df["DateTime"].max(),
+            "Rows": len(df),
+            "Contracts": len(used)
+        }
+        return stats, outputs
+
+    def _input_bytes(self, ticker):
+        """Объем прочитанных CSV тикера в байтах (для метрик; при чтении из архивов неизвестен)"""
+        if isinstance(self.root_dir, ArchiveSource):
+            return None
+        return metrics.file_size(os.path.join(self.root_dir, ticker))
+
+    def _ticker_size(self, ticker):
+        """Объем входных данных тикера (для порядка параллельной обработки)"""
+        if isinstance(self.root_dir, ArchiveSource):
+            return len(self.root_dir.contract_files(ticker))
+        total = 0
+        for root, dirs, files in os.walk(os.path.join(self.root_dir, ticker)):
+            for file in files:
+                total += os.path.getsize(os.path.join(root, file))
+        return total
+
+    def process_all(self, output_dir, manifest=None, jobs=1):
+        """
+        Обрабатывает все тикеры в корне
 
-    def process_all(self, output_dir):
-        """Обрабатывает все тикеры в корне"""
+        manifest – RunManifest: если указан, тикеры с неизменившимися входными файлами не пересклеиваются
+        jobs – количество процессов: тикеры склеиваются параллельно, самые большие - первыми
+               (None - по числу ядер, 1 - последовательно в текущем процессе)
+        """
         if not os.path.exists(output_dir):
             os.makedirs(output_dir)
 
-        tickers = [d for d in os.listdir(self.root_dir) if os.path.isdir(os.path.join(self.root_dir, d))]
+        tickers = self._list_tickers()
         print("Найденные тикеры:", tickers)
 
-        total_stats = []
+        results = {}
+        fingerprints = {}
+        pending = []
         for ticker in tickers:
-            result = self.process_ticker(ticker)
-            if result is None:
+            fp = self._ticker_fingerprint(ticker, manifest) if manifest is not None else None
+            if manifest is not None and manifest.is_current('glue', ticker, fp):
+                print(f"\n=== {ticker.upper()}: входные файлы не изменились, пропускаем ===")
+                stats = manifest.info('glue', ticker).get('stats')
+                if stats:
+                    results[ticker] = stats
                 continue
-            df, used = result
-
-            ticker_out_dir = os.path.join(output_dir, ticker)
-            os.makedirs(ticker_out_dir, exist_ok=True)
+            fingerprints[ticker] = fp
+            pending.append(ticker)
 
-            # Сохраняем CSV с колонками в нужном порядке (без дополнительного 'Contract')
-            out_df = df[self.column_names]
-            out_file = os.path.join(ticker_out_dir, f"{ticker}.csv")
-            out_df.to_csv(out_file, index=False, sep=';', encoding='utf-8-sig')
-            print(f"Файл сохранен: {out_file}")
-
-            total_stats.append({
-                "Ticker": ticker,
-                "StartDate": df["DateTime"].min(),
-                "EndDate": df["DateTime"].max(),
-                "Rows": len(df),
-                "Contracts": len(used)
-            })
+        def ticker_done(ticker, result):
+            if result is None:
+                return
+            stats, outputs = result
+            results[ticker] = stats
+            if manifest is not None:
+                manifest.mark_done('glue', ticker, fingerprints[ticker], outputs=outputs, stats=stats)
+
+        jobs = jobs or os.cpu_count() or 1
+        if jobs == 1 or len(pending) <= 1:
+            for ticker in pending:
+                try:
+                    ticker_done(ticker, self.glue_ticker(ticker, output_dir))
+                except Exception as e:
+                    print(f"⚠️  Ошибка при склейке {ticker}: {e}")
+        else:
+            pending.sort(key=self._ticker_size, reverse=True)
+            print(f"⚙️  Процессов: {jobs}")
+            with ProcessPoolExecutor(max_workers=jobs) as executor:
+                futures = {executor.submit(_glue_ticker_worker, self, ticker, output_dir): ticker
+                           for ticker in pending}
+                for future in as_completed(futures):
+                    ticker = futures[future]
+                    try:
+                        result, python_engine_files = future.result()
+                        self.python_engine_files.extend(python_engine_files)
+                        ticker_done(ticker, result)
+                    except Exception as e:
+                        print(f"⚠️  Ошибка при склейке {ticker}: {e}")
+
+        self.save_summary_stats(tickers, results, output_dir)
+        self.print_python_engine_files()
+
+    def save_summary_stats(self, tickers, results, output_dir):
+        """
+        Сохраняет summary_stats.csv
 
+        :param tickers: тикеры в порядке строк
+        :param results: словарь тикер -> статистика склейки
+        """
+        total_stats = [results[ticker] for ticker in tickers if ticker in results]
         if total_stats:
             stats_df = pd.DataFrame(total_stats)
+            # Статистика пропущенных тикеров берется из манифеста в виде строк
+            stats_df["StartDate"] = pd.to_datetime(stats_df["StartDate"], format="ISO8601")
+            stats_df["EndDate"] = pd.to_datetime(stats_df["EndDate"], format="ISO8601")
             stats_path = os.path.join(output_dir, "summary_stats.csv")
             stats_df.to_csv(stats_path, index=False, sep=';', encoding='utf-8-sig')
             print(f"\nСводная статистика сохранена в {stats_path}")
 
+    def print_python_engine_files(self):
+        if self.python_engine_files:
+            print(f"\n⚠️  Файлов, прочитанных медленным python-движком: {len(self.python_engine_files)}")
+            for file_path in self.python_engine_files:
+                print(f"   {file_path}")
+
+
+def _glue_ticker_worker(concatenator, ticker, output_dir):
+    """Склейка одного тикера в отдельном процессе: результат и файлы, прочитанные python-движком"""
+    concatenator.python_engine_files = []
+    return concatenator.glue_ticker(ticker, output_dir), concatenator.python_engine_files
+
 
 '''if __name__ == "__main__":
     ROOT_DIR = "D:\\Data\\TickersData"
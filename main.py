@@ -2,32 +2,46 @@
 import os
 
 from globalUnarchiver import NestedArchiveExtractor
-from unarchiver import find_all_tickers, extract_and_organize_sequential
+from catalog import ArchiveCatalog
+from archivefs import ArchiveSource
+from manifest import RunManifest
+from unarchiver import find_all_tickers, extract_and_organize_sequential, extract_and_organize_parallel
 from gluer import FuturesConcatenator
 from converter import FinamTxtCandleGenerator
+from sessions import load_holidays
+from pipeline import run_pipelined
+import metrics
 
-def main():
+def run_unarchiving(input_directory, manifest, organize=True):
+    """
+    Шаги 1-2: разархивация и организация по тикерам.
+    Возвращает (папка с тикерами, папка разархивированных данных, тикеры, каталог) или None
+
+    :param organize: False - шаг 2 только находит тикеры, организацию выполняет конвейер
+    """
     # Шаг 1: Разархивация
     print("🚀 Запуск разархивации...")
     extractor = NestedArchiveExtractor()
-    input_directory = "D:\\Data\\ChinaData"
     unarchived_directory = "D:\\Data\\Unarchived"  # Output для разархивации, input для организации
 
     try:
-        extractor.process_directory(input_directory, unarchived_directory)
+        extractor.process_directory(input_directory, unarchived_directory, manifest=manifest)
     except Exception as e:
         print(f"Произошла ошибка в разархивации: {e}")
-        return
+        return None
 
     # Шаг 2: Поиск тикеров и организация
     print("\n🚀 Запуск организации по тикерам...")
     tickers_directory = "D:\\Data\\TickersData"  # Output для организации, input для склейки
+    organize_jobs = None  # Количество процессов для организации (None - все ядра, 1 - последовательно)
+    catalog_path = "D:\\Data\\catalog.sqlite"  # Каталог содержимого архивов (ускоряет повторные запуски)
 
     if not os.path.exists(unarchived_directory):
         print("❌ Директория с разархивированными файлами не существует!")
-        return
+        return None
 
-    tickers = find_all_tickers(unarchived_directory)
+    catalog = ArchiveCatalog(catalog_path)
+    tickers = find_all_tickers(unarchived_directory, catalog=catalog)
 
     print("=" * 50)
     print(f"📊 Найдено уникальных тикеров: {len(tickers)}")
@@ -35,28 +49,120 @@ def main():
     for i, ticker in enumerate(tickers, 1):
         print(f"{i:3d}. {ticker}")
 
-    if tickers:
-        extract_and_organize_sequential(unarchived_directory, tickers_directory, tickers)
-    else:
+    if not tickers:
         print("❌ Тикеры не найдены!")
-        return
+        return None
+
+    if organize:
+        if organize_jobs == 1:
+            extract_and_organize_sequential(unarchived_directory, tickers_directory, tickers, catalog=catalog,
+                                            manifest=manifest)
+        else:
+            extract_and_organize_parallel(unarchived_directory, tickers_directory, tickers, jobs=organize_jobs,
+                                          catalog=catalog, manifest=manifest)
+
+    return tickers_directory, unarchived_directory, tickers, catalog
+
+
+def main():
+    input_directory = "D:\\Data\\ChinaData"
+    # True - склейка читает CSV прямо из исходных архивов, шаги 1-2 пропускаются и диск под них не нужен
+    in_place = False
+    # Папка для распаковки сжатых вложенных архивов при in_place (zip со сжатием, .tar.gz/.tar.bz2) - нужно
+    # место на диске размером с вложенные архивы; None - читаются только несжатые (zip без сжатия, tar)
+    in_place_cache_dir = None
+    # Манифест запусков: повторный запуск обрабатывает только новые/измененные данные
+    # и продолжает прерванный запуск с места остановки
+    manifest = RunManifest("D:\\Data\\manifest.json")
+    # Процессов для склейки и генерации свечей (тикеры независимы); None - по числу ядер, 1 - последовательно
+    ticker_jobs = None
+    # True - шаги 2-4 идут одновременно конвейером: тикер склеивается, как только организованы все архивы
+    # с его файлами, а свечи строятся сразу после склейки
+    pipelined = False
+    pipeline_glue_workers = 2  # Потоков склейки в конвейере
+    pipeline_candle_workers = 2  # Потоков генерации свечей в конвейере
+    # Метрики этапов (время, память, строки и байты по каждому архиву и тикеру) в JSON-lines; None - не писать
+    metrics_file = "D:\\Data\\metrics.jsonl"
+    # Профилирование: None, 'cprofile' (файл .prof на каждый архив/тикер) или 'tracemalloc' (пик Python-памяти)
+    profile_mode = None
+    profile_stages = None  # Этапы для профилирования, например ['glue']; None - все
+    metrics.configure(metrics_file, profile=profile_mode, profile_stages=profile_stages)
+
+    catalog = None
+    if in_place:
+        # Склейка читает исходные архивы, папки организованных данных нет
+        unarchived_directory = ArchiveSource(input_directory, cache_dir=in_place_cache_dir)
+        tickers_directory = None
+        glue_input = unarchived_directory
+        tickers = unarchived_directory.tickers()
+    else:
+        unarchived = run_unarchiving(input_directory, manifest, organize=not pipelined)
+        if unarchived is None:
+            return
+        tickers_directory, unarchived_directory, tickers, catalog = unarchived
+        glue_input = tickers_directory
 
     # Шаг 3: Склейка данных по контрактам
-    print("\n🚀 Запуск склейки данных...")
     glued_directory = "D:\\Data\\GluedData"  # Output для склейки, input для генерации свечей
     rollover_days = 5
     debug_mode = False
-
-    concatenator = FuturesConcatenator(tickers_directory, rollover_days, debug=debug_mode)
-    concatenator.process_all(output_dir=glued_directory)
+    # True - склейка с ограниченной памятью через временные файлы на диске (для очень длинных историй)
+    out_of_core = False
+    # Формат склеенных данных: 'csv' (для экспорта), 'memmap' (только NumPy), 'parquet'/'feather' (нужен pyarrow).
+    # Генератор свечей читает бинарные форматы намного быстрее CSV
+    glued_format = 'csv'
+    # Индекс времени рядом со склеенными данными: 'day', 'hour' или None. Чтение диапазона дат
+    # (окно свечей ниже, FinamTxtCandleGenerator.read_range) переходит сразу к нужному участку файла
+    glued_index_period = 'day'
 
     # Шаг 4: Генерация свечей в TXT-формате
-    print("\n🚀 Запуск генерации свечей...")
     candle_directory = "D:\\Data\\CandleData"  # Output для свечей
     timeframes = ['Min1', 'Min5', 'Min15', 'Hour1', 'Hour4', 'Day']  # Можно изменить список
 
-    generator = FinamTxtCandleGenerator(glued_directory, candle_directory, timeframes)
-    generator.process_all()
+    price_precision = 2  # Знаков после запятой в ценах (увеличить для инструментов с шагом цены меньше 0.01)
+
+    # Окно пересборки свечей [начало, конец), например '2024-03-01', '2024-04-01'; None - вся история
+    candle_start = None
+    candle_end = None
+
+    # Размер порции (строк) для потоковой генерации свечей; None - файл тикера читается целиком
+    candle_chunk_rows = None
+
+    # Объем свечей: 'delta' - приращения накопленного TotalVolume, 'trade' - TradeVolume, 'total' - как раньше
+    volume_mode = 'delta'
+
+    # True - Day и Hour4 по торговым сессиям (ночная сессия входит в следующий торговый день)
+    trading_sessions = False
+    holidays_file = None  # Файл праздников (по дате YYYYMMDD в строке) для календаря сессий
+    holidays = load_holidays(holidays_file) if holidays_file else ()
+
+    # True - свечи строятся сразу из склеенных данных в памяти (шаги 3-4 вместе, без чтения GluedData)
+    fused = False
+    # False (только при fused) - склеенные данные не сохраняются, если нужны только свечи
+    write_glued = True
+
+    generator = FinamTxtCandleGenerator(glued_directory, candle_directory, timeframes, price_precision,
+                                        chunk_rows=candle_chunk_rows, volume_mode=volume_mode,
+                                        trading_sessions=trading_sessions, holidays=holidays,
+                                        start=candle_start, end=candle_end)
+    concatenator = FuturesConcatenator(glue_input, rollover_days, debug=debug_mode, out_of_core=out_of_core,
+                                       output_format=glued_format, candle_generator=generator if fused else None,
+                                       write_glued=write_glued or not fused, index_period=glued_index_period)
+
+    if pipelined:
+        print("\n🚀 Запуск конвейера: организация, склейка и генерация свечей...")
+        run_pipelined(unarchived_directory, tickers, tickers_directory, concatenator, glued_directory, generator,
+                      catalog=catalog, manifest=manifest, glue_workers=pipeline_glue_workers,
+                      candle_workers=pipeline_candle_workers)
+    else:
+        print("\n🚀 Запуск склейки данных" + (" и генерации свечей..." if fused else "..."))
+        concatenator.process_all(output_dir=glued_directory, manifest=manifest, jobs=ticker_jobs)
+        if not fused:
+            print("\n🚀 Запуск генерации свечей...")
+            generator.process_all(manifest=manifest, jobs=ticker_jobs)
+    manifest.save()  # переносит журнал манифеста в сам манифест
+
+    metrics.print_summary()
 
     # Финальная пауза
     input("Нажмите Enter для выхода...")
@@ -0,0 +1,137 @@
+import hashlib
+import json
+import os
+import threading
+import time
+
+
+HASH_BUFFER_SIZE = 16 * 1024 * 1024
+# Журнал рядом с манифестом: завершенные записи дописываются по одной строке
+JOURNAL_SUFFIX = '.journal'
+
+
+def _file_hash(path):
+    digest = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(HASH_BUFFER_SIZE), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def fingerprint(path, use_hash=False, **extra):
+    """
+    Отпечаток файла или папки: размер, время модификации и (опционально) хэш содержимого.
+    Для папки отпечаток собирается по всем вложенным файлам.
+
+    :param extra: дополнительные параметры, изменение которых тоже должно вызывать пересчет
+    """
+    if os.path.isdir(path):
+        digest = hashlib.sha1()
+        files = 0
+        total_size = 0
+        for root, dirs, names in os.walk(path):
+            dirs.sort()
+            for name in sorted(names):
+                full_path = os.path.join(root, name)
+                stat = os.stat(full_path)
+                entry = [os.path.relpath(full_path, path), stat.st_size, stat.st_mtime_ns]
+                if use_hash:
+                    entry.append(_file_hash(full_path))
+                digest.update(repr(entry).encode('utf-8'))
+                files += 1
+                total_size += stat.st_size
+        result = {'files': files, 'size': total_size, 'digest': digest.hexdigest()}
+    else:
+        stat = os.stat(path)
+        result = {'size': stat.st_size, 'mtime': stat.st_mtime_ns}
+        if use_hash:
+            result['sha1'] = _file_hash(path)
+
+    result.update(extra)
+    return result
+
+
+class RunManifest:
+    def __init__(self, path, use_hash=False):
+        """
+        Манифест запусков конвейера: для каждого этапа хранит отпечатки входов и список выходов.
+        Позволяет пропускать неизменившиеся входы и продолжать прерванный запуск.
+
+        Каждая завершенная запись дописывается строкой в журнал (<path>.journal), а не переписывает
+        весь манифест. Журнал переносится в манифест при save() и при следующей загрузке.
+
+        :param path: Путь к JSON-файлу манифеста
+        :param use_hash: Сравнивать входы также по хэшу содержимого (медленнее, но надежнее)
+        """
+        self.path = path
+        self.journal_path = path + JOURNAL_SUFFIX
+        self.use_hash = use_hash
+        self.data = {'stages': {}}
+        # Манифест может обновляться из нескольких потоков (конвейерный режим)
+        self._lock = threading.RLock()
+        if os.path.exists(path):
+            try:
+                with open(path, 'r', encoding='utf-8') as f:
+                    self.data = json.load(f)
+            except Exception as e:
+                print(f"⚠️  Не удалось прочитать манифест {path}: {e}. Начинаем с нуля.")
+        if os.path.exists(self.journal_path):
+            self._replay_journal()
+            self.save()
+
+    def _replay_journal(self):
+        """Применяет записи журнала прерванного или незавершенного запуска"""
+        with open(self.journal_path, 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    stage, key, entry = json.loads(line)
+                except ValueError:
+                    continue  # строка, недописанная при аварийном завершении
+                self.data['stages'].setdefault(stage, {})[key] = entry
+
+    def fingerprint(self, path, **extra):
+        return fingerprint(path, use_hash=self.use_hash, **extra)
+
+    def _entry(self, stage, key):
+        return self.data['stages'].get(stage, {}).get(str(key))
+
+    def is_current(self, stage, key, fp):
+        """True, если вход не менялся с прошлого успешного запуска и все выходы на месте"""
+        entry = self._entry(stage, key)
+        if entry is None or entry.get('fingerprint') != fp:
+            return False
+        return all(os.path.exists(p) for p in entry.get('outputs', []))
+
+    def info(self, stage, key):
+        """Дополнительные данные, сохраненные вместе с записью"""
+        entry = self._entry(stage, key)
+        return entry.get('info', {}) if entry else {}
+
+    def mark_done(self, stage, key, fp, outputs=(), **info):
+        """Записывает успешную обработку входа: одна строка в журнал, без перезаписи всего манифеста"""
+        entry = {
+            'fingerprint': fp,
+            'outputs': [str(p) for p in outputs],
+            'info': info,
+            'finished': time.strftime('%Y-%m-%d %H:%M:%S'),
+        }
+        line = json.dumps([stage, str(key), entry], ensure_ascii=False, default=str) + '\n'
+        with self._lock:
+            self.data['stages'].setdefault(stage, {})[str(key)] = entry
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            with open(self.journal_path, 'a', encoding='utf-8') as f:
+                f.write(line)
+
+    def save(self):
+        """
+        Атомарно сохраняет манифест целиком и очищает журнал: прерванный запуск не оставит испорченный файл
+        """
+        with self._lock:
+            manifest_dir = os.path.dirname(os.path.abspath(self.path))
+            os.makedirs(manifest_dir, exist_ok=True)
+            temp_path = f"{self.path}.tmp"
+            with open(temp_path, 'w', encoding='utf-8') as f:
+                json.dump(self.data, f, ensure_ascii=False, indent=1, default=str)
+            os.replace(temp_path, self.path)
+            if os.path.exists(self.journal_path):
+                os.remove(self.journal_path)
@@ -0,0 +1,252 @@
+import cProfile
+import json
+import os
+import re
+import sys
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+
+try:
+    import resource
+except ImportError:  # Windows: память берется из psutil, если он установлен
+    resource = None
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+
+# Настройки передаются через окружение, чтобы их видели и процессы ProcessPoolExecutor
+METRICS_ENV = 'CONVERTER_METRICS'
+PROFILE_MODES = ('cprofile', 'tracemalloc')
+
+_lock = threading.Lock()
+_profiler_lock = threading.Lock()
+_local = threading.local()  # открытые события потока (вложенные замеры)
+_cached = (None, None)
+
+
+def configure(path, profile=None, profile_stages=None, profile_dir=None):
+    """
+    Включает запись метрик этапов в JSON-lines файл
+
+    :param path: файл событий (дописывается; None - выключить метрики)
+    :param profile: None, 'cprofile' (файл .prof на каждое событие) или 'tracemalloc'
+                    (пик выделенной Python-памяти за событие)
+    :param profile_stages: этапы для профилирования (None - все)
+    :param profile_dir: папка для .prof (по умолчанию рядом с файлом событий)
+    """
+    if path is None:
+        os.environ.pop(METRICS_ENV, None)
+        return
+    if profile not in (None,) + PROFILE_MODES:
+        raise ValueError(f"Неизвестный режим профилирования: {profile}")
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    os.environ[METRICS_ENV] = json.dumps({
+        'path': os.path.abspath(path),
+        'run': time.strftime('%Y-%m-%d %H:%M:%S'),  # отличает события этого запуска от прошлых в том же файле
+        'profile': profile,
+        'profile_stages': list(profile_stages) if profile_stages else None,
+        'profile_dir': os.path.abspath(profile_dir or os.path.join(os.path.dirname(os.path.abspath(path)),
+                                                                   'profiles')),
+    })
+
+
+def _settings():
+    global _cached
+    raw = os.environ.get(METRICS_ENV)
+    if raw != _cached[0]:
+        _cached = (raw, json.loads(raw) if raw else None)
+    return _cached[1]
+
+
+def enabled():
+    return _settings() is not None
+
+
+def add(**values):
+    """
+    Прибавляет значения к полям самого внутреннего открытого события потока
+    (например, строки, посчитанные глубоко внутри этапа). Без открытого события ничего не делает.
+    """
+    stack = getattr(_local, 'events', None)
+    if not stack:
+        return
+    event = stack[-1]
+    for name, value in values.items():
+        event[name] = (event.get(name) or 0) + value
+
+
+def _memory_mb():
+    """(текущая RSS, пиковая RSS процесса) в МБ; None - измерить нечем"""
+    rss = peak = None
+    if psutil is not None:
+        info = psutil.Process().memory_info()
+        rss = info.rss / 2 ** 20
+        peak = getattr(info, 'peak_wset', None)
+        peak = peak / 2 ** 20 if peak is not None else None
+    if peak is None and resource is not None:
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # Linux - килобайты, macOS - байты
+        peak = peak / 2 ** 20 if sys.platform == 'darwin' else peak / 2 ** 10
+    return rss, peak
+
+
+def _write(settings, event):
+    line = json.dumps(event, ensure_ascii=False, default=str) + '\n'
+    with _lock:
+        with open(settings['path'], 'a', encoding='utf-8') as f:
+            f.write(line)
+
+
+def _profile_name(event):
+    key = re.sub(r'[^\w.-]+', '_', os.path.basename(str(event.get('key') or '')))
+    return f"{event['stage']}_{key}_{os.getpid()}_{int(time.time() * 1000)}.prof"
+
+
+@contextmanager
+def measure(stage, key=None, **fields):
+    """
+    Замер этапа: время (общее и процессорное), память и поля, заполненные внутри блока
+    (rows, bytes_read, bytes_written...). Событие дописывается в файл метрик при выходе из блока.
+    Значения-функции вычисляются только при включенных метриках (например, размер папки).
+    Без configure ничего не измеряется и не пишется.
+
+    :param stage: название этапа
+    :param key: тикер или архив
+    :return: словарь события (контекстный менеджер)
+    """
+    settings = _settings()
+    event = {'stage': stage, 'key': None if key is None else str(key), **fields}
+    if settings is None:
+        yield event
+        return
+
+    profile = settings['profile']
+    if settings['profile_stages'] is not None and stage not in settings['profile_stages']:
+        profile = None
+    profiler = None
+    if profile == 'cprofile' and _profiler_lock.acquire(blocking=False):
+        # В процессе одновременно может работать только один профилировщик
+        profiler = cProfile.Profile()
+        profiler.enable()
+    if profile == 'tracemalloc':
+        # Включается один раз на процесс и не выключается: остановка при работе соседних потоков небезопасна.
+        # Пик общий для процесса - при работе в потоках включает память соседних этапов
+        with _lock:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+        tracemalloc.reset_peak()
+
+    stack = _local.__dict__.setdefault('events', [])
+    stack.append(event)
+    start = time.perf_counter()
+    cpu_start = time.process_time()
+    error = None
+    try:
+        yield event
+    except BaseException as e:
+        error = f"{type(e).__name__}: {e}"
+        raise
+    finally:
+        stack.pop()
+        event['wall_s'] = round(time.perf_counter() - start, 4)
+        # Процессорное время всего процесса: при работе в потоках включает соседние потоки
+        event['cpu_s'] = round(time.process_time() - cpu_start, 4)
+        event['rss_mb'], event['peak_rss_mb'] = _memory_mb()
+        if profile == 'tracemalloc':
+            event['peak_traced_mb'] = round(tracemalloc.get_traced_memory()[1] / 2 ** 20, 3)
+        if profiler is not None:
+            profiler.disable()
+            _profiler_lock.release()
+            os.makedirs(settings['profile_dir'], exist_ok=True)
+            event['profile'] = os.path.join(settings['profile_dir'], _profile_name(event))
+            profiler.dump_stats(event['profile'])
+        for name, value in list(event.items()):
+            if callable(value):
+                try:
+                    event[name] = value()
+                except Exception as e:
+                    event[name] = None
+                    event.setdefault('metric_errors', []).append(f"{name}: {e}")
+        if error is not None:
+            event['error'] = error
+        event['run'] = settings['run']
+        event['pid'] = os.getpid()
+        event['thread'] = threading.current_thread().name
+        event['finished'] = time.strftime('%Y-%m-%d %H:%M:%S')
+        _write(settings, event)
+
+
+def file_size(path):
+    """Размер файла или папки (memmap) в байтах; 0, если пути нет"""
+    if path is None or not os.path.exists(path):
+        return 0
+    if not os.path.isdir(path):
+        return os.path.getsize(path)
+    total = 0
+    for root, dirs, files in os.walk(path):
+        for file in files:
+            total += os.path.getsize(os.path.join(root, file))
+    return total
+
+
+def load_events(path):
+    events = []
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            line = line.strip()
+            if line:
+                events.append(json.loads(line))
+    return events
+
+
+def print_summary(path=None, top=10, run=None):
+    """
+    Сводка по файлу метрик: итоги по этапам и самые медленные тикеры/архивы
+
+    :param path: файл событий (None - текущий из configure)
+    :param top: сколько самых медленных показывать на этап
+    :param run: запуск (по умолчанию - текущий из configure или последний в файле)
+    """
+    if path is None:
+        settings = _settings()
+        if settings is None:
+            return
+        path, run = settings['path'], run or settings['run']
+    if not os.path.exists(path):
+        print(f"Файл метрик {path} не найден")
+        return
+
+    events = load_events(path)
+    if run is None and events:
+        run = events[-1].get('run')
+    stages = {}
+    for event in events:
+        if event.get('run') == run:
+            stages.setdefault(event['stage'], []).append(event)
+
+    print(f"\n📈 Метрики запуска {run} ({path}):")
+    for stage, events in stages.items():
+        wall = sum(e.get('wall_s') or 0 for e in events)
+        rows = sum(e.get('rows') or 0 for e in events)
+        bytes_read = sum(e.get('bytes_read') or 0 for e in events)
+        bytes_written = sum(e.get('bytes_written') or 0 for e in events)
+        peak = max((e.get('peak_rss_mb') or 0 for e in events), default=0)
+        errors = sum(1 for e in events if e.get('error'))
+        line = f"\n  {stage}: событий {len(events)}, {wall:.2f} с"
+        if rows:
+            line += f", строк {rows:,}"
+        if bytes_read or bytes_written:
+            line += f", прочитано {bytes_read / 1e6:.1f} МБ, записано {bytes_written / 1e6:.1f} МБ"
+        print(line + f", пик памяти {peak:.0f} МБ" + (f", ошибок {errors}" if errors else ""))
+        slowest = sorted((e for e in events if e.get('key')), key=lambda e: e.get('wall_s') or 0, reverse=True)
+        for e in slowest[:top]:
+            rate = f", {e['rows'] / e['wall_s']:,.0f} строк/с" if e.get('rows') and e.get('wall_s') else ""
+            print(f"    {e['wall_s']:>9.3f} с  {e['key']}{rate}")
+
+
+if __name__ == "__main__":
+    print_summary(sys.argv[1], int(sys.argv[2]) if len(sys.argv) > 2 else 10)
@@ -0,0 +1,267 @@
+import os
+import queue
+import threading
+import time
+
+from archivefs import ArchiveSource
+from unarchiver import (_collect_archives, _organize_archive_stream, _organize_outputs, _plan_duplicates,
+                        _prepare_ticker_dirs, _print_duplicates, _skip_unchanged)
+
+
+# Сколько элементов может ждать между соседними этапами (дальше предыдущий этап ждет следующий)
+PIPELINE_QUEUE_SIZE = 4
+
+_DONE = object()
+
+
+class Stage:
+    def __init__(self, name, func, workers=1, flush=None):
+        """
+        Этап конвейера
+
+        :param name: название для сообщений
+        :param func: функция (элемент) -> список элементов для следующего этапа (или None)
+        :param workers: количество потоков этапа
+        :param flush: функция () -> список элементов, вызывается один раз после обработки всех входов
+        """
+        self.name = name
+        self.func = func
+        self.workers = workers
+        self.flush = flush
+
+
+class Pipeline:
+    def __init__(self, stages, queue_size=PIPELINE_QUEUE_SIZE):
+        """
+        Конвейер этапов в потоках, связанных ограниченными очередями: элемент уходит на следующий
+        этап сразу после обработки, поэтому этапы работают одновременно, а не по очереди.
+        Распаковка zlib и чтение/запись pandas отпускают GIL, так что потоки этапов нагружают
+        процессор и диск параллельно.
+
+        :param stages: список Stage
+        :param queue_size: размер очереди между этапами
+        """
+        self.stages = stages
+        self.queue_size = queue_size
+
+    def _worker(self, stage, inbox, outbox, state):
+        while True:
+            item = inbox.get()
+            if item is _DONE:
+                inbox.put(_DONE)  # для остальных потоков этапа
+                break
+            try:
+                for result in stage.func(item) or ():
+                    outbox.put(result)
+            except Exception as e:
+                print(f"⚠️  {stage.name}: ошибка при обработке {item}: {e}")
+
+        with state['lock']:
+            state['running'] -= 1
+            last = state['running'] == 0
+        if last:
+            # Последний поток этапа: добираем отложенные элементы и закрываем выход
+            if stage.flush is not None:
+                try:
+                    for result in stage.flush() or ():
+                        outbox.put(result)
+                except Exception as e:
+                    print(f"⚠️  {stage.name}: {e}")
+            outbox.put(_DONE)
+
+    def run(self, items):
+        """
+        Пропускает элементы через все этапы
+
+        :return: список результатов последнего этапа (в порядке готовности)
+        """
+        queues = [queue.Queue(maxsize=self.queue_size) for _ in range(len(self.stages) + 1)]
+        threads = []
+        for stage, inbox, outbox in zip(self.stages, queues, queues[1:]):
+            state = {'lock': threading.Lock(), 'running': stage.workers}
+            for i in range(stage.workers):
+                thread = threading.Thread(target=self._worker, args=(stage, inbox, outbox, state),
+                                          name=f"{stage.name}-{i + 1}", daemon=True)
+                thread.start()
+                threads.append(thread)
+
+        def feed():
+            for item in items:
+                queues[0].put(item)
+            queues[0].put(_DONE)
+
+        feeder = threading.Thread(target=feed, name='feed', daemon=True)
+        feeder.start()
+
+        results = []
+        while True:
+            item = queues[-1].get()
+            if item is _DONE:
+                break
+            results.append(item)
+
+        feeder.join()
+        for thread in threads:
+            thread.join()
+        return results
+
+
+class _TickerRelease:
+    """Отслеживает, какие тикеры организованы полностью: тикер готов, когда обработаны все архивы с его файлами"""
+
+    def __init__(self, tickers, archive_tickers):
+        """
+        :param archive_tickers: словарь архив -> тикеры в нем или None (состав архивов неизвестен,
+                                тикеры выпускаются только после всех архивов)
+        """
+        self.lock = threading.Lock()
+        self.tickers = list(tickers)
+        self.released = set()
+        self.remaining = None
+        self.archive_tickers = archive_tickers
+        if archive_tickers is not None:
+            self.remaining = dict.fromkeys(self.tickers, 0)
+            for archive_set in archive_tickers.values():
+                for ticker in archive_set:
+                    if ticker in self.remaining:
+                        self.remaining[ticker] += 1
+
+    def ready(self):
+        """Тикеры, которым не нужен ни один из обрабатываемых архивов"""
+        if self.remaining is None:
+            return []
+        return self._release([t for t, count in self.remaining.items() if count == 0])
+
+    def archive_done(self, archive_path):
+        if self.remaining is None:
+            return []
+        done = []
+        with self.lock:
+            for ticker in self.archive_tickers.get(archive_path, ()):
+                if ticker in self.remaining:
+                    self.remaining[ticker] -= 1
+                    if self.remaining[ticker] == 0:
+                        done.append(ticker)
+        return self._release(done)
+
+    def rest(self):
+        """Все еще не выпущенные тикеры (после обработки всех архивов)"""
+        return self._release(self.tickers)
+
+    def _release(self, tickers):
+        with self.lock:
+            fresh = [t for t in tickers if t not in self.released]
+            self.released.update(fresh)
+        return fresh
+
+
+def run_pipelined(source, tickers, tickers_directory, concatenator, glued_directory, generator, catalog=None,
+                  manifest=None, organize_workers=None, glue_workers=2, candle_workers=2,
+                  queue_size=PIPELINE_QUEUE_SIZE):
+    """
+    Шаги 2-4 конвейером: организация архивов по тикерам, склейка и генерация свечей идут одновременно.
+    Тикер уходит на склейку, как только обработаны все архивы с его файлами (по каталогу архивов;
+    без каталога - после всех архивов), и на генерацию свечей - сразу после склейки.
+    Если у concatenator задан candle_generator, свечи строятся в этапе склейки.
+
+    :param source: папка с разархивированными архивами или ArchiveSource (шаг 2 не нужен)
+    :param tickers: список тикеров
+    :param tickers_directory: папка организованных данных (вход склейки)
+    :param concatenator: FuturesConcatenator с root_dir = tickers_directory (или ArchiveSource)
+    :param generator: FinamTxtCandleGenerator с input_dir = glued_directory
+    :param catalog: ArchiveCatalog - для раннего выпуска тикеров и пропуска ненужных архивов
+    :param manifest: RunManifest - неизменившиеся архивы и тикеры пропускаются
+    :return: словарь тикер -> список файлов свечей
+    """
+    start_time = time.time()
+    os.makedirs(glued_directory, exist_ok=True)
+    stages = []
+
+    if isinstance(source, ArchiveSource):
+        items = list(tickers)
+    else:
+        _prepare_ticker_dirs(tickers_directory, tickers)
+        archive_list = _collect_archives(source, tickers, catalog)
+        duplicates, skipped_duplicates, renamed_duplicates = _plan_duplicates(archive_list, set(tickers))
+        _print_duplicates(skipped_duplicates, renamed_duplicates)
+        archive_list, organize_fps = _skip_unchanged(archive_list, tickers, manifest, catalog)
+        archives = [os.path.join(root, file) for root, file in archive_list]
+        print(f"📦 Найдено архивов для обработки: {len(archives)}")
+
+        archive_tickers = None
+        if catalog is not None:
+            # Содержимое архива не из каталога неизвестно: его ждут все тикеры
+            known = catalog.archives()
+            archive_tickers = {os.path.abspath(path): set() if os.path.abspath(path) in known else set(tickers)
+                               for path in archives}
+            for ticker in tickers:
+                for member in catalog.members(ticker):
+                    if member[0] in archive_tickers:
+                        archive_tickers[member[0]].add(ticker)
+        release = _TickerRelease(tickers, archive_tickers)
+        tickers_set = set(tickers)
+
+        # Тикеры, не затронутые необработанными архивами, проходят организацию транзитом
+        items = [('ticker', ticker) for ticker in release.ready()] + [('archive', path) for path in archives]
+
+        def organize(item):
+            kind, value = item
+            if kind == 'ticker':
+                return [value]
+            try:
+                written = _organize_archive_stream(value, tickers_directory, tickers_set, duplicates.get(value))
+                if manifest is not None:
+                    manifest.mark_done('organize', value, organize_fps[value],
+                                       outputs=_organize_outputs(tickers_directory, written))
+                print(f"✅ Обработано: {os.path.basename(value)} (файлов: {len(written)})")
+            except Exception as e:
+                # Тикеры выпускаются и при ошибке в архиве - как и в последовательном режиме
+                print(f"⚠️  Ошибка в архиве {os.path.basename(value)}: {e}")
+            return release.archive_done(os.path.abspath(value))
+
+        stages.append(Stage('Организация', organize, organize_workers or os.cpu_count() or 1, flush=release.rest))
+
+    glue_stats = {}
+
+    def glue(ticker):
+        fp = concatenator._ticker_fingerprint(ticker, manifest) if manifest is not None else None
+        if manifest is not None and manifest.is_current('glue', ticker, fp):
+            print(f"\n=== {ticker.upper()}: входные файлы не изменились, пропускаем ===")
+            stats = manifest.info('glue', ticker).get('stats')
+            if stats:
+                glue_stats[ticker] = stats
+            return [ticker]
+        result = concatenator.glue_ticker(ticker, glued_directory)
+        if result is None:
+            return None
+        stats, outputs = result
+        glue_stats[ticker] = stats
+        if manifest is not None:
+            manifest.mark_done('glue', ticker, fp, outputs=outputs, stats=stats)
+        return [ticker]
+
+    candle_files = {}
+
+    def candles(ticker):
+        fp = generator._symbol_fingerprint(ticker, manifest) if manifest is not None else None
+        if manifest is not None and manifest.is_current('candles', ticker, fp):
+            print(f"\n{ticker.upper()}: склеенные данные не изменились, пропускаю.")
+            return [ticker]
+        out_files = generator.process_symbol(ticker)
+        if out_files:
+            candle_files[ticker] = out_files
+            if manifest is not None:
+                manifest.mark_done('candles', ticker, fp, outputs=out_files)
+        return [ticker]
+
+    stages.append(Stage('Склейка', glue, glue_workers))
+    if concatenator.candle_generator is None:
+        stages.append(Stage('Свечи', candles, candle_workers))
+
+    print(f"🔀 Конвейер: {' -> '.join(f'{s.name} ({s.workers})' for s in stages)}")
+    Pipeline(stages, queue_size).run(items)
+
+    concatenator.save_summary_stats(tickers, glue_stats, glued_directory)
+    concatenator.print_python_engine_files()
+    print(f"⏱️  Конвейер завершен за {time.time() - start_time:.2f} секунд")
+    return candle_files
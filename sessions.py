@@ -0,0 +1,180 @@
+import re
+
+import numpy as np
+
+from timeutils import NS_PER_DAY, NS_PER_SECOND, days_from_civil
+
+
+# Запас дней вокруг данных при построении календаря (длинные праздники в Китае - до ~10 дней)
+CALENDAR_MARGIN_DAYS = 30
+
+# Конец ночной сессии по продуктам (SHFE/INE); остальные ночные сессии заканчиваются в 23:00
+NIGHT_CLOSE = {
+    'au': '02:30', 'ag': '02:30', 'sc': '02:30',
+    'cu': '01:00', 'al': '01:00', 'zn': '01:00', 'pb': '01:00', 'ni': '01:00', 'sn': '01:00',
+    'ss': '01:00', 'bc': '01:00', 'ao': '01:00',
+}
+DEFAULT_NIGHT_CLOSE = '23:00'
+# Продукты без ночной сессии: индексные и облигационные фьючерсы CFFEX и часть товарных
+NO_NIGHT = {'if', 'ih', 'ic', 'im', 'ts', 'tf', 't', 'tl', 'ap', 'cj', 'jd', 'lh', 'wr'}
+# Дневная сессия CFFEX: 09:30-15:00, у облигационных фьючерсов - до 15:15
+CFFEX = {'if', 'ih', 'ic', 'im', 'ts', 'tf', 't', 'tl'}
+CFFEX_BONDS = {'ts', 'tf', 't', 'tl'}
+
+
+def _clock_ns(value):
+    """'HH:MM' или 'HH:MM:SS' -> наносекунды от полуночи"""
+    parts = [int(p) for p in value.split(':')]
+    hour, minute, second = (parts + [0, 0])[:3]
+    return (hour * 3600 + minute * 60 + second) * NS_PER_SECOND
+
+
+def _date_days(values):
+    """Даты YYYYMMDD (целые или строки) -> дни от эпохи"""
+    digits = np.asarray([int(str(v).replace('-', '')) for v in values], dtype=np.int64)
+    return days_from_civil(digits // 10000, digits // 100 % 100, digits % 100)
+
+
+def load_holidays(path):
+    """Праздники из текстового файла: по дате YYYYMMDD в строке, '#' - комментарий"""
+    holidays = []
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            line = line.split('#', 1)[0].strip()
+            if line:
+                holidays.append(line)
+    return holidays
+
+
+class SessionCalendar:
+    def __init__(self, sessions, holidays=(), trading_day_start='18:00', pre_open='00:05'):
+        """
+        Календарь торговых сессий продукта.
+
+        Торговый день D начинается в trading_day_start предыдущего торгового дня: ночная сессия пятницы
+        относится к понедельнику, а после праздников - к первому рабочему дню.
+
+        :param sessions: список (открытие, закрытие) 'HH:MM' в порядке внутри торгового дня. Сессия,
+                         открывающаяся не раньше trading_day_start, - ночная (идет вечером предыдущего
+                         торгового дня); закрытие меньше открытия - переход через полночь
+        :param holidays: неторговые будние дни (YYYYMMDD)
+        :param trading_day_start: время смены торгового дня
+        :param pre_open: длительность аукциона перед открытием: его тики попадают в первый бар сессии
+        """
+        self.day_start = _clock_ns(trading_day_start)
+        self.pre_open = _clock_ns(pre_open)
+        self.sessions = []
+        for open_time, close_time in sessions:
+            open_ns, close_ns = _clock_ns(open_time), _clock_ns(close_time)
+            if close_ns <= open_ns:
+                close_ns += NS_PER_DAY
+            # Смещение относительно полуночи торгового дня (ночная сессия - в предыдущем торговом дне)
+            self.sessions.append((open_ns >= self.day_start, open_ns, close_ns))
+        self.holidays = np.unique(_date_days(holidays)) if len(holidays) else np.array([], dtype=np.int64)
+        self._range = None
+
+    def aligned(self, step):
+        """True, если границы сессий и торговых дней кратны step (бары step не пересекают границ)"""
+        offsets = [self.day_start]
+        for _, open_ns, _ in self.sessions:
+            offsets += [open_ns, open_ns - self.pre_open]
+        return all(ns % step == 0 for ns in offsets)
+
+    def _build(self, first_day, last_day):
+        """Торговые дни, их границы и окна сессий на диапазоне дней [first_day, last_day]"""
+        days = np.arange(first_day - CALENDAR_MARGIN_DAYS, last_day + CALENDAR_MARGIN_DAYS + 1, dtype=np.int64)
+        weekday = (days + 3) % 7  # 1970-01-01 - четверг, понедельник = 0
+        days = days[(weekday < 5) & ~np.isin(days, self.holidays)]
+        prev_days, days = days[:-1], days[1:]
+
+        bounds = prev_days * NS_PER_DAY + self.day_start
+        opens, closes = [], []
+        for night, open_ns, close_ns in self.sessions:
+            base = (prev_days if night else days) * NS_PER_DAY
+            opens.append(base + open_ns)
+            closes.append(base + close_ns)
+        # Окна сессий по всем торговым дням в хронологическом порядке
+        opens = np.stack(opens, axis=1).ravel()
+        closes = np.stack(closes, axis=1).ravel()
+        self._range = (first_day, last_day, days, bounds, opens, closes)
+
+    def _tables(self, times):
+        """Таблицы календаря, покрывающие время тиков (перестраиваются только при выходе за диапазон)"""
+        first_day = int(np.floor_divide(times.min(), NS_PER_DAY))
+        last_day = int(np.floor_divide(times.max(), NS_PER_DAY))
+        if self._range is None or first_day < self._range[0] or last_day > self._range[1]:
+            self._build(first_day, last_day)
+        return self._range[2:]
+
+    def trading_day(self, times):
+        """
+        Торговый день каждого тика (начало дня в нс от эпохи) поиском по границам дней: O(n log k)
+
+        :param times: массив int64 наносекунд
+        """
+        times = np.asarray(times, dtype=np.int64)
+        if not len(times):
+            return times.copy()
+        days, bounds, _, _ = self._tables(times)
+        idx = np.searchsorted(bounds, times, side='right') - 1
+        return days[idx] * NS_PER_DAY
+
+    def session_bucket(self, times, step):
+        """
+        Начало бара длиной step внутри сессии: бары отсчитываются от открытия сессии, последний бар
+        обрезается закрытием. Сессия длится от аукциона перед ее открытием до аукциона следующей:
+        тики аукциона попадают в первый бар, тики после закрытия - в последний.
+
+        :param times: массив int64 наносекунд
+        """
+        times = np.asarray(times, dtype=np.int64)
+        if not len(times):
+            return times.copy()
+        _, _, opens, closes = self._tables(times)
+        idx = np.maximum(np.searchsorted(opens - self.pre_open, times, side='right') - 1, 0)
+        offset = np.clip(times - opens[idx], 0, closes[idx] - opens[idx] - 1)
+        return opens[idx] + offset // step * step
+
+
+class SessionStep:
+    def __init__(self, calendar, step):
+        """
+        Длина бара, привязанная к календарю сессий: вместо деления времени на step
+        бары строятся по торговым дням (step - сутки) или внутри сессий.
+
+        :param calendar: SessionCalendar
+        :param step: длина бара в наносекундах
+        """
+        self.calendar = calendar
+        self.step = step
+
+    def bucket(self, times):
+        """Начало бара для каждого времени (нс от эпохи)"""
+        if self.step % NS_PER_DAY == 0:
+            return self.calendar.trading_day(times)
+        return self.calendar.session_bucket(times, self.step)
+
+    def rolls_from(self, base):
+        """Можно ли укрупнять до этого бара бары календарной длины base"""
+        return self.step % base == 0 and self.calendar.aligned(base)
+
+
+def product_code(ticker):
+    """Код продукта по тикеру или имени папки: 'ag2401' -> 'ag'"""
+    match = re.match(r'[A-Za-z]+', ticker)
+    return match.group(0).lower() if match else ticker.lower()
+
+
+def calendar_for(ticker, holidays=()):
+    """Календарь сессий китайского фьючерса по тикеру: дневная сессия и ночная, если она есть у продукта"""
+    product = product_code(ticker)
+    sessions = []
+    if product not in NO_NIGHT:
+        sessions.append(('21:00', NIGHT_CLOSE.get(product, DEFAULT_NIGHT_CLOSE)))
+    if product in CFFEX_BONDS:
+        sessions.append(('09:30', '15:15'))
+    elif product in CFFEX:
+        sessions.append(('09:30', '15:00'))
+    else:
+        sessions.append(('09:00', '15:00'))
+    return SessionCalendar(sessions, holidays)
@@ -0,0 +1,177 @@
+import os
+import pickle
+import shutil
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+
+# Сколько строк в одном блоке на диске (и в буфере слияния на один прогон)
+SPILL_BLOCK_ROWS = 200_000
+
+
+def _key_array(df, key):
+    """Ключ сортировки как int64 (datetime64[ns] -> наносекунды)"""
+    values = df[key].to_numpy()
+    if values.dtype.kind == 'M':
+        return values.view('int64')
+    return values.astype('int64', copy=False)
+
+
+class SpillRun:
+    def __init__(self, path, block_rows=SPILL_BLOCK_ROWS):
+        """
+        Отсортированный прогон на диске: последовательность pickle-блоков DataFrame
+
+        :param path: Путь к файлу прогона
+        :param block_rows: Размер блока в строках
+        """
+        self.path = path
+        self.block_rows = block_rows
+        self.rows = 0
+        self.min_key = None
+        self.max_key = None
+
+    def write(self, df, key):
+        """Сортирует DataFrame по ключу (устойчиво) и записывает его блоками"""
+        df = df.sort_values(key, kind='stable', ignore_index=True)
+        keys = _key_array(df, key)
+        with open(self.path, 'wb') as f:
+            for start in range(0, len(df), self.block_rows):
+                pickle.dump(df.iloc[start:start + self.block_rows], f, protocol=pickle.HIGHEST_PROTOCOL)
+        self.rows = len(df)
+        if self.rows:
+            self.min_key = int(keys[0])
+            self.max_key = int(keys[-1])
+        return self
+
+    def blocks(self):
+        """Читает блоки прогона по одному"""
+        with open(self.path, 'rb') as f:
+            while True:
+                try:
+                    yield pickle.load(f)
+                except EOFError:
+                    return
+
+
+class SpillDirectory:
+    def __init__(self, parent_dir=None, block_rows=SPILL_BLOCK_ROWS):
+        """
+        Временная папка для прогонов, удаляется при выходе из with
+
+        :param parent_dir: Где создать папку (None - системная временная директория)
+        """
+        self.parent_dir = parent_dir
+        self.block_rows = block_rows
+        self.path = None
+        self._count = 0
+
+    def __enter__(self):
+        if self.parent_dir:
+            os.makedirs(self.parent_dir, exist_ok=True)
+        self.path = tempfile.mkdtemp(prefix='spill_', dir=self.parent_dir)
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        shutil.rmtree(self.path, ignore_errors=True)
+
+    def spill(self, df, key):
+        """Сохраняет DataFrame как отсортированный прогон"""
+        self._count += 1
+        run = SpillRun(os.path.join(self.path, f"run_{self._count:06d}.pkl"), self.block_rows)
+        return run.write(df, key)
+
+
+class _RunCursor:
+    """Буфер слияния для одного прогона: текущий хвост данных и итератор оставшихся блоков"""
+
+    def __init__(self, order, run, key, block_filter):
+        self.order = order
+        self.key = key
+        self.block_filter = block_filter
+        self._blocks = run.blocks()
+        self.exhausted = False
+        self.df = None
+        self.keys = None
+        self.refill()
+
+    def refill(self):
+        """Догружает следующий непустой блок к текущему буферу"""
+        while not self.exhausted:
+            block = next(self._blocks, None)
+            if block is None:
+                self.exhausted = True
+                break
+            if self.block_filter is not None:
+                block = self.block_filter(block)
+            if len(block):
+                self.df = block if self.df is None or not len(self.df) else pd.concat([self.df, block])
+                self.keys = _key_array(self.df, self.key)
+                return
+
+    @property
+    def tail(self):
+        return int(self.keys[-1]) if self.df is not None and len(self.df) else None
+
+    def take_before(self, bound):
+        """Отдает строки с ключом < bound и оставляет остальные в буфере"""
+        if self.df is None or not len(self.df):
+            return None
+        cut = len(self.keys) if bound is None else int(np.searchsorted(self.keys, bound, side='left'))
+        if cut == 0:
+            return None
+        head = self.df.iloc[:cut]
+        self.df = self.df.iloc[cut:]
+        self.keys = self.keys[cut:]
+        return head
+
+    @property
+    def finished(self):
+        return self.exhausted and (self.df is None or not len(self.df))
+
+
+def merge_runs(runs, key, block_filter=None):
+    """
+    Потоковое k-путевое слияние отсортированных прогонов.
+
+    Результат совпадает с устойчивой сортировкой конкатенации прогонов в порядке списка:
+    строки с равным ключом идут в порядке прогонов. Прогон открывается только когда граница
+    слияния доходит до его минимального ключа, поэтому в памяти держатся лишь пересекающиеся
+    по времени прогоны (по блоку на каждый).
+
+    :param runs: список SpillRun
+    :param key: колонка сортировки
+    :param block_filter: функция (блок DataFrame) -> отфильтрованный блок, применяется при чтении
+    :return: генератор отсортированных DataFrame
+    """
+    pending = sorted((i for i, run in enumerate(runs) if run.rows), key=lambda i: (runs[i].min_key, i))
+    pending_pos = 0
+    active = []
+
+    while pending_pos < len(pending) or active:
+        # Граница: ни один недочитанный прогон не может содержать ключ меньше нее
+        candidates = [cursor.tail for cursor in active if not cursor.exhausted]
+        if pending_pos < len(pending):
+            candidates.append(runs[pending[pending_pos]].min_key)
+        bound = min(candidates) if candidates else None
+
+        parts = [part for part in (cursor.take_before(bound) for cursor in active) if part is not None]
+        if parts:
+            batch = pd.concat(parts, ignore_index=True) if len(parts) > 1 else parts[0].reset_index(drop=True)
+            if len(parts) > 1:
+                batch = batch.sort_values(key, kind='stable', ignore_index=True)
+            yield batch
+
+        # Открываем прогоны, начинающиеся на границе, и догружаем буферы, упершиеся в нее
+        while pending_pos < len(pending) and (bound is None or runs[pending[pending_pos]].min_key <= bound):
+            order = pending[pending_pos]
+            active.append(_RunCursor(order, runs[order], key, block_filter))
+            pending_pos += 1
+        for cursor in active:
+            if not cursor.exhausted and cursor.tail is not None and cursor.tail == bound:
+                cursor.refill()
+            elif cursor.df is None or not len(cursor.df):
+                cursor.refill()
+        active = sorted((cursor for cursor in active if not cursor.finished), key=lambda c: c.order)
@@ -0,0 +1,206 @@
+import argparse
+import io
+import json
+import os
+import tarfile
+import time
+import zipfile
+from datetime import date, timedelta
+from pathlib import Path
+
+import numpy as np
+
+from sessions import DEFAULT_NIGHT_CLOSE, NIGHT_CLOSE
+
+
+# Продукты для синтетических тикеров (дальше - xa, xb, ...: тикер - буквы до первой цифры)
+PRODUCTS = ['ag', 'cu', 'rb', 'au', 'zn', 'ni', 'al', 'ru', 'fu', 'sn', 'hc', 'bu']
+# Разделители и формат времени чередуются по тикерам, как в реальных выгрузках
+SEPARATORS = [',', ';', '\t']
+DATASET_INFO = 'dataset.json'
+# Форматы начальных архивов: сжатые tar читаются только потоком
+OUTER_FORMATS = ('zip', 'tar', 'tar.gz', 'tar.bz2')
+TAR_WRITE_MODES = {'tar': 'w', 'tar.gz': 'w:gz', 'tar.bz2': 'w:bz2'}
+
+
+def _letters(n):
+    """0 -> 'a', 25 -> 'z', 26 -> 'ba', ..."""
+    letters = ''
+    while True:
+        letters = chr(ord('a') + n % 26) + letters
+        n //= 26
+        if not n:
+            return letters
+
+
+def _tickers(count):
+    return [PRODUCTS[i] if i < len(PRODUCTS) else f"x{_letters(i - len(PRODUCTS))}" for i in range(count)]
+
+
+def _trading_days(start, days):
+    """Первые days будних дней начиная с start"""
+    result = []
+    current = start
+    while len(result) < days:
+        if current.weekday() < 5:
+            result.append(current)
+        current += timedelta(days=1)
+    return result
+
+
+def _contracts(start, count):
+    """Коды ближайших контрактов YYMM после месяца start"""
+    codes = []
+    year, month = start.year, start.month
+    for _ in range(count):
+        month += 1
+        if month > 12:
+            year, month = year + 1, 1
+        codes.append(f"{year % 100:02d}{month:02d}")
+    return codes
+
+
+def _night_minutes(ticker):
+    """Длина ночной сессии продукта в минутах от 21:00 (у части продуктов - после полуночи)"""
+    hour, minute = (int(part) for part in NIGHT_CLOSE.get(ticker, DEFAULT_NIGHT_CLOSE).split(':'))
+    return (hour * 60 + minute - 21 * 60) % (24 * 60)
+
+
+def _session_csv(rng, day, session, ticks, price, sep, with_ms, night_minutes=120):
+    """
+    CSV одной сессии контракта: Date, Time, TradeID, TradeVolume, LastPrice, TotalVolume, High, Low,
+    Nanoseconds, 5 уровней Bid/Ask и объемов. Цена - случайное блуждание, TotalVolume - накопленный объем.
+    Тики упорядочены по времени с точностью до миллисекунды. Ночная сессия начинается в 21:00 и может
+    переходить через полночь: после нее дата - следующий календарный день
+
+    :return: (текст CSV, последняя цена)
+    """
+    start_minute, minutes = (9 * 60, 6 * 60) if session == 'DAY' else (21 * 60, night_minutes)
+    offsets = np.sort(rng.integers(0, minutes * 60 * 1000, ticks)) + start_minute * 60 * 1000
+    seconds = offsets // 1000
+    millis = offsets % 1000
+    dates = np.where(seconds >= 24 * 3600, int((day + timedelta(days=1)).strftime('%Y%m%d')),
+                     int(day.strftime('%Y%m%d')))
+    seconds %= 24 * 3600
+    hhmmss = seconds // 3600 * 10000 + seconds // 60 % 60 * 100 + seconds % 60
+    times = hhmmss * 1000 + millis if with_ms else hhmmss
+
+    prices = price + np.cumsum(rng.integers(-2, 3, ticks))
+    trade_volume = rng.integers(1, 20, ticks)
+    total_volume = np.cumsum(trade_volume)
+    high = np.maximum.accumulate(prices)
+    low = np.minimum.accumulate(prices)
+    levels = np.arange(1, 6)
+    bids = prices[:, None] - levels
+    asks = prices[:, None] + levels
+    depth = rng.integers(1, 100, (ticks, 10))
+
+    table = np.column_stack([
+        dates, times, np.arange(1, ticks + 1), trade_volume, prices,
+        total_volume, high, low, millis * 1_000_000, bids, asks, depth,
+    ])
+    buffer = io.StringIO()
+    np.savetxt(buffer, table, fmt='%d', delimiter=sep)
+    return buffer.getvalue(), int(prices[-1]) if ticks else price
+
+
+def _write_outer(path, inner_archives, fmt):
+    """
+    Начальный архив (zip, tar, tar.gz или tar.bz2): папка с вложенными zip-архивами дней.
+    Имя папки - имя архива без последнего расширения, как ожидают разархиватор и ArchiveSource
+    """
+    folder = Path(path).stem
+    if fmt == 'zip':
+        with zipfile.ZipFile(path, 'w', zipfile.ZIP_STORED) as outer:
+            for name, data in inner_archives:
+                outer.writestr(f"{folder}/{name}", data)
+        return
+    with tarfile.open(path, TAR_WRITE_MODES[fmt]) as outer:
+        for name, data in inner_archives:
+            info = tarfile.TarInfo(f"{folder}/{name}")
+            info.size = len(data)
+            info.mtime = time.time()
+            outer.addfile(info, io.BytesIO(data))
+
+
+def generate_dataset(root, tickers=3, days=5, ticks_per_day=2000, contracts=3, start=date(2023, 10, 16),
+                     outer_formats=OUTER_FORMATS, seed=1):
+    """
+    Синтетические сырые данные в структуре ChinaData: начальные архивы за месяц (дни месяца по очереди
+    раскладываются по форматам outer_formats) с папкой <имя архива>/, в ней zip-архивы дней
+    с CSV <дата>/DAY|NIGHT/<тикер><контракт>_<дата>.csv.
+    У тикеров чередуются разделители и формат времени (HHMMSS / HHMMSSmmm), ночная сессия
+    длится как у продукта (ag, cu и др. - после полуночи).
+
+    :param root: папка набора (данные пишутся в root/ChinaData)
+    :param tickers: количество тикеров
+    :param days: количество торговых дней
+    :param ticks_per_day: тиков на контракт в день (делятся между дневной и ночной сессиями)
+    :param contracts: контрактов на тикер
+    :param outer_formats: форматы начальных архивов (zip, tar, tar.gz, tar.bz2)
+    :return: словарь с описанием набора (сохраняется в root/dataset.json)
+    """
+    rng = np.random.default_rng(seed)
+    input_dir = os.path.join(root, 'ChinaData')
+    os.makedirs(input_dir, exist_ok=True)
+
+    names = _tickers(tickers)
+    trading_days = _trading_days(start, days)
+    codes = _contracts(start, contracts)
+    prices = {(ticker, code): 3000 + 1000 * i for i, ticker in enumerate(names) for code in codes}
+    night_ticks = ticks_per_day // 3
+    sessions = [('DAY', ticks_per_day - night_ticks), ('NIGHT', night_ticks)]
+
+    # Начальные архивы: дни месяца по очереди раскладываются по форматам
+    drops = {}
+    for month in sorted({day.strftime('%Y_%m') for day in trading_days}):
+        month_days = [day for day in trading_days if day.strftime('%Y_%m') == month]
+        for k, day in enumerate(month_days):
+            fmt = outer_formats[k % len(outer_formats)]
+            drops.setdefault((f"{month}{_letters(k % len(outer_formats))}.{fmt}", fmt), []).append(day)
+
+    rows = 0
+    csv_bytes = 0
+    files = 0
+    for (archive_name, fmt), drop_days in drops.items():
+        inner_archives = []
+        for day in drop_days:
+            day_code = day.strftime('%Y%m%d')
+            inner = io.BytesIO()
+            with zipfile.ZipFile(inner, 'w', zipfile.ZIP_DEFLATED) as inner_zip:
+                for i, ticker in enumerate(names):
+                    sep = SEPARATORS[i % len(SEPARATORS)]
+                    with_ms = i % 2 == 0
+                    for code in codes:
+                        for session, ticks in sessions:
+                            text, prices[ticker, code] = _session_csv(rng, day, session, ticks, prices[ticker, code],
+                                                                      sep, with_ms, _night_minutes(ticker))
+                            inner_zip.writestr(f"{day_code}/{session}/{ticker}{code}_{day_code}.csv", text)
+                            rows += ticks
+                            csv_bytes += len(text)
+                            files += 1
+            inner_archives.append((f"{day_code}.zip", inner.getvalue()))
+        _write_outer(os.path.join(input_dir, archive_name), inner_archives, fmt)
+
+    info = {
+        'tickers': names, 'days': len(trading_days), 'contracts': codes, 'ticks_per_day': ticks_per_day,
+        'rows': rows, 'csv_bytes': csv_bytes, 'files': files, 'archives': [name for name, _ in drops], 'seed': seed,
+    }
+    with open(os.path.join(root, DATASET_INFO), 'w', encoding='utf-8') as f:
+        json.dump(info, f, ensure_ascii=False, indent=1)
+    return info
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Генератор синтетических архивов тиков для бенчмарков")
+    parser.add_argument('root', help="папка набора данных")
+    parser.add_argument('--tickers', type=int, default=3)
+    parser.add_argument('--days', type=int, default=5)
+    parser.add_argument('--ticks-per-day', type=int, default=2000)
+    parser.add_argument('--contracts', type=int, default=3)
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    dataset = generate_dataset(args.root, args.tickers, args.days, args.ticks_per_day, args.contracts, seed=args.seed)
+    print(f"✅ Сгенерировано: {dataset['files']} файлов, {dataset['rows']:,} строк, "
+          f"{dataset['csv_bytes'] / 1e6:.1f} МБ CSV -> {args.root}")
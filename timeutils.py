@@ -0,0 +1,92 @@
+import numpy as np
+
+
+NS_PER_SECOND = 1_000_000_000
+NS_PER_DAY = 86_400 * NS_PER_SECOND
+
+
+def days_from_civil(year, month, day):
+    """
+    Количество дней от 1970-01-01 для массивов года, месяца и дня (алгоритм H. Hinnant).
+    Работает целиком на целочисленной арифметике NumPy.
+    """
+    year = np.asarray(year, dtype=np.int64) - (np.asarray(month) <= 2)
+    month = np.asarray(month, dtype=np.int64)
+    day = np.asarray(day, dtype=np.int64)
+    era = np.floor_divide(year, 400)
+    yoe = year - era * 400
+    doy = (153 * (month + np.where(month > 2, -3, 9)) + 2) // 5 + day - 1
+    doe = yoe * 365 + yoe // 4 - yoe // 100 + doy
+    return era * 146097 + doe - 719468
+
+
+def civil_from_days(days):
+    """Обратное преобразование: дни от 1970-01-01 -> (год, месяц, день) массивами"""
+    days = np.asarray(days, dtype=np.int64) + 719468
+    era = np.floor_divide(days, 146097)
+    doe = days - era * 146097
+    yoe = (doe - doe // 1460 + doe // 36524 - doe // 146096) // 365
+    doy = doe - (365 * yoe + yoe // 4 - yoe // 100)
+    mp = (5 * doy + 2) // 153
+    day = doy - (153 * mp + 2) // 5 + 1
+    month = mp + np.where(mp < 10, 3, -9)
+    year = yoe + era * 400 + (month <= 2)
+    return year, month, day
+
+
+def parse_date_time_ns(date_digits, time_digits, time_has_ms):
+    """
+    Переводит дату YYYYMMDD и время HHMMSS / HHMMSSmmm (целые числа) в наносекунды от эпохи.
+
+    :param date_digits: массив int64 дат YYYYMMDD (отрицательные значения - пропуски)
+    :param time_digits: массив int64 времени (отрицательные значения - пропуски)
+    :param time_has_ms: True, если все время файла записано как HHMMSSmmm: тогда и значения меньше 7 цифр
+                        (00:00-00:09 с отброшенными ведущими нулями) - HHMMSSmmm. Значения больше 6 цифр
+                        считаются HHMMSSmmm в любом случае, остальные при False - HHMMSS
+    :return: (наносекунды int64, маска корректных строк)
+    """
+    date_digits = np.asarray(date_digits, dtype=np.int64)
+    time_digits = np.asarray(time_digits, dtype=np.int64)
+
+    year = date_digits // 10000
+    month = date_digits // 100 % 100
+    day = date_digits % 100
+
+    is_ms = time_digits >= 1_000_000
+    if time_has_ms:
+        is_ms = np.ones(len(time_digits), dtype=bool)
+    hhmmss = np.where(is_ms, time_digits // 1000, time_digits)
+    millis = np.where(is_ms, time_digits % 1000, 0)
+    hour = hhmmss // 10000
+    minute = hhmmss // 100 % 100
+    second = hhmmss % 100
+
+    days = days_from_civil(year, month, day)
+    month_days = days_from_civil(year + (month == 12), np.where(month == 12, 1, month + 1), 1) - \
+        days_from_civil(year, month, 1)
+
+    valid = (
+        (date_digits >= 0) & (time_digits >= 0) & (time_digits < 1_000_000_000) &
+        (month >= 1) & (month <= 12) & (day >= 1) & (day <= month_days) &
+        (hour < 24) & (minute < 60) & (second < 60)
+    )
+
+    seconds = hour * 3600 + minute * 60 + second
+    ns = days * NS_PER_DAY + seconds * NS_PER_SECOND + millis * 1_000_000
+    return np.where(valid, ns, 0), valid
+
+
+def ns_to_date_time_digits(ns):
+    """
+    Обратное к parse_date_time_ns: наносекунды от эпохи -> (дата YYYYMMDD, время HHMMSSmmm) целыми числами
+
+    :param ns: массив int64 наносекунд
+    :return: (массив int64 дат, массив int64 времени)
+    """
+    ns = np.asarray(ns, dtype=np.int64)
+    days = np.floor_divide(ns, NS_PER_DAY)
+    year, month, day = civil_from_days(days)
+    millis = (ns - days * NS_PER_DAY) // 1_000_000
+    seconds = millis // 1000
+    hhmmss = seconds // 3600 * 10000 + seconds // 60 % 60 * 100 + seconds % 60
+    return year * 10000 + month * 100 + day, hhmmss * 1000 + millis % 1000
@@ -1,12 +1,211 @@
 import zipfile
+import hashlib
 import re
 import os
+import posixpath
 import shutil
 import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import metrics
+
+
+# Тикер - все что до первой цифры в имени файла
+TICKER_PATTERN = re.compile(r'^([^\d]+)(?=\d)')
+# Размер буфера при потоковом копировании файлов из архива
+COPY_BUFFER_SIZE = 16 * 1024 * 1024
+
+
+def _classify_member(member_name, tickers_set):
+    """
+    Определяет тикер и сессию CSV-файла по его пути внутри архива
+
+    :return: (тикер, 'DAY'/'NIGHT') или None, если файл не нужен
+    """
+    if not member_name.endswith('.csv'):
+        return None
+    member_dir, filename = posixpath.split(member_name.replace('\\', '/'))
+    match = TICKER_PATTERN.match(filename)
+    if not match:
+        return None
+    ticker = match.group(1).strip()
+    if ticker not in tickers_set:
+        return None
+    data_type = 'NIGHT' if 'NIGHT' in member_dir.upper() else 'DAY'
+    return ticker, data_type
+
+
+def _organize_archive_stream(archive_path, output_directory, tickers_set, renames=None):
+    """
+    Копирует нужные CSV из архива сразу в папки тикеров, без временной распаковки.
+    Тикер и сессия определяются по центральному каталогу архива.
+
+    :param renames: путь в архиве -> имя файла в папке тикера или None - не копировать (см. _plan_duplicates)
+    :return: пути скопированных файлов
+    """
+    renames = renames or {}
+    written = []
+    with metrics.measure('organize', os.path.basename(archive_path),
+                         bytes_read=os.path.getsize(archive_path)) as event, \
+            zipfile.ZipFile(archive_path, 'r') as zip_ref:
+        for info in zip_ref.infolist():
+            if info.is_dir():
+                continue
+            classified = _classify_member(info.filename, tickers_set)
+            if classified is None:
+                continue
+            dest_name = renames.get(info.filename, os.path.basename(info.filename))
+            if dest_name is None:
+                continue
+            ticker, data_type = classified
+            dest_dir = os.path.join(output_directory, ticker, data_type)
+            os.makedirs(dest_dir, exist_ok=True)
+
+            dest_path = os.path.join(dest_dir, dest_name)
+            # Пишем во временный файл и атомарно подменяем: одноименные файлы
+            # из разных архивов (в т.ч. из параллельных процессов) не перемешиваются
+            temp_path = f"{dest_path}.{os.getpid()}.part"
+            try:
+                with zip_ref.open(info) as src, open(temp_path, 'wb') as dst:
+                    shutil.copyfileobj(src, dst, COPY_BUFFER_SIZE)
+                os.replace(temp_path, dest_path)
+            finally:
+                if os.path.exists(temp_path):
+                    os.remove(temp_path)
+            written.append(dest_path)
+            event['bytes_written'] = event.get('bytes_written', 0) + info.file_size
+        event['files'] = len(written)
+    return written
+
+
+def _organize_outputs(output_directory, written):
+    """Выходы организации архива для манифеста: папки тикеров и скопированные файлы"""
+    ticker_dirs = {os.path.dirname(os.path.dirname(path)) for path in written}
+    return sorted(ticker_dirs) + list(written)
+
+
+def _archive_tickers(archive_path, tickers_set, catalog=None):
+    """Нужные тикеры, файлы которых есть в архиве (по каталогу или центральному каталогу zip)"""
+    if catalog is not None:
+        return catalog.archive_tickers(archive_path) & tickers_set
+    tickers = set()
+    with zipfile.ZipFile(archive_path, 'r') as zip_ref:
+        for name in zip_ref.namelist():
+            classified = _classify_member(name, tickers_set)
+            if classified is not None:
+                tickers.add(classified[0])
+    return tickers
+
+
+def _plan_duplicates(archive_list, tickers_set):
+    """
+    Одноименные CSV одного тикера и сессии в разных архивах (по центральным каталогам, архивы по порядку имен).
+    Файл, совпадающий с уже встреченным (размер и CRC), не копируется; отличающийся сохраняется
+    с суффиксом из имени архива. Первый архив оставляет имя файла как есть, поэтому результат
+    не зависит от порядка, в котором процессы закончат архивы.
+
+    :return: (архив -> {путь в архиве: имя файла или None}, пропущено одинаковых, сохранено с суффиксом)
+    """
+    seen = {}  # (тикер, сессия, имя) -> отпечатки (размер, CRC) встреченных вариантов
+    used = set()  # (тикер, сессия, имя) уже занятых имен
+    plan = {}
+    skipped = renamed = 0
+    for root, file in sorted(archive_list):
+        archive_path = os.path.join(root, file)
+        try:
+            with zipfile.ZipFile(archive_path, 'r') as zip_ref:
+                infos = zip_ref.infolist()
+        except Exception:
+            continue  # ошибка архива покажется при организации
+        for info in infos:
+            if info.is_dir():
+                continue
+            classified = _classify_member(info.filename, tickers_set)
+            if classified is None:
+                continue
+            name = os.path.basename(info.filename)
+            variants = seen.setdefault(classified + (name,), [])
+            signature = (info.file_size, info.CRC)
+            if not variants:
+                variants.append(signature)
+                used.add(classified + (name,))
+                continue
+            if signature in variants:
+                plan.setdefault(archive_path, {})[info.filename] = None
+                skipped += 1
+                continue
+            variants.append(signature)
+            stem, ext = os.path.splitext(name)
+            new_name = f"{stem}_{os.path.splitext(file)[0]}{ext}"
+            k = 2
+            while classified + (new_name,) in used:
+                new_name = f"{stem}_{os.path.splitext(file)[0]}_{k}{ext}"
+                k += 1
+            used.add(classified + (new_name,))
+            plan.setdefault(archive_path, {})[info.filename] = new_name
+            renamed += 1
+    return plan, skipped, renamed
+
+
+def _print_duplicates(skipped, renamed):
+    if skipped or renamed:
+        print(f"🔁 Одноименные файлы в разных архивах: одинаковых пропущено {skipped}, "
+              f"разных сохранено с суффиксом архива {renamed}")
+
+
+def _prepare_ticker_dirs(output_directory, tickers_list):
+    """Создает папки DAY/NIGHT для каждого тикера"""
+    print("📁 Создание структуры папок...")
+    for ticker in tickers_list:
+        os.makedirs(os.path.join(output_directory, ticker, 'DAY'), exist_ok=True)
+        os.makedirs(os.path.join(output_directory, ticker, 'NIGHT'), exist_ok=True)
+    print(f"✅ Создано папок для {len(tickers_list)} тикеров")
+
+
+def _collect_archives(root_directory, tickers_list=None, catalog=None):
+    """
+    Собирает все zip-архивы для обработки: список (папка, имя файла)
+
+    Если передан каталог, пропускаются архивы без файлов нужных тикеров. Архивы, которых нет
+    в каталоге (не удалось прочитать), не пропускаются: их ошибка покажется и посчитается при организации.
+    """
+    wanted = known = None
+    if catalog is not None:
+        catalog.update(root_directory)
+        wanted = catalog.archives_for_tickers(tickers_list)
+        known = catalog.archives()
+
+    archive_list = []
+    for root, dirs, files in os.walk(root_directory):
+        for file in files:
+            if file.endswith('.zip'):
+                archive_path = os.path.abspath(os.path.join(root, file))
+                if wanted is not None and archive_path not in wanted and archive_path in known:
+                    continue
+                archive_list.append((root, file))
+    return archive_list
+
+
+def find_all_tickers(root_directory, catalog=None):
+    """
+    Находит все тикеры из имен CSV файлов в архивах
+
+    :param catalog: ArchiveCatalog - если указан, тикеры берутся из каталога,
+                    который перечитывает только новые и измененные архивы
+    """
+    with metrics.measure('find_tickers', root_directory) as event:
+        if catalog is not None:
+            print("🔍 Поиск тикеров по каталогу архивов...")
+            catalog.update(root_directory)
+            tickers = catalog.tickers()
+        else:
+            tickers = _scan_tickers(root_directory)
+        event['tickers'] = len(tickers)
+        return tickers
 
 
-def find_all_tickers(root_directory):
-    """Находит все тикеры из имен CSV файлов в архивах"""
+def _scan_tickers(root_directory):
+    """Тикеры по именам CSV во всех zip-архивах папки (полный проход)"""
     pattern = r'^([^\d]+)(?=\d)'  # Все что до первой цифры в имени файла
     all_tickers = set()
     archive_count = 0
@@ -19,6 +218,7 @@ def find_all_tickers(root_directory):
         for file in files:
             if file.endswith('.zip'):
                 archive_count += 1
+                metrics.add(archives=1)
                 try:
                     with zipfile.ZipFile(os.path.join(root, file), 'r') as zip_ref:
                         for zip_file in zip_ref.namelist():
@@ -42,24 +242,59 @@ def find_all_tickers(root_directory):
     return sorted(list(all_tickers))
 
 
-def extract_and_organize_sequential(root_directory, output_directory, tickers_list):
-    """Разархивирует и организует файлы по тикерам последовательно"""
+def _skip_unchanged(archive_list, tickers_list, manifest, catalog=None):
+    """
+    Убирает архивы, уже обработанные и не изменившиеся с тех пор.
+    В отпечаток входят только нужные тикеры самого архива: новый тикер в других архивах
+    не заставляет заново организовывать этот.
+
+    :return: (оставшиеся архивы, отпечатки архивов для записи в манифест)
+    """
+    if manifest is None:
+        return archive_list, {}
+
+    tickers_set = set(tickers_list)
+    pending = []
+    fingerprints = {}
+    for root, file in archive_list:
+        archive_path = os.path.join(root, file)
+        try:
+            archive_tickers = ','.join(sorted(_archive_tickers(archive_path, tickers_set, catalog)))
+            tickers_key = hashlib.sha1(archive_tickers.encode('utf-8')).hexdigest()
+        except Exception:
+            tickers_key = None  # архив не читается - ошибка покажется при организации
+        fp = manifest.fingerprint(archive_path, tickers=tickers_key)
+        if manifest.is_current('organize', archive_path, fp):
+            continue
+        pending.append((root, file))
+        fingerprints[archive_path] = fp
+
+    skipped = len(archive_list) - len(pending)
+    if skipped:
+        print(f"⏭️  Пропущено архивов без изменений: {skipped}")
+    return pending, fingerprints
+
+
+def extract_and_organize_sequential(root_directory, output_directory, tickers_list, stream=True, catalog=None,
+                                    manifest=None):
+    """
+    Разархивирует и организует файлы по тикерам последовательно
+
+    :param stream: если True, нужные CSV копируются из архива напрямую в папки тикеров
+                   (без распаковки всего архива во временную папку)
+    :param catalog: ArchiveCatalog - если указан, архивы без нужных тикеров не открываются
+    :param manifest: RunManifest - если указан, уже обработанные неизменившиеся архивы пропускаются
+    """
     print("\n📦 Начинаем обработку архивов...")
     start_time = time.time()
 
     # Создаем директории для тикеров
-    print("📁 Создание структуры папок...")
-    for ticker in tickers_list:
-        os.makedirs(os.path.join(output_directory, ticker, 'DAY'), exist_ok=True)
-        os.makedirs(os.path.join(output_directory, ticker, 'NIGHT'), exist_ok=True)
-    print(f"✅ Создано папок для {len(tickers_list)} тикеров")
+    _prepare_ticker_dirs(output_directory, tickers_list)
 
     # Собираем все архивы для обработки
-    archive_list = []
-    for root, dirs, files in os.walk(root_directory):
-        for file in files:
-            if file.endswith('.zip'):
-                archive_list.append((root, file))
+    archive_list = _collect_archives(root_directory, tickers_list, catalog)
+    duplicates, skipped_duplicates, renamed_duplicates = _plan_duplicates(archive_list, set(tickers_list))
+    archive_list, fingerprints = _skip_unchanged(archive_list, tickers_list, manifest, catalog)
 
     print(f"📦 Найдено архивов для обработки: {len(archive_list)}")
 
@@ -67,12 +302,33 @@ def extract_and_organize_sequential(root_directory, output_directory, tickers_li
     total_processed_files = 0
     successful_archives = 0
     failed_archives = 0
+    tickers_set = set(tickers_list)
 
     for i, (root, file) in enumerate(archive_list, 1):
+        archive_path = os.path.join(root, file)
         print(f"🔹 Обрабатываем архив {i}/{len(archive_list)}: {file}")
 
+        if stream:
+            try:
+                written = _organize_archive_stream(archive_path, output_directory, tickers_set,
+                                                   duplicates.get(archive_path))
+                archive_processed = len(written)
+                total_processed_files += archive_processed
+                successful_archives += 1
+                if manifest is not None:
+                    manifest.mark_done('organize', archive_path, fingerprints[archive_path],
+                                       outputs=_organize_outputs(output_directory, written))
+                print(f"✅ Обработано: {file} (файлов: {archive_processed})")
+
+                if i % 10 == 0 or i == len(archive_list):
+                    print(f"📊 Прогресс: {i}/{len(archive_list)} архивов | Файлов: {total_processed_files}")
+            except Exception as e:
+                failed_archives += 1
+                print(f"⚠️  Ошибка в архиве {file}: {e}")
+            continue
+
         try:
-            with zipfile.ZipFile(os.path.join(root, file), 'r') as zip_ref:
+            with zipfile.ZipFile(archive_path, 'r') as zip_ref:
                 # Создаем временную директорию с уникальным именем
                 temp_dir = os.path.join(root, f'temp_extract_{i}')
                 if os.path.exists(temp_dir):
@@ -80,7 +336,8 @@ def extract_and_organize_sequential(root_directory, output_directory, tickers_li
 
                 zip_ref.extractall(temp_dir)
 
-                archive_processed = 0
+                written = []
+                renames = duplicates.get(archive_path, {})
                 for extract_root, _, extract_files in os.walk(temp_dir):
                     for csv_file in extract_files:
                         if csv_file.endswith('.csv'):
@@ -97,15 +354,23 @@ def extract_and_organize_sequential(root_directory, output_directory, tickers_li
                                     dest_dir = os.path.join(output_directory, file_ticker, data_type)
                                     os.makedirs(dest_dir, exist_ok=True)
 
-                                    # Копируем файл
-                                    shutil.copy2(csv_path, os.path.join(dest_dir, csv_file))
-                                    archive_processed += 1
+                                    # Копируем файл (одноименные из других архивов - см. _plan_duplicates)
+                                    member = os.path.relpath(csv_path, temp_dir).replace(os.sep, '/')
+                                    dest_name = renames.get(member, csv_file)
+                                    if dest_name is None:
+                                        continue
+                                    shutil.copy2(csv_path, os.path.join(dest_dir, dest_name))
+                                    written.append(os.path.join(dest_dir, dest_name))
                                     total_processed_files += 1
 
                 # Очищаем временную директорию
                 shutil.rmtree(temp_dir)
 
+                archive_processed = len(written)
                 successful_archives += 1
+                if manifest is not None:
+                    manifest.mark_done('organize', archive_path, fingerprints[archive_path],
+                                       outputs=_organize_outputs(output_directory, written))
                 print(f"✅ Обработано: {file} (файлов: {archive_processed})")
 
                 # Выводим прогресс каждые 10 архивов
@@ -125,10 +390,74 @@ def extract_and_organize_sequential(root_directory, output_directory, tickers_li
                     pass
 
     end_time = time.time()
-    print(f"\n🎉 Обработка завершена!")
+    print("\n🎉 Обработка завершена!")
+    print(f"📦 Успешных архивов: {successful_archives}")
+    print(f"❌ Неудачных архивов: {failed_archives}")
+    print(f"📄 Всего обработано CSV файлов: {total_processed_files}")
+    _print_duplicates(skipped_duplicates, renamed_duplicates)
+    print(f"⏱️  Общее время выполнения: {end_time - start_time:.2f} секунд")
+
+    return total_processed_files
+
+
+def extract_and_organize_parallel(root_directory, output_directory, tickers_list, jobs=None, catalog=None,
+                                  manifest=None):
+    """
+    Организует файлы по тикерам, распределяя архивы по процессам
+
+    :param jobs: количество процессов (по умолчанию - число ядер)
+    :param catalog: ArchiveCatalog - если указан, архивы без нужных тикеров не открываются
+    :param manifest: RunManifest - если указан, уже обработанные неизменившиеся архивы пропускаются
+    """
+    print("\n📦 Начинаем параллельную обработку архивов...")
+    start_time = time.time()
+
+    _prepare_ticker_dirs(output_directory, tickers_list)
+    archive_list = _collect_archives(root_directory, tickers_list, catalog)
+    duplicates, skipped_duplicates, renamed_duplicates = _plan_duplicates(archive_list, set(tickers_list))
+    archive_list, fingerprints = _skip_unchanged(archive_list, tickers_list, manifest, catalog)
+    jobs = jobs or os.cpu_count() or 1
+
+    print(f"📦 Найдено архивов для обработки: {len(archive_list)}")
+    print(f"⚙️  Процессов: {jobs}")
+
+    total_processed_files = 0
+    successful_archives = 0
+    failed_archives = 0
+    tickers_set = set(tickers_list)
+
+    with ProcessPoolExecutor(max_workers=jobs) as executor:
+        futures = {
+            executor.submit(_organize_archive_stream, os.path.join(root, file), output_directory, tickers_set,
+                            duplicates.get(os.path.join(root, file))):
+                os.path.join(root, file)
+            for root, file in archive_list
+        }
+        for i, future in enumerate(as_completed(futures), 1):
+            archive_path = futures[future]
+            file = os.path.basename(archive_path)
+            try:
+                written = future.result()
+                archive_processed = len(written)
+                total_processed_files += archive_processed
+                successful_archives += 1
+                if manifest is not None:
+                    manifest.mark_done('organize', archive_path, fingerprints[archive_path],
+                                       outputs=_organize_outputs(output_directory, written))
+                print(f"✅ Обработано: {file} (файлов: {archive_processed})")
+            except Exception as e:
+                failed_archives += 1
+                print(f"⚠️  Ошибка в архиве {file}: {e}")
+
+            if i % 10 == 0 or i == len(archive_list):
+                print(f"📊 Прогресс: {i}/{len(archive_list)} архивов | Файлов: {total_processed_files}")
+
+    end_time = time.time()
+    print("\n🎉 Обработка завершена!")
     print(f"📦 Успешных архивов: {successful_archives}")
     print(f"❌ Неудачных архивов: {failed_archives}")
     print(f"📄 Всего обработано CSV файлов: {total_processed_files}")
+    _print_duplicates(skipped_duplicates, renamed_duplicates)
     print(f"⏱️  Общее время выполнения: {end_time - start_time:.2f} секунд")
 
     return total_processed_files